@@ -0,0 +1,126 @@
+"""
+串流匯出
+- 將模型的字典產生器轉為 NDJSON 或 CSV 位元組區塊
+- 可選擇以 gzip 串流壓縮
+- 逐批輸出,記憶體用量不受資料量影響
+"""
+import csv
+import io
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Sequence
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 累積到此大小 (位元組) 才輸出一個區塊,避免每列一次寫入
+CHUNK_SIZE = 64 * 1024
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+MESSAGE_COLUMNS = (
+    'id', 'message_id', 'user_id', 'platform', 'content',
+    'message_type', 'group_id', 'created_at', 'metadata',
+)
+USER_COLUMNS = (
+    'user_id', 'platform', 'display_name', 'created_at',
+    'updated_at', 'is_active', 'metadata',
+)
+
+
+def _chunked(pieces: Iterable[str]) -> Iterator[bytes]:
+    """將字串片段累積為約 CHUNK_SIZE 的 UTF-8 區塊"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def ndjson_lines(records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """每筆資料一行 JSON"""
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def csv_lines(records: Iterable[Dict[str, Any]], columns: Sequence[str]) -> Iterator[str]:
+    """
+    CSV 標題列與資料列 (巢狀欄位以 JSON 字串輸出)
+
+    Args:
+        records: 字典產生器
+        columns: 欄位順序
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def render(row) -> str:
+        writer.writerow(row)
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    # UTF-8 BOM: 讓試算表軟體正確辨識中文
+    yield '\ufeff' + render(columns)
+    for record in records:
+        yield render([
+            json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+            for value in (record.get(column) for column in columns)
+        ])
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    以 gzip 串流壓縮位元組區塊
+
+    Args:
+        chunks: 原始區塊
+        level: 壓縮等級 (1-9)
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_export(
+    records: Iterator[Dict[str, Any]],
+    fmt: str,
+    columns: Sequence[str],
+    compress: bool = False
+) -> Iterator[bytes]:
+    """
+    將字典產生器轉為匯出檔案的位元組串流
+
+    中途結束 (例如用戶端中斷下載) 時會關閉來源產生器,立即釋放資料庫連接。
+
+    Args:
+        records: 模型的 iter_dicts() 產生器
+        fmt: 'ndjson' 或 'csv'
+        columns: CSV 欄位順序
+        compress: 是否以 gzip 壓縮
+
+    Yields:
+        位元組區塊
+    """
+    try:
+        lines = csv_lines(records, columns) if fmt == 'csv' else ndjson_lines(records)
+        chunks = _chunked(lines)
+        yield from gzip_chunks(chunks) if compress else chunks
+    except Exception:
+        # 回應標頭已送出,只能記錄錯誤並中斷串流
+        logger.exception("匯出串流中斷")
+        raise
+    finally:
+        records.close()
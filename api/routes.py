@@ -2,17 +2,34 @@
 REST API 路由
 提供系統資訊、統計、管理功能的 API 端點
 """
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from datetime import datetime, timedelta
+import functools
+import gzip
+import io
 import psutil
 import os
-from models.database import Database
+from models.database import Database, QueryTimeoutError
 from models.user import User
 from models.message import Message
-from models.quota import Quota, SystemQuota
+from models.quota import Quota
+from models.write_buffer import get_write_buffer
+from models.archive import get_archive
+from models.stats import Stats
+from models.backup import get_backup_manager
+from models.vacuum import get_vacuum_scheduler
+from models.retention import get_retention_engine
+from models.compression import get_recompressor
+from models.recent import get_recent_buffer
+from models.known_users import get_known_users
+from models.quota_engine import get_quota_engine
+from models.importer import PARSERS, import_messages
+from models.storage import get_storage, SQLiteStorage
+from api.export import FORMATS, MESSAGE_COLUMNS, USER_COLUMNS, stream_export
 from core.discord_bot import DiscordBotManager
 from core.ai_engine import AIEngine
 from utils.logger import get_logger
+from utils.rate_limiter import get_ai_limiter
 
 logger = get_logger(__name__)
 
@@ -31,6 +48,14 @@ def create_api_blueprint(db: Database, discord_manager: DiscordBotManager, ai_en
     """
     api = Blueprint('api', __name__)
 
+    def read_only(view):
+        """以唯讀連接執行端點內的查詢,不佔用訊息寫入的連接"""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with db.read_only():
+                return view(*args, **kwargs)
+        return wrapper
+
     # ==================== 健康檢查 ====================
 
     @api.route('/health', methods=['GET'])
@@ -82,7 +107,7 @@ def create_api_blueprint(db: Database, discord_manager: DiscordBotManager, ai_en
             stats = db.get_stats()
 
             # 配額資訊
-            quota_info = SystemQuota.get_all()
+            quota_info = AIEngine.get_system_quotas()
 
             # 生成 Prometheus 格式
             metrics_output = []
@@ -109,6 +134,31 @@ def create_api_blueprint(db: Database, discord_manager: DiscordBotManager, ai_en
             metrics_output.append(f"# TYPE total_messages counter")
             metrics_output.append(f"total_messages {stats['total_messages']}")
 
+            # 資料庫空間指標
+            metrics_output.append(f"# HELP db_freelist_pages 資料庫空閒頁面數")
+            metrics_output.append(f"# TYPE db_freelist_pages gauge")
+            metrics_output.append(f"db_freelist_pages {stats['space']['freelist_count']}")
+
+            metrics_output.append(f"# HELP db_free_percent 資料庫空閒頁面比例")
+            metrics_output.append(f"# TYPE db_free_percent gauge")
+            metrics_output.append(f"db_free_percent {stats['space']['free_percent']}")
+
+            # 寫入緩衝指標
+            write_buffer = get_write_buffer()
+            if write_buffer is not None:
+                buffer_stats = write_buffer.get_stats()
+                metrics_output.append(f"# HELP db_write_buffer_queue_depth 寫入緩衝待提交筆數")
+                metrics_output.append(f"# TYPE db_write_buffer_queue_depth gauge")
+                metrics_output.append(f"db_write_buffer_queue_depth {buffer_stats['queue_depth']}")
+
+                metrics_output.append(f"# HELP db_write_buffer_flush_ms 最近一次批次提交耗時 (毫秒)")
+                metrics_output.append(f"# TYPE db_write_buffer_flush_ms gauge")
+                metrics_output.append(f"db_write_buffer_flush_ms {buffer_stats['last_flush_ms']}")
+
+                metrics_output.append(f"# HELP db_write_buffer_rows_flushed 已批次提交筆數")
+                metrics_output.append(f"# TYPE db_write_buffer_rows_flushed counter")
+                metrics_output.append(f"db_write_buffer_rows_flushed {buffer_stats['rows_flushed']}")
+
             # 配額指標
             for quota in quota_info:
                 quota_type = quota['quota_type']
@@ -129,10 +179,38 @@ def create_api_blueprint(db: Database, discord_manager: DiscordBotManager, ai_en
     # ==================== 統計資訊 ====================
 
     @api.route('/stats', methods=['GET'])
+    @read_only
     def get_stats():
         """獲取統計資訊"""
         try:
             stats = db.get_stats()
+            write_buffer = get_write_buffer()
+            if write_buffer is not None:
+                stats['write_buffer'] = write_buffer.get_stats()
+            archive = get_archive()
+            if archive is not None:
+                stats['archive'] = archive.get_stats()
+            vacuum_scheduler = get_vacuum_scheduler()
+            if vacuum_scheduler is not None:
+                stats['vacuum'] = vacuum_scheduler.get_stats()
+            retention_engine = get_retention_engine()
+            if retention_engine is not None:
+                stats['retention'] = retention_engine.get_stats()
+            recompressor = get_recompressor()
+            if recompressor is not None:
+                stats['compression'] = recompressor.get_stats()
+            recent_buffer = get_recent_buffer()
+            if recent_buffer is not None:
+                stats['recent_messages'] = recent_buffer.get_stats()
+            known_users = get_known_users()
+            if known_users is not None:
+                stats['known_users'] = known_users.get_stats()
+            quota_engine = get_quota_engine()
+            if quota_engine is not None:
+                stats['quota_engine'] = quota_engine.get_stats()
+            ai_limiter = get_ai_limiter()
+            if ai_limiter is not None:
+                stats['ai_limiter'] = ai_limiter.get_stats()
 
             # 平台統計
             line_users = User.count(platform='line')
@@ -141,15 +219,10 @@ def create_api_blueprint(db: Database, discord_manager: DiscordBotManager, ai_en
             discord_messages = Message.count_by_platform('discord')
 
             # 今日統計
-            with db.get_cursor() as cursor:
-                cursor.execute("""
-                    SELECT COUNT(*) FROM messages
-                    WHERE date(created_at) = date('now')
-                """)
-                today_messages = cursor.fetchone()[0]
+            today_messages = Stats.count_messages_since(datetime.now())
 
             # 配額資訊
-            quotas = SystemQuota.get_all()
+            quotas = AIEngine.get_system_quotas()
 
             return jsonify({
                 'database': stats,
@@ -170,52 +243,68 @@ def create_api_blueprint(db: Database, discord_manager: DiscordBotManager, ai_en
                 'timestamp': datetime.now().isoformat()
             })
 
+        except QueryTimeoutError as e:
+            logger.warning(f"獲取統計資訊逾時: {e}")
+            return jsonify({'error': str(e)}), 504
         except Exception as e:
             logger.exception("獲取統計資訊時發生錯誤")
             return jsonify({'error': str(e)}), 500
 
     @api.route('/stats/chart', methods=['GET'])
+    @read_only
     def get_chart_data():
-        """獲取圖表數據"""
+        """獲取圖表數據 (讀取統計彙總表)"""
         try:
-            days = int(request.args.get('days', 7))
-
-            with db.get_cursor() as cursor:
-                # 每日訊息統計
-                cursor.execute("""
-                    SELECT date(created_at) as date, COUNT(*) as count
-                    FROM messages
-                    WHERE created_at >= datetime('now', '-' || ? || ' days')
-                    GROUP BY date(created_at)
-                    ORDER BY date
-                """, (days,))
-                daily_messages = [{'date': row[0], 'count': row[1]} for row in cursor.fetchall()]
-
-                # 平台分布
-                cursor.execute("""
-                    SELECT platform, COUNT(*) as count
-                    FROM messages
-                    WHERE created_at >= datetime('now', '-' || ? || ' days')
-                    GROUP BY platform
-                """, (days,))
-                platform_distribution = [{'platform': row[0], 'count': row[1]} for row in cursor.fetchall()]
-
-                # 每小時訊息統計 (最近24小時)
-                cursor.execute("""
-                    SELECT strftime('%H', created_at) as hour, COUNT(*) as count
-                    FROM messages
-                    WHERE created_at >= datetime('now', '-1 day')
-                    GROUP BY hour
-                    ORDER BY hour
-                """)
-                hourly_messages = [{'hour': row[0], 'count': row[1]} for row in cursor.fetchall()]
+            now = datetime.now()
+            try:
+                days = int(request.args.get('days', 7))
+                start = request.args.get('start')
+                end = request.args.get('end')
+                start = datetime.fromisoformat(start) if start else now - timedelta(days=days)
+                end = datetime.fromisoformat(end) if end else now
+            except ValueError:
+                return jsonify({'error': 'Invalid days/start/end, expected ISO 8601'}), 400
+
+            granularity = request.args.get('granularity', 'day')
+            if granularity not in Stats.GRANULARITIES:
+                return jsonify({'error': f'Invalid granularity: {granularity}'}), 400
+
+            series = Stats.message_series(
+                start,
+                end,
+                granularity,
+                platform=request.args.get('platform'),
+                group_id=request.args.get('group_id')
+            )
+
+            # 每日訊息統計
+            daily_messages = [
+                {'date': point['bucket'], 'count': point['count']}
+                for point in Stats.message_series(now - timedelta(days=days), now, 'day')
+            ]
+
+            # 平台分布
+            platform_distribution = Stats.platform_distribution(start, end + timedelta(days=1))
+
+            # 每小時訊息統計 (最近24小時)
+            hourly_messages = [
+                {'hour': point['bucket'][11:13], 'count': point['count']}
+                for point in Stats.message_series(now - timedelta(hours=23), now, 'hour')
+            ]
 
             return jsonify({
+                'series': series,
+                'granularity': granularity,
+                'start': start.isoformat(),
+                'end': end.isoformat(),
                 'daily_messages': daily_messages,
                 'platform_distribution': platform_distribution,
                 'hourly_messages': hourly_messages
             })
 
+        except QueryTimeoutError as e:
+            logger.warning(f"獲取圖表數據逾時: {e}")
+            return jsonify({'error': str(e)}), 504
         except Exception as e:
             logger.exception("獲取圖表數據時發生錯誤")
             return jsonify({'error': str(e)}), 500
@@ -223,28 +312,33 @@ def create_api_blueprint(db: Database, discord_manager: DiscordBotManager, ai_en
     # ==================== 使用者管理 ====================
 
     @api.route('/users', methods=['GET'])
+    @read_only
     def get_users():
         """獲取使用者列表"""
         try:
             platform = request.args.get('platform')
-            limit = int(request.args.get('limit', 50))
-            offset = int(request.args.get('offset', 0))
+            limit = min(int(request.args.get('limit', 50)), 500)
+            cursor = request.args.get('cursor')
 
-            if platform:
-                users = User.get_all(platform=platform)
-            else:
-                users = User.get_all()
-
-            # 分頁
-            paginated_users = users[offset:offset + limit]
+            try:
+                users, next_cursor = User.paginate(limit=limit, cursor=cursor, platform=platform)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            response = {
+                'users': [user.to_dict() for user in users],
+                'next_cursor': next_cursor,
+                'limit': limit
+            }
+            if request.args.get('with_total', '1') != '0':
+                # 由覆蓋索引計數,不需讀取使用者資料
+                response['total'] = User.count(platform=platform)
 
-            return jsonify({
-                'users': [user.to_dict() for user in paginated_users],
-                'total': len(users),
-                'limit': limit,
-                'offset': offset
-            })
+            return jsonify(response)
 
+        except QueryTimeoutError as e:
+            logger.warning(f"獲取使用者列表逾時: {e}")
+            return jsonify({'error': str(e)}), 504
         except Exception as e:
             logger.exception("獲取使用者列表時發生錯誤")
             return jsonify({'error': str(e)}), 500
@@ -278,27 +372,241 @@ def create_api_blueprint(db: Database, discord_manager: DiscordBotManager, ai_en
     # ==================== 訊息管理 ====================
 
     @api.route('/messages', methods=['GET'])
+    @read_only
     def get_messages():
         """獲取訊息列表"""
         try:
             limit = int(request.args.get('limit', 50))
             keyword = request.args.get('keyword')
             platform = request.args.get('platform')
+            include_archive = request.args.get('archive') == '1'
 
             if keyword:
-                messages = Message.search(keyword, platform, limit)
-            else:
-                messages = Message.get_recent_messages(limit)
+                try:
+                    since = request.args.get('since')
+                    until = request.args.get('until')
+                    since = datetime.fromisoformat(since) if since else None
+                    until = datetime.fromisoformat(until) if until else None
+                except ValueError:
+                    return jsonify({'error': 'Invalid since/until, expected ISO 8601'}), 400
+
+                results = Message.search_with_snippets(
+                    keyword,
+                    platform=platform,
+                    limit=limit,
+                    group_id=request.args.get('group_id'),
+                    since=since,
+                    until=until,
+                    order=request.args.get('order', 'rank'),
+                    include_archive=include_archive
+                )
+                return jsonify({
+                    'messages': results,
+                    'count': len(results)
+                })
 
-            return jsonify({
+            try:
+                messages, next_cursor = Message.paginate(
+                    limit=min(limit, 500),
+                    cursor=request.args.get('cursor'),
+                    user_id=request.args.get('user_id'),
+                    group_id=request.args.get('group_id'),
+                    platform=platform,
+                    include_archive=include_archive
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+            response = {
                 'messages': [msg.to_dict() for msg in messages],
-                'count': len(messages)
-            })
+                'count': len(messages),
+                'next_cursor': next_cursor
+            }
+            if request.args.get('with_total') == '1':
+                response['total_approx'] = Message.estimate_total()
 
+            return jsonify(response)
+
+        except QueryTimeoutError as e:
+            logger.warning(f"獲取訊息列表逾時: {e}")
+            return jsonify({'error': str(e)}), 504
         except Exception as e:
             logger.exception("獲取訊息列表時發生錯誤")
             return jsonify({'error': str(e)}), 500
 
+    # ==================== 匯出 ====================
+
+    def parse_export_args():
+        """
+        解析匯出端點的共用參數
+
+        Returns:
+            (格式, 起始時間, 結束時間, 是否 gzip)
+
+        Raises:
+            ValueError: 參數格式錯誤
+        """
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in FORMATS:
+            raise ValueError(f"Invalid format, expected one of: {', '.join(FORMATS)}")
+        try:
+            since = request.args.get('since')
+            until = request.args.get('until')
+            since = datetime.fromisoformat(since) if since else None
+            until = datetime.fromisoformat(until) if until else None
+        except ValueError:
+            raise ValueError('Invalid since/until, expected ISO 8601')
+        return fmt, since, until, request.args.get('gzip') == '1'
+
+    def export_response(records, name: str, fmt: str, columns, compress: bool) -> Response:
+        """建立串流下載回應 (資料在傳送時才逐批讀取)"""
+        filename = f"{name}-{datetime.now():%Y%m%d-%H%M%S}.{fmt}"
+        mimetype = FORMATS[fmt]
+        if compress:
+            filename += '.gz'
+            mimetype = 'application/gzip'
+        return Response(
+            stream_export(records, fmt, columns, compress),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+
+    @api.route('/export/messages', methods=['GET'])
+    def export_messages():
+        """串流匯出訊息 (NDJSON / CSV,可選 gzip)"""
+        try:
+            fmt, since, until, compress = parse_export_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        records = Message.iter_dicts(
+            platform=request.args.get('platform'),
+            group_id=request.args.get('group_id'),
+            since=since,
+            until=until
+        )
+        return export_response(records, 'messages', fmt, MESSAGE_COLUMNS, compress)
+
+    @api.route('/export/users', methods=['GET'])
+    def export_users():
+        """串流匯出使用者 (NDJSON / CSV,可選 gzip)"""
+        try:
+            fmt, since, until, compress = parse_export_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        records = User.iter_dicts(
+            platform=request.args.get('platform'),
+            is_active=request.args.get('active', '1') != '0',
+            since=since,
+            until=until
+        )
+        return export_response(records, 'users', fmt, USER_COLUMNS, compress)
+
+    # ==================== 匯入 ====================
+
+    @api.route('/import/messages', methods=['POST'])
+    def import_messages_endpoint():
+        """
+        串流匯入訊息 (請求本體為 LINE 聊天記錄或 NDJSON,可為 gzip)
+
+        預設每批一個交易,不長時間阻擋 Bot 的寫入;defer=1 時暫停索引與觸發器,
+        整個匯入為單一交易 (大量匯入較快,但期間其他寫入會等待)。
+        """
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in PARSERS:
+            return jsonify({'error': f"Invalid format, expected one of: {', '.join(sorted(PARSERS))}"}), 400
+        if fmt == 'line' and not request.args.get('group_id'):
+            return jsonify({'error': 'group_id is required for LINE exports'}), 400
+        if not isinstance(get_storage(), SQLiteStorage):
+            return jsonify({'error': 'Import requires the sqlite storage backend'}), 503
+
+        try:
+            batch_size = int(request.args.get('batch_size', 5000))
+        except ValueError:
+            return jsonify({'error': 'Invalid batch_size'}), 400
+
+        body = request.stream
+        if request.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=body)
+
+        try:
+            stats = import_messages(
+                fmt,
+                io.TextIOWrapper(body, encoding='utf-8-sig'),
+                db=db,
+                group_id=request.args.get('group_id'),
+                platform=request.args.get('platform', 'line'),
+                batch_size=batch_size,
+                defer_indexes=request.args.get('defer') == '1'
+            )
+        except (ValueError, UnicodeDecodeError, OSError) as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            logger.exception("匯入訊息時發生錯誤")
+            return jsonify({'error': str(e)}), 500
+
+        return jsonify({'import': stats})
+
+    @api.route('/import/discord', methods=['POST'])
+    def start_discord_backfill():
+        """在背景由檢查點回補 Discord 頻道歷史,立即返回"""
+        if not discord_manager.is_ready:
+            return jsonify({'error': 'Discord bot is not ready'}), 503
+
+        try:
+            channel_ids = [int(value) for value in request.args.get('channels', '').split(',') if value.strip()]
+            since_days = request.args.get('days')
+            since_days = int(since_days) if since_days else None
+        except ValueError:
+            return jsonify({'error': 'Invalid channels or days'}), 400
+
+        if not discord_manager.start_backfill(channel_ids=channel_ids or None, since_days=since_days):
+            return jsonify({'error': 'Backfill already running'}), 409
+        return jsonify({'status': 'started'}), 202
+
+    @api.route('/import/discord', methods=['GET'])
+    def get_discord_backfill():
+        """獲取最近一次 Discord 歷史回補的進度"""
+        job = discord_manager.backfill_job
+        return jsonify({
+            'running': discord_manager.is_backfilling,
+            'channels': job.get_stats() if job else {}
+        })
+
+    # ==================== 備份 ====================
+
+    @api.route('/backup', methods=['POST'])
+    def start_backup():
+        """在背景開始線上備份,立即返回工作 ID"""
+        manager = get_backup_manager()
+        if manager is None:
+            return jsonify({'error': 'Backup is not configured'}), 503
+
+        try:
+            job = manager.start()
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 409
+
+        return jsonify({'job': job.to_dict()}), 202
+
+    @api.route('/backup', methods=['GET'])
+    def list_backups():
+        """獲取最近的備份工作"""
+        manager = get_backup_manager()
+        if manager is None:
+            return jsonify({'error': 'Backup is not configured'}), 503
+        return jsonify({'jobs': [job.to_dict() for job in manager.get_jobs()]})
+
+    @api.route('/backup/<job_id>', methods=['GET'])
+    def get_backup(job_id):
+        """獲取備份工作進度"""
+        manager = get_backup_manager()
+        job = manager.get_job(job_id) if manager else None
+        if job is None:
+            return jsonify({'error': 'Backup job not found'}), 404
+        return jsonify({'job': job.to_dict()})
+
     # ==================== 系統資訊 ====================
 
     @api.route('/system', methods=['GET'])
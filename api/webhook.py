@@ -121,13 +121,18 @@ def create_webhook_blueprint(
                     from models.quota import SystemQuota
                     from models.queued_message import QueuedMessage
 
-                    if SystemQuota.can_use('line_monthly'):
+                    slot = SystemQuota.reserve('line_monthly')
+                    if slot is not None:
                         request_obj = PushMessageRequest(
                             to=user_id,
                             messages=[TextMessage(type='text', text=f"🤖 {response}")]
                         )
-                        line_bot_api.push_message(request_obj)
-                        SystemQuota.increment_usage('line_monthly')
+                        try:
+                            line_bot_api.push_message(request_obj)
+                        except Exception:
+                            slot.release()
+                            raise
+                        slot.commit()
                     else:
                         # 配額不足，將訊息存入佇列
                         print("Line quota exceeded. Queuing AI response.")
@@ -28,13 +28,15 @@ class LineBridge(commands.Cog):
             from models.quota import SystemQuota
             from models.queued_message import QueuedMessage
 
-            if SystemQuota.can_use('line_monthly'):
+            slot = await SystemQuota.areserve('line_monthly')
+            if slot is not None:
                 try:
                     self.line_bot_api.broadcast(
                         TextSendMessage(text=f"Discord - {message.author.name}: {message.content}")
                     )
-                    SystemQuota.increment_usage('line_monthly')
+                    await slot.acommit()
                 except Exception as e:
+                    await slot.arelease()
                     print(f"Error sending to LINE: {e}")
             else:
                 # 配額不足，將訊息存入佇列
@@ -44,7 +46,7 @@ class LineBridge(commands.Cog):
                     source_user_name=message.author.name,
                     content=message.content
                 )
-                queued_msg.save()
+                await queued_msg.asave()
 
 async def setup(bot):
     await bot.add_cog(LineBridge(bot)) 
\ No newline at end of file
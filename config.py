@@ -11,6 +11,11 @@ class BotConfig:
     # ============ Discord 設定 ============
     DISCORD_TOKEN: str = os.getenv('DISCORD_TOKEN', '')
     DISCORD_CHANNEL_ID: str = os.getenv('DISCORD_CHANNEL_ID', '')
+    # 頻道歷史回補: 就緒時由檢查點補上離線期間的訊息 (頻道以逗號分隔,空字串表示 DISCORD_CHANNEL_ID)
+    DISCORD_BACKFILL_ENABLED: bool = os.getenv('DISCORD_BACKFILL_ENABLED', 'False').lower() == 'true'
+    DISCORD_BACKFILL_CHANNELS: str = os.getenv('DISCORD_BACKFILL_CHANNELS', '')
+    DISCORD_BACKFILL_DAYS: int = int(os.getenv('DISCORD_BACKFILL_DAYS', '7'))
+    DISCORD_BACKFILL_CONCURRENCY: int = int(os.getenv('DISCORD_BACKFILL_CONCURRENCY', '2'))
 
     # ============ Line 設定 ============
     LINE_CHANNEL_SECRET: str = os.getenv('LINE_CHANNEL_SECRET', '')
@@ -25,9 +30,70 @@ class BotConfig:
     HOST: str = os.getenv('HOST', '0.0.0.0')
     DEBUG: bool = os.getenv('DEBUG', 'False').lower() == 'true'
 
+    # ============ 資料庫設定 ============
+    DATABASE_PATH: str = os.getenv('DATABASE_PATH', 'data/bot.db')
+    DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', '8'))
+    DB_BUSY_TIMEOUT: float = float(os.getenv('DB_BUSY_TIMEOUT', '10'))
+    DB_CACHE_SIZE_KB: int = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+    DB_MMAP_SIZE_MB: int = int(os.getenv('DB_MMAP_SIZE_MB', '128'))
+    # 唯讀連接池: 儀表板與統計查詢使用,不佔用寫入連接
+    DB_READ_POOL_SIZE: int = int(os.getenv('DB_READ_POOL_SIZE', '4'))
+    DB_READ_TIMEOUT: float = float(os.getenv('DB_READ_TIMEOUT', '5'))
+    # 配額與待處理佇列的獨立資料庫檔案 (空字串表示與 DATABASE_PATH 相同)
+    DB_STATE_PATH: str = os.getenv('DB_STATE_PATH', '')
+    # 儲存後端: sqlite (預設) / memory / dbapi (多個行程共用伺服器資料庫)
+    STORAGE_BACKEND: str = os.getenv('STORAGE_BACKEND', 'sqlite')
+    STORAGE_DBAPI_MODULE: str = os.getenv('STORAGE_DBAPI_MODULE', '')
+    STORAGE_DBAPI_DSN: str = os.getenv('STORAGE_DBAPI_DSN', '')
+    # 訊息寫入緩衝 (write-behind): 批次提交以降低每則訊息的 fsync 成本
+    DB_WRITE_BEHIND: bool = os.getenv('DB_WRITE_BEHIND', 'False').lower() == 'true'
+    DB_FLUSH_INTERVAL_MS: int = int(os.getenv('DB_FLUSH_INTERVAL_MS', '200'))
+    DB_FLUSH_MAX_ROWS: int = int(os.getenv('DB_FLUSH_MAX_ROWS', '500'))
+    # 最近訊息緩衝: 每個群組與全域保留最近的訊息供儀表板與上下文查詢 (0 表示停用)
+    RECENT_MESSAGES_PER_GROUP: int = int(os.getenv('RECENT_MESSAGES_PER_GROUP', '200'))
+    RECENT_MESSAGES_GLOBAL: int = int(os.getenv('RECENT_MESSAGES_GLOBAL', '500'))
+    RECENT_MESSAGES_MAX_MB: float = float(os.getenv('RECENT_MESSAGES_MAX_MB', '16'))
+    # 已知使用者快取: 已確認存在的使用者不再查詢 users 表 (0 表示停用)
+    KNOWN_USERS_MAX: int = int(os.getenv('KNOWN_USERS_MAX', '100000'))
+    # LRU 淘汰的使用者改記錄於 Bloom 過濾器 (位元數,0 表示不使用)
+    KNOWN_USERS_BLOOM_BITS: int = int(os.getenv('KNOWN_USERS_BLOOM_BITS', '0'))
+    # 配額引擎: 配額計數保存在記憶體,定期與關閉時寫回資料庫
+    QUOTA_ENGINE_ENABLED: bool = os.getenv('QUOTA_ENGINE_ENABLED', 'True').lower() == 'true'
+    QUOTA_FLUSH_INTERVAL_SECONDS: float = float(os.getenv('QUOTA_FLUSH_INTERVAL_SECONDS', '5'))
+    # 訊息封存: 超過天數的訊息依月份移至 ARCHIVE_DIR (0 表示停用)
+    MESSAGE_ARCHIVE_DAYS: int = int(os.getenv('MESSAGE_ARCHIVE_DAYS', '0'))
+    ARCHIVE_DIR: str = os.getenv('ARCHIVE_DIR', 'data/archive')
+    ARCHIVE_INTERVAL_HOURS: float = float(os.getenv('ARCHIVE_INTERVAL_HOURS', '24'))
+    # 線上備份: 每步複製的頁面數與暫停時間,讓備份期間仍可正常讀寫
+    DB_BACKUP_PATH: str = os.getenv('DB_BACKUP_PATH', 'data/backups')
+    DB_BACKUP_PAGES_PER_STEP: int = int(os.getenv('DB_BACKUP_PAGES_PER_STEP', '256'))
+    DB_BACKUP_SLEEP_MS: float = float(os.getenv('DB_BACKUP_SLEEP_MS', '20'))
+    DB_BACKUP_COMPRESS: bool = os.getenv('DB_BACKUP_COMPRESS', 'True').lower() == 'true'
+    # 空間回收: 離峰時段以增量 VACUUM 分批回收空閒頁面
+    DB_VACUUM_ENABLED: bool = os.getenv('DB_VACUUM_ENABLED', 'True').lower() == 'true'
+    DB_VACUUM_PAGES_PER_TICK: int = int(os.getenv('DB_VACUUM_PAGES_PER_TICK', '200'))
+    DB_VACUUM_INTERVAL_SECONDS: float = float(os.getenv('DB_VACUUM_INTERVAL_SECONDS', '60'))
+    DB_VACUUM_QUIET_HOURS: str = os.getenv('DB_VACUUM_QUIET_HOURS', '2-6')
+    # 保留期限: 依訊息類型 / 平台分批刪除過期資料 (格式見 models/retention.py)
+    RETENTION_ENABLED: bool = os.getenv('RETENTION_ENABLED', 'False').lower() == 'true'
+    RETENTION_POLICIES: str = os.getenv(
+        'RETENTION_POLICIES',
+        'messages.ai_request=30,messages.ai_response=30,chat_history=90,queued_messages=7'
+    )
+    RETENTION_BATCH_SIZE: int = int(os.getenv('RETENTION_BATCH_SIZE', '1000'))
+    RETENTION_PAUSE_MS: float = float(os.getenv('RETENTION_PAUSE_MS', '50'))
+    RETENTION_INTERVAL_HOURS: float = float(os.getenv('RETENTION_INTERVAL_HOURS', '24'))
+    # 訊息壓縮: 超過門檻的 content / metadata 以 zlib 或 zstd 壓縮 (空字串表示停用)
+    MESSAGE_COMPRESSION: str = os.getenv('MESSAGE_COMPRESSION', '')
+    MESSAGE_COMPRESSION_MIN_BYTES: int = int(os.getenv('MESSAGE_COMPRESSION_MIN_BYTES', '512'))
+    # 背景壓縮既有訊息的間隔 (0 表示不壓縮既有訊息)
+    MESSAGE_RECOMPRESS_INTERVAL_HOURS: float = float(os.getenv('MESSAGE_RECOMPRESS_INTERVAL_HOURS', '24'))
+
     # ============ 配額限制 ============
     AI_DAILY_LIMIT_PER_USER: int = int(os.getenv('AI_DAILY_LIMIT', '20'))
     AI_REQUEST_PER_MINUTE: int = int(os.getenv('AI_RPM', '30'))
+    # 每分鐘請求數已滿時等待名額的最長秒數
+    AI_RPM_MAX_WAIT_SECONDS: float = float(os.getenv('AI_RPM_MAX_WAIT_SECONDS', '10'))
     LINE_MONTHLY_LIMIT: int = int(os.getenv('LINE_MONTHLY_LIMIT', '500'))
     LINE_WARNING_THRESHOLD: float = float(os.getenv('LINE_WARNING_THRESHOLD', '0.9'))
 
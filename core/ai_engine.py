@@ -9,6 +9,7 @@ from typing import Optional, List, Dict
 from models.quota import Quota, SystemQuota
 from models.user import User
 from utils.logger import get_logger
+from utils.rate_limiter import get_ai_limiter
 from utils.retry import retry_with_backoff
 from config import config
 
@@ -47,60 +48,76 @@ class AIEngine:
             AI 回應或 None
         """
         try:
-            # 檢查系統配額
-            if not SystemQuota.can_use('gemini_rpm'):
-                logger.warning("Gemini API 配額已達上限")
-                return "系統繁忙,請稍後再試。"
+            # 確保使用者存在 (配額參照使用者;已知使用者不存取資料庫)
+            await User.aensure(user_id=user_id, platform=platform)
 
-            # 檢查使用者配額
-            quota = Quota.get_or_create(
+            # 預留使用者配額 (呼叫 Gemini 失敗時歸還)
+            quota = await Quota.aget_or_create(
                 user_id=user_id,
                 quota_type='ai_daily',
                 limit_count=config.AI_DAILY_LIMIT_PER_USER,
                 reset_period='daily'
             )
 
-            if not quota.can_use():
+            user_slot = await quota.areserve()
+            if user_slot is None:
                 logger.info(f"使用者 {user_id} AI 配額已用盡")
                 return f"今日 AI 對話次數已達上限 ({quota.limit_count} 次),明日重置。"
 
-            # 確保使用者存在
-            user = User.get_or_create(user_id=user_id, platform=platform)
-
-            # 生成回應
-            logger.info(f"生成 AI 回應: {user_id}")
-
-            response = self.model.generate_content(
-                f"請用繁體中文回答以下問題,保持簡潔:\n{message}",
-                generation_config={
-                    "temperature": config.AI_TEMPERATURE,
-                    "top_p": config.AI_TOP_P,
-                    "top_k": config.AI_TOP_K,
-                    "max_output_tokens": config.AI_MAX_TOKENS,
-                }
-            )
-
-            # 增加配額使用
-            quota.increment()
-            SystemQuota.increment_usage('gemini_rpm')
+            system_slot = None
+            try:
+                # 每分鐘請求數: 有速率限制器時等待名額,否則使用系統配額
+                limiter = get_ai_limiter()
+                if limiter is not None:
+                    acquired = await limiter.acquire(timeout=config.AI_RPM_MAX_WAIT_SECONDS)
+                else:
+                    system_slot = await SystemQuota.areserve('gemini_rpm')
+                    acquired = system_slot is not None
+                if not acquired:
+                    logger.warning("Gemini API 配額已達上限")
+                    return "系統繁忙,請稍後再試。"
+
+                # 生成回應
+                logger.info(f"生成 AI 回應: {user_id}")
+
+                response = self.model.generate_content(
+                    f"請用繁體中文回答以下問題,保持簡潔:\n{message}",
+                    generation_config={
+                        "temperature": config.AI_TEMPERATURE,
+                        "top_p": config.AI_TOP_P,
+                        "top_k": config.AI_TOP_K,
+                        "max_output_tokens": config.AI_MAX_TOKENS,
+                    }
+                )
+
+                # 計入配額使用
+                await user_slot.acommit()
+                if system_slot is not None:
+                    await system_slot.acommit()
+            finally:
+                # 未提交的預留一律歸還 (包含等待名額時被取消: CancelledError 不屬於 Exception);
+                # 已提交時 release 不會生效,歸還只改動記憶體,不需等待
+                user_slot.release()
+                if system_slot is not None:
+                    system_slot.release()
 
             # 記錄到資料庫
             from models.message import Message
-            Message(
+            await Message(
                 message_id=f"ai_req_{user_id}_{int(__import__('time').time())}",
                 user_id=user_id,
                 platform=platform,
                 content=message,
                 message_type='ai_request'
-            ).save()
+            ).asave()
 
-            Message(
+            await Message(
                 message_id=f"ai_resp_{user_id}_{int(__import__('time').time())}",
                 user_id=user_id,
                 platform='ai',
                 content=response.text,
                 message_type='ai_response'
-            ).save()
+            ).asave()
 
             logger.info(f"AI 回應成功: {user_id}")
             return response.text
@@ -142,9 +159,46 @@ class AIEngine:
             系統配額資訊
         """
         line_quota = SystemQuota.get_quota('line_monthly')
-        gemini_quota = SystemQuota.get_quota('gemini_rpm')
+        gemini_quota = AIEngine._limiter_quota(SystemQuota.get_quota('gemini_rpm'))
 
-        return {
+        info = {
             'line': line_quota,
             'gemini': gemini_quota
         }
+        limiter = get_ai_limiter()
+        if limiter is not None:
+            info['gemini_limiter'] = limiter.get_stats()
+        return info
+
+    @staticmethod
+    def get_system_quotas() -> List[Dict]:
+        """
+        獲取所有系統配額 (供統計與監控使用)
+
+        Returns:
+            系統配額列表
+        """
+        return [
+            AIEngine._limiter_quota(quota) if quota['quota_type'] == 'gemini_rpm' else quota
+            for quota in SystemQuota.get_all()
+        ]
+
+    @staticmethod
+    def _limiter_quota(quota: Optional[Dict]) -> Optional[Dict]:
+        """
+        啟用速率限制器時,以限制器的數字取代 gemini_rpm 系統配額
+
+        此時 Gemini 請求不經過 gemini_rpm 系統配額,資料庫中的用量不再更新;
+        改為顯示最近 60 秒內放行的請求數與 AI_RPM 上限 (滑動視窗沒有重置時間)。
+        """
+        limiter = get_ai_limiter()
+        if limiter is None or quota is None:
+            return quota
+        stats = limiter.get_stats()
+        return dict(
+            quota,
+            usage_count=stats['in_window'],
+            limit_count=stats['limit'],
+            reset_period='sliding',
+            last_reset=None
+        )
@@ -0,0 +1,253 @@
+"""
+Discord 頻道歷史回補
+- 以 channel.history 的 after 游標逐頁 (每頁 100 則) 讀取離線期間的訊息
+- 同時回補的頻道數有上限,請求節奏交由 discord.py 依各路由的速率限制桶控制
+- 每頁以批次寫入,並在同一交易中更新頻道檢查點,中斷後可從檢查點繼續
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Iterable
+import discord
+from models.database import Database, get_db, run_in_db
+from models.importer import BulkImporter
+from models.recent import invalidate_recent_buffer
+from models.rows import encode_metadata
+from services.media_handler import MediaHandler
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 無文字內容的附件訊息顯示名稱
+ATTACHMENT_LABELS = {
+    'image': '圖片',
+    'video': '影片',
+    'audio': '音訊',
+    'file': '檔案',
+}
+
+
+def message_record(message: discord.Message) -> Dict[str, Any]:
+    """
+    將 Discord 訊息轉為匯入資料 (models.importer 的格式)
+
+    一則 Discord 訊息對應一筆資料 (多個附件記錄於 metadata),message_id 為訊息的 snowflake。
+
+    Args:
+        message: Discord 訊息物件
+
+    Returns:
+        訊息資料
+    """
+    attachments = [
+        {'filename': attachment.filename, 'url': attachment.url, 'size': attachment.size}
+        for attachment in message.attachments
+    ]
+    content = message.content
+    message_type = 'text'
+    if not content and attachments:
+        media_type = MediaHandler.get_media_type(attachments[0]['filename'])
+        message_type = media_type if media_type in ATTACHMENT_LABELS else 'file'
+        content = f"[{ATTACHMENT_LABELS[message_type]}: {attachments[0]['filename']}]"
+    elif not content and message.embeds:
+        embed = message.embeds[0]
+        content = f"[嵌入訊息] {embed.title or ''}: {embed.description or ''}"
+
+    metadata = {'source': 'discord_backfill', 'author': message.author.name}
+    if attachments:
+        metadata['attachments'] = attachments
+    return {
+        'message_id': str(message.id),
+        'user_id': str(message.author.id),
+        'display_name': message.author.display_name,
+        'platform': 'discord',
+        'group_id': str(message.channel.id),
+        'content': content,
+        'message_type': message_type,
+        'created_at': int(message.created_at.timestamp() * 1000),
+        'metadata': encode_metadata(metadata),
+    }
+
+
+class HistoryBackfill:
+    """
+    Discord 頻道歷史回補
+
+    每個頻道由檢查點 (沒有檢查點時由 since_days 天前) 開始,以 after 游標由舊到新逐頁讀取,
+    直到追上最新訊息。寫入在資料庫執行緒池中執行,不阻塞 Bot 的事件迴圈。
+    機器人 (包含本橋接轉發的 LINE 訊息) 發送的訊息不回補。
+    """
+
+    # Discord API 每次請求最多返回 100 則訊息
+    PAGE_SIZE = 100
+
+    def __init__(
+        self,
+        bot: discord.Client,
+        db: Optional[Database] = None,
+        max_concurrency: int = 2,
+        since_days: int = 7,
+        pause_ms: float = 0
+    ):
+        """
+        初始化回補工作
+
+        Args:
+            bot: Discord 客戶端
+            db: 資料庫實例 (預設使用全域實例)
+            max_concurrency: 同時回補的頻道數
+            since_days: 沒有檢查點的頻道往前回補的天數
+            pause_ms: 每頁之間的暫停時間 (毫秒),在速率限制之外再放慢請求
+        """
+        self.bot = bot
+        self.db = db or get_db()
+        self.max_concurrency = max(1, max_concurrency)
+        self.since_days = since_days
+        self.pause_ms = pause_ms
+        self.importer = BulkImporter(self.db, defer_indexes=False)
+        self._stop_event = asyncio.Event()
+        self._channels: Dict[str, Dict[str, Any]] = {}
+
+    # ==================== 檢查點 ====================
+
+    def get_checkpoint(self, channel_id: str) -> Optional[int]:
+        """
+        獲取頻道已回補到的最後一則訊息 ID
+
+        Args:
+            channel_id: 頻道 ID
+
+        Returns:
+            訊息 snowflake,沒有檢查點時返回 None
+        """
+        with self.db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT last_message_id FROM backfill_checkpoints WHERE channel_id = ?
+            """, (channel_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def _store_page(self, channel_id: str, records: List[Dict[str, Any]], last_message_id: int) -> int:
+        """寫入一頁訊息並推進檢查點 (同一交易),返回新增的訊息數"""
+        with self.db.get_cursor() as cursor:
+            inserted = self.importer.load_batch(cursor, records) if records else 0
+            cursor.execute("""
+                INSERT INTO backfill_checkpoints (channel_id, last_message_id, messages, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (channel_id) DO UPDATE SET
+                    last_message_id = excluded.last_message_id,
+                    messages = messages + excluded.messages,
+                    updated_at = excluded.updated_at
+            """, (channel_id, last_message_id, inserted, int(time.time() * 1000)))
+            return inserted
+
+    # ==================== 回補 ====================
+
+    async def run(self, channel_ids: Iterable[int]) -> Dict[str, Dict[str, Any]]:
+        """
+        回補多個頻道 (同時進行的頻道數不超過 max_concurrency)
+
+        Args:
+            channel_ids: 頻道 ID 列表
+
+        Returns:
+            各頻道的回補結果 (見 get_stats)
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(channel_id: int):
+            async with semaphore:
+                await self.backfill_channel(channel_id)
+
+        self._stop_event.clear()
+        await asyncio.gather(*(bounded(channel_id) for channel_id in channel_ids))
+
+        inserted = sum(stats['inserted'] for stats in self._channels.values())
+        if inserted:
+            # 回補的訊息可能比緩衝中的訊息舊,也可能落在緩衝範圍內
+            invalidate_recent_buffer()
+        return self.get_stats()
+
+    async def backfill_channel(self, channel_id: int) -> Dict[str, Any]:
+        """
+        由檢查點回補單一頻道直到最新訊息
+
+        權限不足或 API 錯誤時停止該頻道,已寫入的頁面與檢查點保留,下次由檢查點繼續。
+
+        Args:
+            channel_id: 頻道 ID
+
+        Returns:
+            頻道的回補結果
+        """
+        key = str(channel_id)
+        stats = self._channels[key] = {
+            'status': 'running', 'pages': 0, 'fetched': 0, 'inserted': 0,
+            'skipped': 0, 'last_message_id': None, 'error': None,
+        }
+        started = time.monotonic()
+        try:
+            channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+            checkpoint = await run_in_db(self.get_checkpoint, key)
+            if checkpoint is None:
+                since = datetime.now(timezone.utc) - timedelta(days=self.since_days)
+                checkpoint = discord.utils.time_snowflake(since)
+            stats['last_message_id'] = str(checkpoint)
+
+            while not self._stop_event.is_set():
+                page = [
+                    message async for message in channel.history(
+                        limit=self.PAGE_SIZE,
+                        after=discord.Object(id=checkpoint),
+                        oldest_first=True
+                    )
+                ]
+                if not page:
+                    break
+
+                records = [message_record(message) for message in page if not message.author.bot]
+                checkpoint = page[-1].id
+                stats['inserted'] += await run_in_db(self._store_page, key, records, checkpoint)
+                stats['pages'] += 1
+                stats['fetched'] += len(page)
+                stats['skipped'] += len(page) - len(records)
+                stats['last_message_id'] = str(checkpoint)
+
+                if len(page) < self.PAGE_SIZE:
+                    break
+                if self.pause_ms:
+                    await asyncio.sleep(self.pause_ms / 1000)
+
+            stats['status'] = 'stopped' if self._stop_event.is_set() else 'done'
+        except (discord.Forbidden, discord.NotFound) as e:
+            stats['status'] = 'error'
+            stats['error'] = str(e)
+            logger.error(f"無法回補頻道 {channel_id}: {e}")
+        except discord.HTTPException as e:
+            stats['status'] = 'error'
+            stats['error'] = str(e)
+            logger.error(f"回補頻道 {channel_id} 時發生 API 錯誤,下次由檢查點繼續: {e}")
+        except Exception as e:
+            stats['status'] = 'error'
+            stats['error'] = str(e)
+            logger.exception(f"回補頻道 {channel_id} 失敗: {e}")
+
+        stats['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+        logger.info(
+            f"頻道 {channel_id} 回補{'完成' if stats['status'] == 'done' else '中止'}: "
+            f"{stats['pages']} 頁,讀取 {stats['fetched']} 則,新增 {stats['inserted']} 則"
+        )
+        return stats
+
+    def stop(self):
+        """在目前的頁面寫入後停止回補"""
+        self._stop_event.set()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        獲取各頻道的回補結果
+
+        Returns:
+            {頻道 ID: {'status', 'pages', 'fetched', 'inserted', 'skipped', 'last_message_id', 'error', 'elapsed_ms'}}
+        """
+        return {channel_id: dict(stats) for channel_id, stats in list(self._channels.items())}
@@ -3,11 +3,14 @@ Discord 機器人管理模組
 - 自動重連
 - 錯誤恢復
 - 事件處理
+- 頻道歷史回補
 """
 import discord
 from discord.ext import commands
 import asyncio
-from typing import Optional, Callable
+from typing import Optional, Callable, Dict, Any, List
+from core.discord_backfill import HistoryBackfill
+from models.storage import get_storage, SQLiteStorage
 from utils.logger import get_logger
 from utils.retry import ReconnectManager, retry_with_backoff
 from config import config
@@ -32,6 +35,9 @@ class DiscordBotManager:
             max_delay=300.0
         )
         self.is_ready = False
+        self.backfill_job: Optional[HistoryBackfill] = None
+        # 只在 Bot 的事件迴圈中讀寫,不需要鎖
+        self._backfill_running = False
         self._setup_events()
 
     def _setup_events(self):
@@ -50,6 +56,10 @@ class DiscordBotManager:
             except Exception as e:
                 logger.error(f"發送上線訊息失敗: {e}")
 
+            # 補上離線期間的訊息 (重新連線後再次就緒時由檢查點繼續)
+            if config.DISCORD_BACKFILL_ENABLED:
+                self.start_backfill()
+
         @self.bot.event
         async def on_disconnect():
             """斷線事件"""
@@ -102,6 +112,86 @@ class DiscordBotManager:
                 logger.exception(f"執行指令 {name} 時發生錯誤: {e}")
                 await ctx.send(f"❌ 執行指令時發生錯誤: {str(e)}")
 
+    # ==================== 歷史回補 ====================
+
+    @staticmethod
+    def backfill_channel_ids() -> List[int]:
+        """設定中要回補的頻道 (DISCORD_BACKFILL_CHANNELS,未設定時為 DISCORD_CHANNEL_ID)"""
+        raw = config.DISCORD_BACKFILL_CHANNELS or config.DISCORD_CHANNEL_ID
+        return [int(value) for value in raw.split(',') if value.strip()]
+
+    async def backfill(
+        self,
+        channel_ids: Optional[List[int]] = None,
+        since_days: Optional[int] = None,
+        max_concurrency: Optional[int] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        回補頻道歷史訊息 (在 Bot 的事件迴圈中執行)
+
+        Args:
+            channel_ids: 頻道 ID 列表 (預設見 backfill_channel_ids)
+            since_days: 沒有檢查點的頻道往前回補的天數 (預設 DISCORD_BACKFILL_DAYS)
+            max_concurrency: 同時回補的頻道數 (預設 DISCORD_BACKFILL_CONCURRENCY)
+
+        Returns:
+            各頻道的回補結果
+
+        Raises:
+            RuntimeError: 已有回補進行中,或儲存後端不是 sqlite
+        """
+        if self._backfill_running:
+            raise RuntimeError("已有回補作業進行中")
+        if not isinstance(get_storage(), SQLiteStorage):
+            raise RuntimeError("歷史回補需要 sqlite 儲存後端")
+
+        self.backfill_job = HistoryBackfill(
+            self.bot,
+            max_concurrency=max_concurrency or config.DISCORD_BACKFILL_CONCURRENCY,
+            since_days=config.DISCORD_BACKFILL_DAYS if since_days is None else since_days
+        )
+        self._backfill_running = True
+        try:
+            return await self.backfill_job.run(channel_ids or self.backfill_channel_ids())
+        finally:
+            self._backfill_running = False
+
+    def start_backfill(self, **kwargs) -> bool:
+        """
+        在 Bot 的事件迴圈中啟動背景回補 (可由其他執行緒呼叫)
+
+        Args:
+            **kwargs: 傳給 backfill 的參數
+
+        Returns:
+            是否已啟動 (已有回補進行中或 Bot 尚未啟動時返回 False)
+        """
+        loop = self.bot.loop
+        # 登入前 bot.loop 是 discord.py 的佔位物件
+        if self._backfill_running or not isinstance(loop, asyncio.AbstractEventLoop) or loop.is_closed():
+            return False
+
+        async def run():
+            try:
+                await self.backfill(**kwargs)
+            except RuntimeError as e:
+                logger.warning(f"未啟動頻道歷史回補: {e}")
+            except Exception as e:
+                logger.exception(f"頻道歷史回補失敗: {e}")
+
+        asyncio.run_coroutine_threadsafe(run(), loop)
+        return True
+
+    @property
+    def is_backfilling(self) -> bool:
+        """是否有回補作業進行中"""
+        return self._backfill_running
+
+    def stop_backfill(self):
+        """在目前的頁面寫入後停止回補"""
+        if self.backfill_job is not None and self._backfill_running:
+            self.bot.loop.call_soon_threadsafe(self.backfill_job.stop)
+
     @retry_with_backoff(
         max_retries=5,
         base_delay=5.0,
@@ -127,6 +217,7 @@ class DiscordBotManager:
     async def stop(self):
         """停止機器人"""
         logger.info("正在停止 Discord 機器人...")
+        self.stop_backfill()
         await self.bot.close()
         self.is_ready = False
 
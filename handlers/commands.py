@@ -7,11 +7,12 @@
 import discord
 from discord.ext import commands
 from typing import Optional, Dict, Any
-from datetime import datetime
-from models.database import get_db
-from models.quota import Quota, SystemQuota
+from datetime import datetime, timedelta
+from models.database import get_db, run_in_db, run_read_only
+from models.quota import Quota
 from models.user import User
 from models.message import Message
+from models.stats import Stats
 from core.ai_engine import AIEngine
 from utils.logger import get_logger
 from config import config
@@ -129,12 +130,18 @@ class CommandHandler:
 
         # 伺服器資訊
         guild_count = len(self.discord_bot.bot.guilds)
-embed.set_footer(text="Converge")
+        embed.add_field(
+            name="🏠 伺服器",
+            value=f"{guild_count} 個",
+            inline=True
+        )
+
+        embed.set_footer(text="Converge")
         await ctx.send(embed=embed)
 
     async def cmd_quota(self, ctx):
         """配額指令"""
-        quota_info = SystemQuota.get_all()
+        quota_info = await run_in_db(AIEngine.get_system_quotas)
 
         embed = discord.Embed(
             title="📊 API 配額使用情況",
@@ -172,7 +179,7 @@ embed.set_footer(text="Converge")
     async def cmd_stats(self, ctx):
         """統計指令"""
         db = get_db()
-        stats = db.get_stats()
+        stats = await run_read_only(db.get_stats)
 
         embed = discord.Embed(
             title="📈 使用統計",
@@ -211,8 +218,8 @@ embed.set_footer(text="Converge")
         )
 
         # 平台使用統計
-        line_msg_count = Message.count_by_platform('line')
-        discord_msg_count = Message.count_by_platform('discord')
+        line_msg_count = await Message.acount_by_platform('line')
+        discord_msg_count = await Message.acount_by_platform('discord')
 
         embed.add_field(
             name="📱 平台訊息分布",
@@ -226,10 +233,10 @@ embed.set_footer(text="Converge")
     async def cmd_users(self, ctx, platform: str = 'all'):
         """使用者列表指令"""
         if platform.lower() == 'all':
-            users = User.get_all()
+            users = await run_read_only(User.get_all)
             title = "👥 所有使用者"
         else:
-            users = User.get_all(platform=platform.lower())
+            users = await run_read_only(User.get_all, platform=platform.lower())
             title = f"👥 {platform.upper()} 使用者"
 
         if not users:
@@ -260,8 +267,6 @@ embed.set_footer(text="Converge")
 
     async def cmd_dbstats(self, ctx):
         """資料庫統計指令"""
-        db = get_db()
-
         embed = discord.Embed(
             title="💾 資料庫詳細統計",
             color=discord.Color.dark_blue(),
@@ -269,9 +274,9 @@ embed.set_footer(text="Converge")
         )
 
         # 使用者統計
-        total_users = User.count()
-        line_users = User.count(platform='line')
-        discord_users = User.count(platform='discord')
+        total_users = await User.acount()
+        line_users = await User.acount(platform='line')
+        discord_users = await User.acount(platform='discord')
 
         embed.add_field(
             name="👥 使用者統計",
@@ -280,20 +285,7 @@ embed.set_footer(text="Converge")
         )
 
         # 訊息統計
-        with db.get_cursor() as cursor:
-            # 今日訊息
-            cursor.execute("""
-                SELECT COUNT(*) FROM messages
-                WHERE date(created_at) = date('now')
-            """)
-            today_messages = cursor.fetchone()[0]
-
-            # 本週訊息
-            cursor.execute("""
-                SELECT COUNT(*) FROM messages
-                WHERE date(created_at) >= date('now', '-7 days')
-            """)
-            week_messages = cursor.fetchone()[0]
+        today_messages, week_messages, quota_records = await run_read_only(self._query_dbstats_counts)
 
         embed.add_field(
             name="💬 訊息統計",
@@ -302,10 +294,6 @@ embed.set_footer(text="Converge")
         )
 
         # 配額統計
-        with db.get_cursor() as cursor:
-            cursor.execute("SELECT COUNT(*) FROM quotas")
-            quota_records = cursor.fetchone()[0]
-
         embed.add_field(
             name="📊 配額記錄",
             value=f"{quota_records} 筆",
@@ -315,6 +303,15 @@ embed.set_footer(text="Converge")
         embed.set_footer(text="Converge")
         await ctx.send(embed=embed)
 
+    @staticmethod
+    def _query_dbstats_counts() -> tuple:
+        """查詢 dbstats 所需的計數 (同步,於資料庫執行緒池執行,讀取統計彙總表)"""
+        today = datetime.now()
+        today_messages = Stats.count_messages_since(today)
+        week_messages = Stats.count_messages_since(today - timedelta(days=7))
+        quota_records = Stats.count('quotas')
+        return today_messages, week_messages, quota_records
+
     async def cmd_help(self, ctx):
         """幫助指令"""
         embed = discord.Embed(
@@ -335,7 +332,9 @@ embed.set_footer(text="Converge")
         ]
 
         for cmd, desc in commands_list:
-embed.set_footer(text="Converge")
+            embed.add_field(name=cmd, value=desc, inline=False)
+
+        embed.set_footer(text="Converge")
         await ctx.send(embed=embed)
 
     async def cmd_ping(self, ctx):
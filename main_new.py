@@ -11,7 +11,18 @@ from linebot.v3.messaging import MessagingApi, ApiClient, Configuration
 
 from config import config
 from utils.logger import setup_logging, get_logger
+from utils.rate_limiter import configure_ai_limiter
 from models.database import get_db, close_db
+from models.storage import create_storage, configure_storage, reset_storage
+from models.write_buffer import enable_write_buffer, disable_write_buffer
+from models.recent import configure_recent_buffer
+from models.known_users import configure_known_users
+from models.quota_engine import start_quota_engine, stop_quota_engine
+from models.archive import configure_archive, get_archive
+from models.backup import configure_backup
+from models.vacuum import start_vacuum_scheduler, stop_vacuum_scheduler, parse_quiet_hours
+from models.retention import start_retention_engine, stop_retention_engine, parse_policies
+from models.compression import configure_compression, start_recompressor, stop_recompressor
 from core.discord_bot import DiscordBotManager
 from core.ai_engine import AIEngine
 from handlers.commands import CommandHandler
@@ -53,9 +64,97 @@ class ConvergeApp:
         self.flask_app.config['SECRET_KEY'] = 'your-secret-key-here'  # TODO: 從環境變數讀取
 
         # 初始化資料庫
-        self.db = get_db()
+        self.db = get_db(
+            config.DATABASE_PATH,
+            pool_size=config.DB_POOL_SIZE,
+            busy_timeout=config.DB_BUSY_TIMEOUT,
+            cache_size_kb=config.DB_CACHE_SIZE_KB,
+            mmap_size_mb=config.DB_MMAP_SIZE_MB,
+            read_pool_size=config.DB_READ_POOL_SIZE,
+            read_timeout=config.DB_READ_TIMEOUT,
+            state_path=config.DB_STATE_PATH or None
+        )
         logger.info("✅ 資料庫已初始化")
 
+        # 初始化儲存後端 (模型透過它存取使用者、訊息、配額與佇列)
+        if config.STORAGE_BACKEND == 'dbapi':
+            storage = create_storage('dbapi', config.STORAGE_DBAPI_MODULE, config.STORAGE_DBAPI_DSN)
+        elif config.STORAGE_BACKEND == 'sqlite':
+            storage = create_storage('sqlite', self.db)
+        else:
+            storage = create_storage(config.STORAGE_BACKEND)
+        configure_storage(storage)
+
+        if config.DB_WRITE_BEHIND:
+            enable_write_buffer(
+                self.db,
+                flush_interval_ms=config.DB_FLUSH_INTERVAL_MS,
+                max_rows=config.DB_FLUSH_MAX_ROWS
+            )
+            logger.info("✅ 訊息寫入緩衝已啟用")
+
+        configure_known_users(
+            max_entries=config.KNOWN_USERS_MAX,
+            bloom_bits=config.KNOWN_USERS_BLOOM_BITS
+        )
+
+        # 配額計數在記憶體中,定期寫回 (多個行程共用資料庫 (dbapi) 時各自的計數無法合併,不啟用)
+        if config.QUOTA_ENGINE_ENABLED and config.STORAGE_BACKEND != 'dbapi':
+            start_quota_engine(config.QUOTA_FLUSH_INTERVAL_SECONDS)
+
+        # Gemini 每分鐘請求數以滑動視窗限制 (多個行程共用資料庫 (dbapi) 時改用共用的系統配額)
+        if config.STORAGE_BACKEND != 'dbapi':
+            configure_ai_limiter(config.AI_REQUEST_PER_MINUTE)
+
+        # 最近訊息緩衝只看得到本行程寫入的訊息,多個行程共用資料庫 (dbapi) 時不啟用
+        if config.RECENT_MESSAGES_PER_GROUP > 0 and config.STORAGE_BACKEND != 'dbapi':
+            configure_recent_buffer(
+                per_group=config.RECENT_MESSAGES_PER_GROUP,
+                global_size=config.RECENT_MESSAGES_GLOBAL,
+                max_bytes=int(config.RECENT_MESSAGES_MAX_MB * 1024 * 1024)
+            )
+
+        configure_backup(
+            self.db,
+            backup_dir=config.DB_BACKUP_PATH,
+            pages=config.DB_BACKUP_PAGES_PER_STEP,
+            sleep_ms=config.DB_BACKUP_SLEEP_MS,
+            compress=config.DB_BACKUP_COMPRESS
+        )
+
+        if config.DB_VACUUM_ENABLED:
+            start_vacuum_scheduler(
+                self.db,
+                pages_per_tick=config.DB_VACUUM_PAGES_PER_TICK,
+                interval_seconds=config.DB_VACUUM_INTERVAL_SECONDS,
+                quiet_hours=parse_quiet_hours(config.DB_VACUUM_QUIET_HOURS)
+            )
+
+        if config.RETENTION_ENABLED:
+            start_retention_engine(
+                self.db,
+                policies=parse_policies(config.RETENTION_POLICIES),
+                interval_hours=config.RETENTION_INTERVAL_HOURS,
+                batch_size=config.RETENTION_BATCH_SIZE,
+                pause_ms=config.RETENTION_PAUSE_MS
+            )
+            logger.info("✅ 保留期限清理已啟用")
+
+        if config.MESSAGE_COMPRESSION and config.STORAGE_BACKEND == 'sqlite':
+            configure_compression(config.MESSAGE_COMPRESSION, config.MESSAGE_COMPRESSION_MIN_BYTES)
+            if config.MESSAGE_RECOMPRESS_INTERVAL_HOURS > 0:
+                start_recompressor(self.db, interval_hours=config.MESSAGE_RECOMPRESS_INTERVAL_HOURS)
+            logger.info(f"✅ 訊息壓縮已啟用 ({config.MESSAGE_COMPRESSION})")
+
+        if config.MESSAGE_ARCHIVE_DAYS > 0:
+            archive = configure_archive(
+                self.db,
+                archive_dir=config.ARCHIVE_DIR,
+                max_age_days=config.MESSAGE_ARCHIVE_DAYS
+            )
+            archive.start_scheduler(config.ARCHIVE_INTERVAL_HOURS)
+            logger.info("✅ 訊息封存已啟用")
+
         # 初始化 Line Bot
         self.line_configuration = Configuration(
             access_token=config.LINE_CHANNEL_ACCESS_TOKEN
@@ -165,8 +264,29 @@ class ConvergeApp:
         except Exception as e:
             logger.error(f"❌ 停止 Discord Bot 時發生錯誤: {e}")
 
+        # 停止訊息封存、背景壓縮、保留期限與空間回收排程
+        archive = get_archive()
+        if archive is not None:
+            archive.stop_scheduler()
+        stop_recompressor()
+        stop_retention_engine()
+        stop_vacuum_scheduler()
+
+        # 寫回配額計數
+        try:
+            stop_quota_engine()
+        except Exception as e:
+            logger.error(f"❌ 寫回配額時發生錯誤: {e}")
+
+        # 寫入緩衝中剩餘的訊息
+        try:
+            disable_write_buffer()
+        except Exception as e:
+            logger.error(f"❌ 寫入緩衝提交時發生錯誤: {e}")
+
         # 關閉資料庫
         try:
+            reset_storage()
             close_db()
             logger.info("✅ 資料庫連接已關閉")
         except Exception as e:
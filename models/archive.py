@@ -0,0 +1,355 @@
+"""
+訊息封存模組
+- 將超過保留期限的訊息依月份移至獨立的 SQLite 檔案
+- 以 ATTACH 查詢封存檔,讓歷史紀錄與搜尋不受影響
+- 熱資料庫 (bot.db) 保持精簡,索引常駐快取,備份快速
+"""
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, List, Iterator
+from .database import Database, get_db, fts5_trigram_available, _migrate_messages_fts
+from .recent import invalidate_recent_buffer
+from .timestamps import now_ms, to_epoch_ms, from_epoch_ms
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class MessageArchive:
+    """依月份分檔的訊息封存"""
+
+    FILE_PATTERN = re.compile(r'^messages_(\d{4})_(\d{2})\.db$')
+
+    # 每批搬移的訊息數 (每批一個短交易,不長時間佔用寫入鎖)
+    BATCH_SIZE = 500
+
+    def __init__(
+        self,
+        db: Database,
+        archive_dir: str = 'data/archive',
+        max_age_days: int = 180
+    ):
+        """
+        初始化訊息封存
+
+        Args:
+            db: 熱資料庫實例
+            archive_dir: 封存檔目錄
+            max_age_days: 超過幾天的訊息移入封存
+        """
+        self.db = db
+        self.archive_dir = archive_dir
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        if not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+            logger.info(f"建立封存目錄: {archive_dir}")
+
+    # ==================== 檔案管理 ====================
+
+    def month_path(self, month: str) -> str:
+        """
+        獲取月份封存檔路徑
+
+        Args:
+            month: 'YYYY-MM'
+
+        Returns:
+            檔案路徑
+        """
+        year, mon = month.split('-')
+        return os.path.join(self.archive_dir, f"messages_{year}_{mon}.db")
+
+    def list_months(self) -> List[str]:
+        """
+        列出所有封存月份 (新到舊)
+
+        Returns:
+            'YYYY-MM' 列表
+        """
+        months = []
+        for name in os.listdir(self.archive_dir):
+            match = self.FILE_PATTERN.match(name)
+            if match:
+                months.append(f"{match.group(1)}-{match.group(2)}")
+        return sorted(months, reverse=True)
+
+    @staticmethod
+    def schema_name(month: str) -> str:
+        """ATTACH 時使用的 schema 名稱"""
+        return f"archive_{month.replace('-', '_')}"
+
+    def _ensure_month_file(self, month: str):
+        """建立月份封存檔的表結構 (以字串 ID 儲存,不依賴主資料庫的字典表,也不含外鍵)"""
+        conn = sqlite3.connect(self.month_path(month))
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    message_id TEXT UNIQUE,
+                    user_id TEXT NOT NULL,
+                    platform TEXT NOT NULL,
+                    group_id TEXT,
+                    content TEXT,
+                    message_type TEXT DEFAULT 'text',
+                    created_at INTEGER,
+                    metadata TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_messages_created_at
+                ON messages (created_at DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_messages_user_created
+                ON messages (user_id, created_at DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_messages_group_created
+                ON messages (group_id, created_at DESC)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_messages_platform_created
+                ON messages (platform, created_at DESC)
+            """)
+            cursor.execute("""
+                SELECT 1 FROM sqlite_master
+                WHERE type = 'table' AND name = 'messages_fts'
+            """)
+            if cursor.fetchone() is None and fts5_trigram_available(cursor):
+                _migrate_messages_fts(cursor)
+            conn.commit()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def attached(self, conn: sqlite3.Connection, month: str) -> Iterator[str]:
+        """
+        將月份封存檔附加到連接上 (上下文管理器)
+
+        Args:
+            conn: 資料庫連接 (不可在交易中)
+            month: 'YYYY-MM'
+
+        Yields:
+            schema 名稱,可用於 {schema}.messages / {schema}.messages_fts
+        """
+        schema = self.schema_name(month)
+        conn.execute("ATTACH DATABASE ? AS " + schema, (self.month_path(month),))
+        try:
+            yield schema
+        finally:
+            if conn.in_transaction:
+                conn.commit()
+            conn.execute("DETACH DATABASE " + schema)
+
+    # ==================== 封存 ====================
+
+    def archive_old_messages(self) -> int:
+        """
+        將超過保留期限的訊息移入月份封存檔
+
+        Returns:
+            封存的訊息數量
+        """
+        if not self._lock.acquire(blocking=False):
+            logger.info("封存作業進行中,略過本次")
+            return 0
+
+        try:
+            cutoff = now_ms() - self.max_age_days * 86400000
+            with self.db.get_cursor() as cursor:
+                cursor.execute("SELECT MIN(created_at) FROM messages")
+                oldest = cursor.fetchone()[0]
+            if oldest is None or oldest >= cutoff:
+                return 0
+
+            # 從最舊訊息所在月份逐月處理到截止時間
+            months = []
+            current = from_epoch_ms(oldest).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            while to_epoch_ms(current) < cutoff:
+                months.append(current)
+                current = current.replace(year=current.year + (current.month == 12), month=current.month % 12 + 1)
+
+            total = 0
+            for month_start in months:
+                total += self._archive_month(month_start, cutoff)
+
+            if total:
+                logger.info(f"封存 {total} 則超過 {self.max_age_days} 天的訊息 ({len(months)} 個月份)")
+            return total
+        finally:
+            self._lock.release()
+
+    def _archive_month(self, month_start: datetime, cutoff: int) -> int:
+        """分批將單一月份 (本地時間) 的訊息搬到封存檔"""
+        month = month_start.strftime('%Y-%m')
+        month_end = month_start.replace(
+            year=month_start.year + (month_start.month == 12),
+            month=month_start.month % 12 + 1
+        )
+        lower = to_epoch_ms(month_start)
+        upper = min(to_epoch_ms(month_end), cutoff)
+
+        with self.db.get_cursor() as cursor:
+            cursor.execute("""
+                SELECT 1 FROM messages
+                WHERE created_at >= ? AND created_at < ?
+                LIMIT 1
+            """, (lower, upper))
+            if cursor.fetchone() is None:
+                return 0
+        self._ensure_month_file(month)
+
+        moved = 0
+        with self.db.connection() as conn:
+            with self.attached(conn, month) as schema:
+                while True:
+                    ids = [row[0] for row in conn.execute("""
+                        SELECT id FROM messages
+                        WHERE created_at >= ? AND created_at < ?
+                        LIMIT ?
+                    """, (lower, upper, self.BATCH_SIZE)).fetchall()]
+                    if not ids:
+                        break
+
+                    placeholders = ', '.join('?' for _ in ids)
+                    try:
+                        conn.execute("BEGIN IMMEDIATE")
+                        conn.execute(f"""
+                            INSERT OR IGNORE INTO {schema}.messages
+                            (id, message_id, user_id, platform, group_id, content,
+                             message_type, created_at, metadata)
+                            SELECT id, message_id, user_id, platform, group_id, inflate(content),
+                                   message_type, created_at, inflate(metadata)
+                            FROM main.message_rows WHERE id IN ({placeholders})
+                        """, ids)
+                        conn.execute(f"DELETE FROM main.messages WHERE id IN ({placeholders})", ids)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    moved += len(ids)
+
+        if moved:
+            # 最近訊息緩衝可能含有已移入封存檔的訊息
+            invalidate_recent_buffer()
+            logger.debug(f"封存 {month}: {moved} 則")
+        return moved
+
+    # ==================== 查詢 ====================
+
+    def fetch(self, sql_template: str, params: tuple, limit: int, months: Optional[List[str]] = None) -> list:
+        """
+        依序 (新到舊) 在各月份封存檔執行查詢,直到取得足夠的資料列
+
+        Args:
+            sql_template: 含 {schema} 與 {rows} (訊息資料列來源) 佔位符的 SQL,最後一個參數必須是 LIMIT
+            params: 不含 LIMIT 的參數
+            limit: 需要的資料列數量
+            months: 要查詢的月份 (預設所有月份)
+
+        Returns:
+            資料列列表
+        """
+        rows: list = []
+        months = self.list_months() if months is None else months
+        if not months:
+            return rows
+
+        with self.db.connection() as conn:
+            for month in months:
+                remaining = limit - len(rows)
+                if remaining <= 0:
+                    break
+                with self.attached(conn, month) as schema:
+                    rows.extend(conn.execute(
+                        sql_template.format(schema=schema, rows=f"{schema}.messages"),
+                        (*params, remaining)
+                    ).fetchall())
+        return rows
+
+    def get_stats(self) -> dict:
+        """
+        獲取封存統計資訊
+
+        Returns:
+            統計資訊字典
+        """
+        months = self.list_months()
+        size = sum(os.path.getsize(self.month_path(month)) for month in months)
+        return {
+            'months': months,
+            'max_age_days': self.max_age_days,
+            'size_bytes': size,
+            'size_mb': round(size / 1024 / 1024, 2),
+        }
+
+    # ==================== 排程 ====================
+
+    def start_scheduler(self, interval_hours: float = 24.0):
+        """
+        啟動背景封存排程
+
+        Args:
+            interval_hours: 執行間隔 (小時)
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop_event.wait(interval_hours * 3600):
+                try:
+                    self.archive_old_messages()
+                except Exception as e:
+                    logger.exception(f"訊息封存失敗: {e}")
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=run, daemon=True, name="MessageArchive")
+        self._thread.start()
+        logger.info(f"訊息封存排程已啟動 (保留 {self.max_age_days} 天,每 {interval_hours} 小時)")
+
+    def stop_scheduler(self):
+        """停止背景封存排程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+# 全域封存實例 (未設定時為 None)
+_archive: Optional[MessageArchive] = None
+
+
+def configure_archive(
+    db: Optional[Database] = None,
+    archive_dir: str = 'data/archive',
+    max_age_days: int = 180
+) -> MessageArchive:
+    """
+    設定全域訊息封存
+
+    Args:
+        db: 資料庫實例 (預設使用全域實例)
+        archive_dir: 封存檔目錄
+        max_age_days: 超過幾天的訊息移入封存
+
+    Returns:
+        MessageArchive 實例
+    """
+    global _archive
+    _archive = MessageArchive(db or get_db(), archive_dir, max_age_days)
+    return _archive
+
+
+def get_archive() -> Optional[MessageArchive]:
+    """獲取全域訊息封存,未設定時返回 None"""
+    return _archive
@@ -0,0 +1,185 @@
+"""
+背景備份模組
+- 於背景執行緒執行 Database.backup,不佔用請求執行緒
+- 記錄最近的備份工作與進度
+"""
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from .database import Database, get_db
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BackupJob:
+    """備份工作"""
+
+    def __init__(self, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.status = 'running'
+        self.pages_done = 0
+        self.pages_total = 0
+        self.started_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    def _on_progress(self, done: int, total: int):
+        """Database.backup 的進度回呼"""
+        self.pages_done = done
+        self.pages_total = total
+
+    @property
+    def percent(self) -> float:
+        """完成百分比"""
+        if self.status == 'done':
+            return 100.0
+        return round(self.pages_done / self.pages_total * 100, 1) if self.pages_total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為字典"""
+        return {
+            'id': self.id,
+            'path': self.path,
+            'status': self.status,
+            'pages_done': self.pages_done,
+            'pages_total': self.pages_total,
+            'percent': self.percent,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class BackupManager:
+    """備份工作管理,同一時間只執行一個備份"""
+
+    # 保留的工作紀錄數量
+    MAX_JOBS = 20
+
+    def __init__(
+        self,
+        db: Database,
+        backup_dir: str = 'data/backups',
+        pages: int = Database.DEFAULT_BACKUP_PAGES,
+        sleep_ms: float = Database.DEFAULT_BACKUP_SLEEP_MS,
+        compress: bool = True
+    ):
+        """
+        初始化備份管理
+
+        Args:
+            db: 資料庫實例
+            backup_dir: 備份目錄
+            pages: 每步複製的頁面數
+            sleep_ms: 每步之間的暫停時間 (毫秒)
+            compress: 是否以 gzip 壓縮
+        """
+        self.db = db
+        self.backup_dir = backup_dir
+        self.pages = pages
+        self.sleep_ms = sleep_ms
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._jobs: 'OrderedDict[str, BackupJob]' = OrderedDict()
+        self._running: Optional[BackupJob] = None
+
+    def start(self) -> BackupJob:
+        """
+        在背景開始備份
+
+        Returns:
+            BackupJob
+
+        Raises:
+            RuntimeError: 已有備份正在執行
+        """
+        with self._lock:
+            if self._running is not None:
+                raise RuntimeError(f"備份正在執行: {self._running.id}")
+
+            filename = f"bot_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]}.db"
+            if self.compress:
+                filename += '.gz'
+            job = BackupJob(os.path.join(self.backup_dir, filename))
+            self._running = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.MAX_JOBS:
+                self._jobs.popitem(last=False)
+
+        thread = threading.Thread(target=self._run, args=(job,), daemon=True, name=f"DBBackup-{job.id}")
+        thread.start()
+        return job
+
+    def _run(self, job: BackupJob):
+        """背景執行備份"""
+        try:
+            job.result = self.db.backup(
+                job.path,
+                pages=self.pages,
+                sleep_ms=self.sleep_ms,
+                compress=self.compress,
+                progress=job._on_progress
+            )
+            if self.db.state is not self.db:
+                # 配額與佇列位於獨立的狀態資料庫,以相同時間戳記另存一份
+                state_path = os.path.join(
+                    os.path.dirname(job.path),
+                    os.path.basename(job.path).replace('bot_', 'state_', 1)
+                )
+                job.result['state'] = self.db.state.backup(
+                    state_path,
+                    pages=self.pages,
+                    sleep_ms=self.sleep_ms,
+                    compress=self.compress
+                )
+            job.status = 'done'
+        except Exception as e:
+            logger.exception(f"資料庫備份失敗: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now()
+            with self._lock:
+                self._running = None
+
+    def get_job(self, job_id: str) -> Optional[BackupJob]:
+        """根據 ID 獲取備份工作"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_jobs(self) -> List[BackupJob]:
+        """獲取最近的備份工作 (新到舊)"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+
+# 全域備份管理 (未設定時為 None)
+_manager: Optional[BackupManager] = None
+
+
+def configure_backup(db: Optional[Database] = None, **kwargs) -> BackupManager:
+    """
+    設定全域備份管理
+
+    Args:
+        db: 資料庫實例 (預設使用全域實例)
+        **kwargs: 傳給 BackupManager 的參數
+
+    Returns:
+        BackupManager 實例
+    """
+    global _manager
+    _manager = BackupManager(db or get_db(), **kwargs)
+    return _manager
+
+
+def get_backup_manager() -> Optional[BackupManager]:
+    """獲取全域備份管理,未設定時返回 None"""
+    return _manager
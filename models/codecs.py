@@ -0,0 +1,77 @@
+"""
+欄位壓縮格式
+- 壓縮後的值存為 BLOB,第一個位元組標記格式 (1: zlib, 2: zstd),其後為壓縮資料
+- TEXT 值表示未壓縮;content / metadata 原本只存 TEXT,因此 BLOB 一定是壓縮過的值
+- 不依賴其他模型模組,資料庫連接在建立時註冊 inflate() SQL 函數
+"""
+import zlib
+from typing import Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # 選用套件,未安裝時只能使用 zlib
+    zstandard = None
+
+# 壓縮格式標記 (BLOB 的第一個位元組)
+CODECS = {'zlib': 1, 'zstd': 2}
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def require_codec(codec: str):
+    """
+    確認壓縮格式可用
+
+    Raises:
+        ValueError: 不支援的格式或未安裝 zstandard
+    """
+    if codec not in CODECS:
+        raise ValueError(f"不支援的壓縮格式: {codec}")
+    if codec == 'zstd' and zstandard is None:
+        raise ValueError("zstd 壓縮需要安裝 zstandard 套件 (pip install zstandard)")
+
+
+def compress_text(text: str, codec: str = 'zlib') -> bytes:
+    """
+    壓縮文字
+
+    Args:
+        text: 原始文字
+        codec: 'zlib' 或 'zstd'
+
+    Returns:
+        含格式標記的壓縮資料
+
+    Raises:
+        ValueError: 不支援的格式
+    """
+    require_codec(codec)
+    raw = text.encode('utf-8')
+    if codec == 'zstd':
+        return bytes((CODECS['zstd'],)) + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return bytes((CODECS['zlib'],)) + zlib.compress(raw, ZLIB_LEVEL)
+
+
+def inflate(value: Union[str, bytes, None]) -> Optional[str]:
+    """
+    還原可能已壓縮的欄位值
+
+    Args:
+        value: 資料庫中的值 (TEXT 原樣返回,BLOB 依格式標記解壓縮)
+
+    Returns:
+        原始文字
+
+    Raises:
+        ValueError: 無法辨識的格式標記或未安裝 zstandard
+    """
+    if not isinstance(value, bytes):
+        return value
+    codec, payload = value[0], value[1:]
+    if codec == CODECS['zlib']:
+        return zlib.decompress(payload).decode('utf-8')
+    if codec == CODECS['zstd']:
+        require_codec('zstd')
+        return zstandard.ZstdDecompressor().decompress(payload).decode('utf-8')
+    raise ValueError(f"無法辨識的壓縮格式標記: {codec}")
@@ -0,0 +1,292 @@
+"""
+訊息內容壓縮模組
+- 超過大小門檻的 content / metadata 以 zlib 或 zstd 壓縮後存為 BLOB (格式見 codecs)
+- 模型在 from_db_row 解壓縮;SQL 以 inflate() 函數讀取 (全文索引、LIKE 搜尋、封存)
+- 背景作業分批壓縮啟用前寫入的舊訊息
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, Union
+from .codecs import CODECS, compress_text, inflate, require_codec
+from .database import Database, get_db
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MIN_BYTES = 512
+
+
+def _size(value: Union[str, bytes, None]) -> int:
+    """欄位值在資料庫中的位元組數"""
+    if value is None:
+        return 0
+    return len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+
+
+class Compression:
+    """壓縮設定: 只壓縮超過門檻且確實變小的值"""
+
+    def __init__(self, codec: str = 'zlib', min_bytes: int = DEFAULT_MIN_BYTES):
+        """
+        初始化壓縮設定
+
+        Args:
+            codec: 'zlib' 或 'zstd'
+            min_bytes: 原始 UTF-8 長度達到此值才壓縮
+
+        Raises:
+            ValueError: 不支援的格式或未安裝 zstandard
+        """
+        require_codec(codec)
+        self.codec = codec
+        self.min_bytes = max(1, min_bytes)
+
+    def encode(self, value: Optional[str]) -> Union[str, bytes, None]:
+        """
+        依設定壓縮欄位值
+
+        Args:
+            value: 原始文字
+
+        Returns:
+            壓縮後的 BLOB,未達門檻或壓縮後沒有變小時返回原值
+        """
+        if value is None or len(value) * 4 < self.min_bytes:
+            # UTF-8 每個字元最多 4 位元組,確定不足門檻時不需編碼
+            return value
+        raw = value.encode('utf-8')
+        if len(raw) < self.min_bytes:
+            return value
+        packed = compress_text(value, self.codec)
+        return packed if len(packed) < len(raw) else value
+
+
+# 全域壓縮設定 (未設定時不壓縮)
+_compression: Optional[Compression] = None
+
+
+def configure_compression(codec: Optional[str], min_bytes: int = DEFAULT_MIN_BYTES) -> Optional[Compression]:
+    """
+    設定全域壓縮
+
+    Args:
+        codec: 'zlib'、'zstd',None 或空字串表示停用
+        min_bytes: 壓縮門檻 (位元組)
+
+    Returns:
+        Compression 實例,停用時返回 None
+    """
+    global _compression
+    _compression = Compression(codec, min_bytes) if codec else None
+    return _compression
+
+
+def get_compression() -> Optional[Compression]:
+    """獲取全域壓縮設定,未啟用時返回 None"""
+    return _compression
+
+
+class Recompressor:
+    """分批壓縮既有訊息的背景作業"""
+
+    def __init__(
+        self,
+        db: Database,
+        compression: Compression,
+        batch_size: int = 500,
+        pause_ms: float = 50.0
+    ):
+        """
+        初始化背景壓縮
+
+        Args:
+            db: 資料庫實例
+            compression: 壓縮設定
+            batch_size: 每批涵蓋的 rowid 範圍 (每批一個交易)
+            pause_ms: 批次之間的暫停時間 (毫秒)
+        """
+        self.db = db
+        self.compression = compression
+        self.batch_size = max(1, batch_size)
+        self.pause_ms = pause_ms
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats: Dict[str, Any] = {
+            'runs': 0,
+            'rows_total': 0,
+            'saved_bytes_total': 0,
+            'last_run': None,
+            'last_result': {},
+        }
+
+    def _needs_encoding(self) -> str:
+        """找出需要處理的值: 達到門檻的 TEXT,或以其他格式壓縮的 BLOB"""
+        marker = f"{CODECS[self.compression.codec]:02X}"
+        return " OR ".join(
+            f"(typeof({column}) = 'text' AND length(CAST({column} AS BLOB)) >= {int(self.compression.min_bytes)})"
+            f" OR (typeof({column}) = 'blob' AND hex(substr({column}, 1, 1)) != '{marker}')"
+            for column in ('content', 'metadata')
+        )
+
+    def run(self) -> Dict[str, Any]:
+        """
+        壓縮所有符合條件的既有訊息
+
+        以 rowid 範圍分批讀取並更新,寫入鎖持有時間與資料表大小無關;
+        內容不變的更新不會觸發全文索引重建。
+
+        Returns:
+            {'rows', 'batches', 'bytes_before', 'bytes_after', 'elapsed_ms'}
+        """
+        if not self._lock.acquire(blocking=False):
+            logger.info("背景壓縮進行中,略過本次")
+            return {}
+
+        try:
+            started = time.monotonic()
+            rows = batches = bytes_before = bytes_after = 0
+            condition = self._needs_encoding()
+
+            with self.db.get_cursor() as cursor:
+                cursor.execute("SELECT MIN(id), MAX(id) FROM messages")
+                low, upper_id = cursor.fetchone()
+
+            while upper_id is not None and low is not None and low <= upper_id:
+                if self._stop_event.is_set():
+                    logger.info("背景壓縮已中止")
+                    break
+
+                high = min(low + self.batch_size, upper_id + 1)
+                with self.db.get_cursor() as cursor:
+                    cursor.execute(f"""
+                        SELECT id, content, metadata FROM messages
+                        WHERE id >= ? AND id < ? AND ({condition})
+                    """, (low, high))
+                    updates = []
+                    for message_id, content, metadata in cursor.fetchall():
+                        new_content = self.compression.encode(inflate(content))
+                        new_metadata = self.compression.encode(inflate(metadata))
+                        bytes_before += _size(content) + _size(metadata)
+                        bytes_after += _size(new_content) + _size(new_metadata)
+                        updates.append((new_content, new_metadata, message_id))
+                    if updates:
+                        cursor.executemany("""
+                            UPDATE messages SET content = ?, metadata = ?
+                            WHERE id = ?
+                        """, updates)
+                        rows += len(updates)
+                    # 跳過 rowid 空洞
+                    cursor.execute("SELECT MIN(id) FROM messages WHERE id >= ?", (high,))
+                    low = cursor.fetchone()[0]
+                batches += 1
+
+                if self.pause_ms > 0:
+                    self._stop_event.wait(self.pause_ms / 1000)
+
+            result = {
+                'rows': rows,
+                'batches': batches,
+                'bytes_before': bytes_before,
+                'bytes_after': bytes_after,
+                'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+            }
+            self._stats['runs'] += 1
+            self._stats['rows_total'] += rows
+            self._stats['saved_bytes_total'] += bytes_before - bytes_after
+            self._stats['last_run'] = datetime.now().isoformat()
+            self._stats['last_result'] = result
+            if rows:
+                logger.info(
+                    f"壓縮 {rows} 則訊息 ({bytes_before} -> {bytes_after} 位元組, "
+                    f"{batches} 批, {result['elapsed_ms']} ms)"
+                )
+            return result
+        finally:
+            self._lock.release()
+
+    # ==================== 排程 ====================
+
+    def start(self, interval_hours: float = 24.0):
+        """
+        啟動背景壓縮排程 (啟動後先執行一次)
+
+        Args:
+            interval_hours: 執行間隔 (小時)
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while True:
+                try:
+                    self.run()
+                except Exception as e:
+                    logger.exception(f"背景壓縮失敗: {e}")
+                if self._stop_event.wait(interval_hours * 3600):
+                    break
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=run, daemon=True, name="Recompressor")
+        self._thread.start()
+        logger.info(f"背景壓縮已啟動 ({self.compression.codec}, 每 {interval_hours} 小時)")
+
+    def stop(self):
+        """停止背景壓縮 (進行中的作業會在目前批次結束後中止)"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取壓縮統計資訊
+
+        Returns:
+            統計資訊字典
+        """
+        stats = dict(self._stats)
+        stats['codec'] = self.compression.codec
+        stats['min_bytes'] = self.compression.min_bytes
+        return stats
+
+
+# 全域背景壓縮 (未啟動時為 None)
+_recompressor: Optional[Recompressor] = None
+
+
+def start_recompressor(
+    db: Optional[Database] = None,
+    interval_hours: float = 24.0,
+    **kwargs
+) -> Optional[Recompressor]:
+    """
+    啟動全域背景壓縮 (需先以 configure_compression 啟用壓縮)
+
+    Args:
+        db: 資料庫實例 (預設使用全域實例)
+        interval_hours: 執行間隔 (小時)
+        **kwargs: 傳給 Recompressor 的參數
+
+    Returns:
+        Recompressor 實例,未啟用壓縮時返回 None
+    """
+    global _recompressor
+    if _recompressor is None and _compression is not None:
+        _recompressor = Recompressor(db or get_db(), _compression, **kwargs)
+        _recompressor.start(interval_hours)
+    return _recompressor
+
+
+def get_recompressor() -> Optional[Recompressor]:
+    """獲取全域背景壓縮,未啟動時返回 None"""
+    return _recompressor
+
+
+def stop_recompressor():
+    """停止全域背景壓縮"""
+    global _recompressor
+    if _recompressor is not None:
+        _recompressor.stop()
+        _recompressor = None
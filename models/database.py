@@ -1,33 +1,770 @@
 """
 資料庫管理模組
-- SQLite 連接管理
+- SQLite 連接池 (WAL 模式)
 - 資料庫初始化
 - 遷移管理
 """
 import sqlite3
 import os
-from typing import Optional
+import gzip
+import shutil
+import queue
+import asyncio
+import functools
+import threading
+import time
+from urllib.request import pathname2url
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
 from contextlib import contextmanager
 from utils.logger import get_logger
+from .codecs import inflate
+from .keys import KeyCache
+from .timestamps import NOW_MS_SQL, iso_to_epoch_ms
 
 logger = get_logger(__name__)
 
 
+# 可放在獨立狀態資料庫的資料表 (配額與待處理佇列,見 StateDatabase)
+STATE_TABLES = ('quotas', 'system_quotas', 'queued_messages')
+
+# 預設系統配額: (quota_type, limit_count, reset_period)
+DEFAULT_SYSTEM_QUOTAS = (
+    ('line_monthly', 500, 'monthly'),
+    ('gemini_rpm', 30, 'minute'),
+)
+
+
+class QueryTimeoutError(sqlite3.OperationalError):
+    """唯讀查詢超過時間限制而被中斷"""
+
+
+def fts5_trigram_available(cursor) -> bool:
+    """檢查 SQLite 是否支援 FTS5 trigram 分詞器 (SQLite 3.34+)"""
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x, tokenize='trigram')")
+        cursor.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _migrate_messages_fts(cursor):
+    """
+    建立訊息全文索引
+
+    使用 trigram 分詞器,不依賴空白分詞,適用於繁體中文。
+    以 messages 為外部內容表,由觸發器保持同步。
+    """
+    if not fts5_trigram_available(cursor):
+        logger.warning("SQLite 不支援 FTS5 trigram,訊息搜尋將使用 LIKE")
+        return
+
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content,
+            content='messages',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+    """)
+    _create_messages_fts_triggers(cursor)
+    # 為既有訊息建立索引
+    cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+def _create_messages_fts_triggers(cursor):
+    """
+    建立讓 messages_fts 與 messages 保持同步的觸發器
+
+    內容可能已壓縮 (見 compression),以 inflate() 還原後再寫入索引;
+    只改變壓縮方式的更新不會重建索引。
+    """
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, inflate(new.content));
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.id, inflate(old.content));
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages
+        WHEN inflate(old.content) IS NOT inflate(new.content) BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.id, inflate(old.content));
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, inflate(new.content));
+        END
+    """)
+
+
+def _migrate_compressed_content(cursor):
+    """
+    讓全文索引讀取還原後的訊息內容
+
+    content / metadata 可能以壓縮的 BLOB 儲存,外部內容表改為 messages_text 檢視
+    (snippet() 與 'rebuild' 透過它讀取原文),觸發器改為寫入 inflate() 的結果。
+    """
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS messages_text AS
+        SELECT id, inflate(content) AS content FROM messages
+    """)
+    cursor.execute("""
+        SELECT 1 FROM sqlite_master
+        WHERE type = 'table' AND name = 'messages_fts'
+    """)
+    if cursor.fetchone() is None:
+        return
+
+    for trigger in ('messages_fts_insert', 'messages_fts_delete', 'messages_fts_update'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE messages_fts")
+    cursor.execute("""
+        CREATE VIRTUAL TABLE messages_fts USING fts5(
+            content,
+            content='messages_text',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+    """)
+    _create_messages_fts_triggers(cursor)
+    cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+def _migrate_rollups(cursor):
+    """
+    建立統計彙總表
+
+    - row_counts: users/messages/chat_history/quotas (依平台) 的資料列數,刪除時同步遞減
+    - message_counts_hourly / message_counts_daily: 依平台與群組的訊息時間桶,
+      記錄收到的訊息數,刪除或封存舊訊息不會改變歷史圖表
+
+    由觸發器在寫入時維護,統計查詢只需讀取 O(桶數) 的資料列。
+    users 使用 INSERT OR REPLACE,需搭配 recursive_triggers 才會觸發刪除計數。
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS row_counts (
+            name TEXT NOT NULL,
+            platform TEXT NOT NULL DEFAULT '',
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, platform)
+        ) WITHOUT ROWID
+    """)
+    for table, bucket in (('message_counts_hourly', 'hour'), ('message_counts_daily', 'day')):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {bucket} TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                group_id TEXT NOT NULL DEFAULT '',
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY ({bucket}, platform, group_id)
+            ) WITHOUT ROWID
+        """)
+
+    upsert_count = """
+        INSERT INTO row_counts (name, platform, count) VALUES ({name}, {platform}, {delta})
+        ON CONFLICT (name, platform) DO UPDATE SET count = count + excluded.count;
+    """
+    created_at = "COALESCE(new.created_at, datetime('now', 'localtime'))"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rollup_messages_insert AFTER INSERT ON messages BEGIN
+            {upsert_count.format(name="'messages'", platform='new.platform', delta=1)}
+            INSERT INTO message_counts_hourly (hour, platform, group_id, count)
+            VALUES (strftime('%Y-%m-%d %H:00', {created_at}), new.platform, COALESCE(new.group_id, ''), 1)
+            ON CONFLICT (hour, platform, group_id) DO UPDATE SET count = count + 1;
+            INSERT INTO message_counts_daily (day, platform, group_id, count)
+            VALUES (date({created_at}), new.platform, COALESCE(new.group_id, ''), 1)
+            ON CONFLICT (day, platform, group_id) DO UPDATE SET count = count + 1;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rollup_messages_delete AFTER DELETE ON messages BEGIN
+            {upsert_count.format(name="'messages'", platform='old.platform', delta=-1)}
+        END
+    """)
+    for table in ('chat_history', 'quotas'):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS rollup_{table}_insert AFTER INSERT ON {table} BEGIN
+                {upsert_count.format(name=f"'{table}'", platform="''", delta=1)}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS rollup_{table}_delete AFTER DELETE ON {table} BEGIN
+                {upsert_count.format(name=f"'{table}'", platform="''", delta=-1)}
+            END
+        """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rollup_users_insert AFTER INSERT ON users BEGIN
+            {upsert_count.format(name="'users'", platform='new.platform', delta=1)}
+            {upsert_count.format(name="'active_users'", platform='new.platform', delta='(new.is_active != 0)')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rollup_users_delete AFTER DELETE ON users BEGIN
+            {upsert_count.format(name="'users'", platform='old.platform', delta=-1)}
+            {upsert_count.format(name="'active_users'", platform='old.platform', delta='-(old.is_active != 0)')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS rollup_users_update AFTER UPDATE OF platform, is_active ON users BEGIN
+            {upsert_count.format(name="'users'", platform='old.platform', delta=-1)}
+            {upsert_count.format(name="'active_users'", platform='old.platform', delta='-(old.is_active != 0)')}
+            {upsert_count.format(name="'users'", platform='new.platform', delta=1)}
+            {upsert_count.format(name="'active_users'", platform='new.platform', delta='(new.is_active != 0)')}
+        END
+    """)
+
+    # 以既有資料回填
+    cursor.execute("DELETE FROM row_counts")
+    cursor.execute("""
+        INSERT INTO row_counts (name, platform, count)
+        SELECT 'messages', platform, COUNT(*) FROM messages GROUP BY platform
+        UNION ALL
+        SELECT 'users', platform, COUNT(*) FROM users GROUP BY platform
+        UNION ALL
+        SELECT 'active_users', platform, SUM(is_active != 0) FROM users GROUP BY platform
+        UNION ALL
+        SELECT 'chat_history', '', COUNT(*) FROM chat_history
+        UNION ALL
+        SELECT 'quotas', '', COUNT(*) FROM quotas
+    """)
+    cursor.execute("DELETE FROM message_counts_hourly")
+    cursor.execute("""
+        INSERT INTO message_counts_hourly (hour, platform, group_id, count)
+        SELECT strftime('%Y-%m-%d %H:00', created_at), platform, COALESCE(group_id, ''), COUNT(*)
+        FROM messages WHERE created_at IS NOT NULL
+        GROUP BY 1, 2, 3
+    """)
+    cursor.execute("DELETE FROM message_counts_daily")
+    cursor.execute("""
+        INSERT INTO message_counts_daily (day, platform, group_id, count)
+        SELECT substr(hour, 1, 10), platform, group_id, SUM(count)
+        FROM message_counts_hourly
+        GROUP BY 1, 2, 3
+    """)
+
+
+# 各表的時間欄位 (以整數 epoch 毫秒儲存)
+TIMESTAMP_COLUMNS = {
+    'users': ('created_at', 'updated_at'),
+    'messages': ('created_at',),
+    'chat_history': ('created_at',),
+    'quotas': ('last_reset', 'created_at', 'updated_at'),
+    'system_quotas': ('last_reset', 'updated_at'),
+    'group_mappings': ('created_at', 'updated_at'),
+    'queued_messages': ('created_at',),
+}
+
+
+def _migrate_epoch_timestamps(cursor):
+    """
+    將時間欄位由 ISO 字串轉為整數 epoch 毫秒
+
+    SQLite 欄位為動態型別,直接以整數覆寫即可,不需重建表 (重建需停用外鍵
+    並重建全文索引與觸發器)。整數比較讓範圍查詢可以使用索引,
+    也避免不同 ISO 格式 ('T' 與空白分隔) 之間的字串比較錯誤。
+    """
+    cursor.connection.create_function('iso_to_epoch_ms', 1, iso_to_epoch_ms, deterministic=True)
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        assignments = ', '.join(f"{column} = iso_to_epoch_ms({column})" for column in columns)
+        condition = ' OR '.join(f"typeof({column}) = 'text'" for column in columns)
+        cursor.execute(f"UPDATE {table} SET {assignments} WHERE {condition}")
+        logger.info(f"轉換 {table} 時間欄位: {cursor.rowcount} 筆")
+
+    # 統計彙總的時間桶改由 epoch 毫秒計算 (本地時間)
+    local_time = f"COALESCE(new.created_at, {NOW_MS_SQL}) / 1000, 'unixepoch', 'localtime'"
+    cursor.execute("DROP TRIGGER IF EXISTS rollup_messages_insert")
+    cursor.execute(f"""
+        CREATE TRIGGER rollup_messages_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO row_counts (name, platform, count) VALUES ('messages', new.platform, 1)
+            ON CONFLICT (name, platform) DO UPDATE SET count = count + 1;
+            INSERT INTO message_counts_hourly (hour, platform, group_id, count)
+            VALUES (strftime('%Y-%m-%d %H:00', {local_time}), new.platform, COALESCE(new.group_id, ''), 1)
+            ON CONFLICT (hour, platform, group_id) DO UPDATE SET count = count + 1;
+            INSERT INTO message_counts_daily (day, platform, group_id, count)
+            VALUES (date({local_time}), new.platform, COALESCE(new.group_id, ''), 1)
+            ON CONFLICT (day, platform, group_id) DO UPDATE SET count = count + 1;
+        END
+    """)
+
+
+def _migrate_incremental_vacuum(cursor):
+    """
+    檢查增量 auto-vacuum
+
+    新資料庫建立時即啟用 (見 Database._create_connection)。既有資料庫需要一次完整 VACUUM
+    才能切換模式,大型資料庫會長時間持有獨佔鎖,因此不在啟動時執行,
+    改由管理者以 python -m models.vacuum --enable-incremental 明確執行。
+    """
+    cursor.execute("PRAGMA auto_vacuum")
+    if cursor.fetchone()[0] != 2:
+        logger.warning(
+            "資料庫未啟用增量 auto-vacuum,空間回收排程不會回收頁面;"
+            "請於離峰時段執行 python -m models.vacuum --enable-incremental"
+        )
+
+
+def _create_keyed_rollup_triggers(cursor):
+    """
+    建立以整數鍵表示平台與群組的統計彙總觸發器
+
+    彙總表仍以平台名稱與群組 ID 字串為鍵 (資料列很少),
+    觸發器以字典表的主鍵查出字串後累加。
+    """
+    upsert_count = """
+        INSERT INTO row_counts (name, platform, count) VALUES ({name}, {platform}, {delta})
+        ON CONFLICT (name, platform) DO UPDATE SET count = count + excluded.count;
+    """
+    new_platform = "(SELECT name FROM platforms WHERE id = new.platform_key)"
+    old_platform = "(SELECT name FROM platforms WHERE id = old.platform_key)"
+    new_group = "COALESCE((SELECT group_id FROM chat_groups WHERE id = new.group_key), '')"
+    local_time = f"COALESCE(new.created_at, {NOW_MS_SQL}) / 1000, 'unixepoch', 'localtime'"
+
+    cursor.execute(f"""
+        CREATE TRIGGER rollup_messages_insert AFTER INSERT ON messages BEGIN
+            {upsert_count.format(name="'messages'", platform=new_platform, delta=1)}
+            INSERT INTO message_counts_hourly (hour, platform, group_id, count)
+            VALUES (strftime('%Y-%m-%d %H:00', {local_time}), {new_platform}, {new_group}, 1)
+            ON CONFLICT (hour, platform, group_id) DO UPDATE SET count = count + 1;
+            INSERT INTO message_counts_daily (day, platform, group_id, count)
+            VALUES (date({local_time}), {new_platform}, {new_group}, 1)
+            ON CONFLICT (day, platform, group_id) DO UPDATE SET count = count + 1;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER rollup_messages_delete AFTER DELETE ON messages BEGIN
+            {upsert_count.format(name="'messages'", platform=old_platform, delta=-1)}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER rollup_chat_history_insert AFTER INSERT ON chat_history BEGIN
+            {upsert_count.format(name="'chat_history'", platform="''", delta=1)}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER rollup_chat_history_delete AFTER DELETE ON chat_history BEGIN
+            {upsert_count.format(name="'chat_history'", platform="''", delta=-1)}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER rollup_users_insert AFTER INSERT ON users BEGIN
+            {upsert_count.format(name="'users'", platform=new_platform, delta=1)}
+            {upsert_count.format(name="'active_users'", platform=new_platform, delta='(new.is_active != 0)')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER rollup_users_delete AFTER DELETE ON users BEGIN
+            {upsert_count.format(name="'users'", platform=old_platform, delta=-1)}
+            {upsert_count.format(name="'active_users'", platform=old_platform, delta='-(old.is_active != 0)')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER rollup_users_update AFTER UPDATE OF platform_key, is_active ON users BEGIN
+            {upsert_count.format(name="'users'", platform=old_platform, delta=-1)}
+            {upsert_count.format(name="'active_users'", platform=old_platform, delta='-(old.is_active != 0)')}
+            {upsert_count.format(name="'users'", platform=new_platform, delta=1)}
+            {upsert_count.format(name="'active_users'", platform=new_platform, delta='(new.is_active != 0)')}
+        END
+    """)
+
+
+def apply_message_rollups(cursor, after_id: int):
+    """
+    將 id 大於 after_id 的訊息一次累加到彙總表
+
+    結果與 rollup_messages_insert 觸發器逐列累加相同,
+    供暫停觸發器的批次匯入在載入完成後使用 (見 importer)。
+
+    Args:
+        cursor: 資料庫游標 (須在載入的同一交易中)
+        after_id: 載入前的最大訊息 id
+    """
+    local_time = f"COALESCE(m.created_at, {NOW_MS_SQL}) / 1000, 'unixepoch', 'localtime'"
+    source = """
+        FROM messages m
+        JOIN platforms p ON p.id = m.platform_key
+        LEFT JOIN chat_groups g ON g.id = m.group_key
+        WHERE m.id > ?
+    """
+    cursor.execute(f"""
+        INSERT INTO row_counts (name, platform, count)
+        SELECT 'messages', p.name, COUNT(*) {source}
+        GROUP BY p.name
+        ON CONFLICT (name, platform) DO UPDATE SET count = count + excluded.count
+    """, (after_id,))
+    cursor.execute(f"""
+        INSERT INTO message_counts_hourly (hour, platform, group_id, count)
+        SELECT strftime('%Y-%m-%d %H:00', {local_time}), p.name, COALESCE(g.group_id, ''), COUNT(*) {source}
+        GROUP BY 1, 2, 3
+        ON CONFLICT (hour, platform, group_id) DO UPDATE SET count = count + excluded.count
+    """, (after_id,))
+    cursor.execute(f"""
+        INSERT INTO message_counts_daily (day, platform, group_id, count)
+        SELECT date({local_time}), p.name, COALESCE(g.group_id, ''), COUNT(*) {source}
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day, platform, group_id) DO UPDATE SET count = count + excluded.count
+    """, (after_id,))
+
+
+def _migrate_surrogate_keys(cursor):
+    """
+    以整數代理鍵取代重複的字串 ID
+
+    - platforms / chat_groups: 平台名稱與群組 ID 的字典表
+    - users: 新增 INTEGER PRIMARY KEY (沿用原 rowid,游標不受影響),platform 改為 platform_key
+    - messages: user_id / platform / group_id 改為 user_key / platform_key / group_key
+    - chat_history: user_id 改為 user_key
+    - user_rows / message_rows: 以字典表還原字串欄位的檢視,查詢結果與原本的欄位相同
+
+    SQLite 無法修改欄位型別,需以新表複製後改名 (重建期間必須停用外鍵,
+    而 PRAGMA foreign_keys 在交易中無效,因此此遷移自行管理交易)。
+    訊息與全文索引的 id 不變,全文索引只需重建觸發器。
+    配額表仍以 user_id 參照 users (可能位於獨立的狀態資料庫,見 StateDatabase)。
+    """
+    cursor.execute("PRAGMA table_info(users)")
+    if any(column['name'] == 'platform_key' for column in cursor.fetchall()):
+        return
+
+    cursor.execute("PRAGMA foreign_keys = OFF")
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS platforms (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_groups (
+                id INTEGER PRIMARY KEY,
+                group_id TEXT NOT NULL UNIQUE
+            )
+        """)
+        cursor.execute("""
+            INSERT OR IGNORE INTO platforms (name)
+            SELECT platform FROM users UNION SELECT platform FROM messages
+        """)
+        cursor.execute("""
+            INSERT OR IGNORE INTO chat_groups (group_id)
+            SELECT DISTINCT group_id FROM messages WHERE group_id IS NOT NULL AND group_id != ''
+        """)
+
+        # 使用者
+        cursor.execute(f"""
+            CREATE TABLE users_new (
+                id INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL UNIQUE,
+                platform_key INTEGER NOT NULL REFERENCES platforms (id),
+                display_name TEXT,
+                created_at INTEGER DEFAULT ({NOW_MS_SQL}),
+                updated_at INTEGER DEFAULT ({NOW_MS_SQL}),
+                is_active BOOLEAN DEFAULT 1,
+                metadata TEXT
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO users_new
+            (id, user_id, platform_key, display_name, created_at, updated_at, is_active, metadata)
+            SELECT u.rowid, u.user_id, p.id, u.display_name, u.created_at, u.updated_at, u.is_active, u.metadata
+            FROM users u JOIN platforms p ON p.name = u.platform
+        """)
+        # 外鍵停用時寫入的訊息可能沒有對應的使用者,補上最小的使用者資料
+        cursor.execute("""
+            INSERT OR IGNORE INTO users_new (user_id, platform_key, created_at, updated_at)
+            SELECT m.user_id, p.id, MIN(m.created_at), MIN(m.created_at)
+            FROM messages m JOIN platforms p ON p.name = m.platform
+            WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.user_id = m.user_id)
+            GROUP BY m.user_id
+        """)
+
+        # 訊息 (保留 AUTOINCREMENT 的序號,已刪除的 id 不會被重複使用)
+        cursor.execute("SELECT name, seq FROM sqlite_sequence WHERE name IN ('messages', 'chat_history')")
+        sequences = dict(cursor.fetchall())
+        cursor.execute(f"""
+            CREATE TABLE messages_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT UNIQUE,
+                user_key INTEGER NOT NULL REFERENCES users (id),
+                platform_key INTEGER NOT NULL REFERENCES platforms (id),
+                group_key INTEGER REFERENCES chat_groups (id),
+                content TEXT,
+                message_type TEXT DEFAULT 'text',
+                created_at INTEGER DEFAULT ({NOW_MS_SQL}),
+                metadata TEXT
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO messages_new
+            (id, message_id, user_key, platform_key, group_key, content, message_type, created_at, metadata)
+            SELECT m.id, m.message_id, u.id, p.id, g.id, m.content, m.message_type, m.created_at, m.metadata
+            FROM messages m
+            JOIN users_new u ON u.user_id = m.user_id
+            JOIN platforms p ON p.name = m.platform
+            LEFT JOIN chat_groups g ON g.group_id = m.group_id
+            ORDER BY m.id
+        """)
+        logger.info(f"轉換 messages: {cursor.rowcount} 筆")
+
+        # 對話歷史 (沒有平台資訊,無法補上不存在的使用者)
+        cursor.execute(f"""
+            CREATE TABLE chat_history_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_key INTEGER NOT NULL REFERENCES users (id),
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at INTEGER DEFAULT ({NOW_MS_SQL})
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO chat_history_new (id, user_key, role, content, created_at)
+            SELECT h.id, u.id, h.role, h.content, h.created_at
+            FROM chat_history h JOIN users_new u ON u.user_id = h.user_id
+            ORDER BY h.id
+        """)
+        copied = cursor.rowcount
+        cursor.execute("SELECT COUNT(*) FROM chat_history")
+        orphaned = cursor.fetchone()[0] - copied
+        if orphaned:
+            logger.warning(f"捨棄 {orphaned} 筆沒有對應使用者的對話歷史")
+
+        # 刪除舊表 (一併刪除其索引與觸發器) 後改名
+        for table in ('messages', 'chat_history', 'users'):
+            cursor.execute(f"DROP TABLE {table}")
+            cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        for table, seq in sequences.items():
+            cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, table))
+
+        for statement in (
+            "CREATE INDEX idx_users_platform_active_created ON users (platform_key, is_active, created_at DESC)",
+            "CREATE INDEX idx_users_active_created ON users (is_active, created_at DESC)",
+            "CREATE INDEX idx_messages_created_at ON messages (created_at DESC)",
+            "CREATE INDEX idx_messages_user_created ON messages (user_key, created_at DESC)",
+            "CREATE INDEX idx_messages_group_created ON messages (group_key, created_at DESC)",
+            "CREATE INDEX idx_messages_platform_created ON messages (platform_key, created_at DESC)",
+            "CREATE INDEX idx_chat_history_user_id ON chat_history (user_key, created_at DESC)",
+            "CREATE INDEX idx_chat_history_created_at ON chat_history (created_at)",
+        ):
+            cursor.execute(statement)
+
+        _create_keyed_rollup_triggers(cursor)
+        cursor.execute("""
+            SELECT 1 FROM sqlite_master
+            WHERE type = 'table' AND name = 'messages_fts'
+        """)
+        if cursor.fetchone() is not None:
+            _create_messages_fts_triggers(cursor)
+
+        # 補上的使用者與捨棄的對話歷史會改變計數
+        cursor.execute("DELETE FROM row_counts WHERE name IN ('users', 'active_users', 'chat_history')")
+        cursor.execute("""
+            INSERT INTO row_counts (name, platform, count)
+            SELECT 'users', p.name, COUNT(*) FROM users u JOIN platforms p ON p.id = u.platform_key GROUP BY p.name
+            UNION ALL
+            SELECT 'active_users', p.name, SUM(u.is_active != 0)
+            FROM users u JOIN platforms p ON p.id = u.platform_key GROUP BY p.name
+            UNION ALL
+            SELECT 'chat_history', '', COUNT(*) FROM chat_history
+        """)
+
+        cursor.execute("""
+            CREATE VIEW user_rows AS
+            SELECT u.id AS row_key, u.user_id, p.name AS platform, u.display_name,
+                   u.created_at, u.updated_at, u.is_active, u.metadata
+            FROM users u
+            JOIN platforms p ON p.id = u.platform_key
+        """)
+        cursor.execute("""
+            CREATE VIEW message_rows AS
+            SELECT m.id, m.message_id, u.user_id, p.name AS platform, g.group_id,
+                   m.content, m.message_type, m.created_at, m.metadata
+            FROM messages m
+            JOIN users u ON u.id = m.user_key
+            JOIN platforms p ON p.id = m.platform_key
+            LEFT JOIN chat_groups g ON g.id = m.group_key
+        """)
+
+        cursor.execute("PRAGMA foreign_key_check")
+        violations = cursor.fetchall()
+        if violations:
+            raise sqlite3.IntegrityError(f"代理鍵轉換後有 {len(violations)} 筆外鍵錯誤")
+        cursor.execute("COMMIT")
+    except Exception:
+        if cursor.connection.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    finally:
+        cursor.execute("PRAGMA foreign_keys = ON")
+
+
+# 資料庫遷移: (版本, 說明, 步驟[, 是否使用交易])
+# 步驟可為 SQL 字串或接收游標的函數,同一遷移中的步驟在單一交易內執行;
+# 無法在交易中執行的步驟 (例如 VACUUM) 需將第四個欄位設為 False
+MIGRATIONS = [
+    (2, 'Composite indexes for model queries', [
+        # (user_id) / (group_id) 單欄索引由含排序欄位的複合索引取代
+        "DROP INDEX IF EXISTS idx_messages_user_id",
+        "DROP INDEX IF EXISTS idx_messages_group_id",
+        """
+        CREATE INDEX IF NOT EXISTS idx_messages_user_created
+        ON messages (user_id, created_at DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_messages_group_created
+        ON messages (group_id, created_at DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_messages_platform_created
+        ON messages (platform, created_at DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_users_platform_active_created
+        ON users (platform, is_active, created_at DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_users_active_created
+        ON users (is_active, created_at DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_quotas_updated_at
+        ON quotas (updated_at DESC)
+        """,
+    ]),
+    (3, 'FTS5 trigram index for message search', [
+        _migrate_messages_fts,
+    ]),
+    (4, 'Trigger-maintained rollup tables for stats', [
+        _migrate_rollups,
+    ]),
+    (5, 'Integer epoch-millisecond timestamps', [
+        _migrate_epoch_timestamps,
+    ]),
+    (6, 'Incremental auto-vacuum', [
+        _migrate_incremental_vacuum,
+    ], False),
+    (7, 'Retention index for chat history', [
+        # 保留引擎以 created_at 找出需要清理的 rowid 上限
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_history_created_at
+        ON chat_history (created_at)
+        """,
+    ]),
+    (8, 'Integer surrogate keys for users, platforms and groups', [
+        _migrate_surrogate_keys,
+    ], False),
+    (9, 'Full-text index over decompressed message content', [
+        _migrate_compressed_content,
+    ]),
+    (10, 'Checkpoints for Discord history backfill', [
+        # 每個頻道已回補到的最後一則訊息 (Discord snowflake),與該頁訊息在同一交易中更新
+        f"""
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            channel_id TEXT PRIMARY KEY,
+            last_message_id INTEGER NOT NULL,
+            messages INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER DEFAULT ({NOW_MS_SQL})
+        )
+        """,
+    ]),
+]
+
+
 class Database:
     """資料庫管理類"""
 
-    def __init__(self, db_path: str = 'data/bot.db'):
+    # 連接池預設值
+    DEFAULT_POOL_SIZE = 8
+    DEFAULT_BUSY_TIMEOUT = 10.0       # 秒
+    DEFAULT_CACHE_SIZE_KB = 16384     # 每個連接 16 MB 頁面快取
+    DEFAULT_MMAP_SIZE_MB = 128
+
+    # 唯讀連接池預設值 (儀表板與統計查詢)
+    DEFAULT_READ_POOL_SIZE = 4
+    DEFAULT_READ_TIMEOUT = 5.0        # 秒
+    READ_PROGRESS_STEPS = 1000        # 每執行多少個 VM 指令檢查一次是否逾時
+
+    # 線上備份預設值
+    DEFAULT_BACKUP_PAGES = 256        # 每步複製的頁面數 (預設頁面 4 KB,即每步 1 MB)
+    DEFAULT_BACKUP_SLEEP_MS = 20
+
+    def __init__(
+        self,
+        db_path: str = 'data/bot.db',
+        pool_size: int = DEFAULT_POOL_SIZE,
+        busy_timeout: float = DEFAULT_BUSY_TIMEOUT,
+        cache_size_kb: int = DEFAULT_CACHE_SIZE_KB,
+        mmap_size_mb: int = DEFAULT_MMAP_SIZE_MB,
+        read_pool_size: int = DEFAULT_READ_POOL_SIZE,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        state_path: Optional[str] = None
+    ):
         """
         初始化資料庫
 
         Args:
             db_path: 資料庫檔案路徑
+            pool_size: 連接池最大連接數
+            busy_timeout: 等待鎖與取得連接的超時時間 (秒)
+            cache_size_kb: 每個連接的頁面快取大小 (KB)
+            mmap_size_mb: 記憶體映射 I/O 大小 (MB)
+            read_pool_size: 唯讀連接池最大連接數
+            read_timeout: 唯讀查詢的預設時間限制 (秒)
+            state_path: 配額與佇列的獨立資料庫檔案 (None 或與 db_path 相同表示不分離)
         """
         self.db_path = db_path
+        self.pool_size = max(1, pool_size)
+        self.busy_timeout = busy_timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size_mb = mmap_size_mb
+        self.read_pool_size = max(1, read_pool_size)
+        self.read_timeout = read_timeout
         self._ensure_db_directory()
-        self._connection: Optional[sqlite3.Connection] = None
+
+        # 閒置連接 (LIFO,讓熱快取的連接優先被重用)
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._read_idle: queue.LifoQueue = queue.LifoQueue()
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+        self._trace_callback: Optional[Callable[[str], None]] = None
+        self._has_fts: Optional[bool] = None
+        self._pool_stats: Dict[str, Any] = {
+            'created': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'timeouts': 0,
+        }
+        self._read_pool_stats: Dict[str, Any] = {
+            'created': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'timeouts': 0,
+            'query_timeouts': 0,
+        }
+        # 平台與群組的整數鍵快取
+        self.keys = KeyCache(self)
+
         self.init_database()
 
+        # 配額與佇列所在的資料庫 (未分離時為自己)
+        self.state: Database = self
+        if state_path and os.path.abspath(state_path) != os.path.abspath(db_path):
+            self.state = StateDatabase(
+                state_path,
+                source=self,
+                pool_size=pool_size,
+                busy_timeout=busy_timeout,
+                cache_size_kb=cache_size_kb,
+                mmap_size_mb=mmap_size_mb,
+                read_pool_size=read_pool_size,
+                read_timeout=read_timeout
+            )
+
     def _ensure_db_directory(self):
         """確保資料庫目錄存在"""
         db_dir = os.path.dirname(self.db_path)
@@ -35,24 +772,230 @@ class Database:
             os.makedirs(db_dir)
             logger.info(f"建立資料庫目錄: {db_dir}")
 
-    def get_connection(self) -> sqlite3.Connection:
+    def _create_connection(self) -> sqlite3.Connection:
         """
-        獲取資料庫連接
+        建立並設定新的資料庫連接
 
         Returns:
             SQLite 連接物件
         """
-        if self._connection is None:
-            self._connection = sqlite3.connect(
-                self.db_path,
-                check_same_thread=False,
-                timeout=10.0
+        new_file = not os.path.exists(self.db_path) or os.path.getsize(self.db_path) == 0
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            timeout=self.busy_timeout
+        )
+        conn.row_factory = sqlite3.Row
+        if new_file:
+            # 新資料庫在寫入第一頁 (包含切換 WAL) 前設定才會生效,之後切換需要完整 VACUUM
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # WAL: 讀取不會阻塞寫入,寫入也不會阻塞讀取
+        conn.execute("PRAGMA journal_mode = WAL")
+        # WAL 模式下 NORMAL 已足夠安全,且每次提交不需 fsync
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size_mb) * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        # 啟用外鍵約束
+        conn.execute("PRAGMA foreign_keys = ON")
+        # INSERT OR REPLACE 刪除舊資料列時也觸發刪除觸發器 (統計彙總表依賴此行為)
+        conn.execute("PRAGMA recursive_triggers = ON")
+        # 還原壓縮欄位 (全文索引觸發器、搜尋與封存使用)
+        conn.create_function('inflate', 1, inflate, deterministic=True)
+        logger.debug(f"建立資料庫連接: {self.db_path}")
+        return conn
+
+    def _create_read_connection(self) -> sqlite3.Connection:
+        """
+        建立唯讀連接
+
+        以 mode=ro 開啟並設定 query_only,任何寫入都會失敗;
+        WAL 模式下讀取使用快照,不會阻塞寫入也不會被寫入阻塞。
+
+        Returns:
+            SQLite 連接物件
+        """
+        uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            check_same_thread=False,
+            timeout=self.busy_timeout
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size_mb) * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        conn.create_function('inflate', 1, inflate, deterministic=True)
+        logger.debug(f"建立唯讀資料庫連接: {self.db_path}")
+        return conn
+
+    def _acquire(self, readonly: bool = False) -> sqlite3.Connection:
+        """
+        從連接池取出連接,池滿時等待其他執行緒歸還
+
+        Args:
+            readonly: 是否從唯讀連接池取出
+        """
+        if readonly:
+            idle, stats, size, factory = (
+                self._read_idle, self._read_pool_stats, self.read_pool_size, self._create_read_connection
+            )
+        else:
+            idle, stats, size, factory = (
+                self._idle, self._pool_stats, self.pool_size, self._create_connection
             )
-            self._connection.row_factory = sqlite3.Row
-            # 啟用外鍵約束
-            self._connection.execute("PRAGMA foreign_keys = ON")
-            logger.debug(f"建立資料庫連接: {self.db_path}")
-        return self._connection
+
+        try:
+            conn = idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._pool_lock:
+                if stats['created'] < size:
+                    stats['created'] += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = factory()
+                except Exception:
+                    with self._pool_lock:
+                        stats['created'] -= 1
+                    raise
+            else:
+                start = time.perf_counter()
+                try:
+                    conn = idle.get(timeout=self.busy_timeout)
+                except queue.Empty:
+                    with self._pool_lock:
+                        stats['timeouts'] += 1
+                    raise sqlite3.OperationalError("資料庫連接池已耗盡")
+                finally:
+                    with self._pool_lock:
+                        stats['waits'] += 1
+                        stats['wait_time_ms'] += (time.perf_counter() - start) * 1000
+
+        with self._pool_lock:
+            stats['checkouts'] += 1
+        return conn
+
+    def _release(self, conn: sqlite3.Connection, readonly: bool = False):
+        """將連接歸還連接池"""
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            with self._pool_lock:
+                (self._read_pool_stats if readonly else self._pool_stats)['created'] -= 1
+            return
+        (self._read_idle if readonly else self._idle).put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        從連接池借出連接 (上下文管理器)
+
+        同一執行緒內的巢狀呼叫會共用同一個連接,
+        最外層結束時才歸還連接池。
+
+        Yields:
+            SQLite 連接物件
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.depth += 1
+            try:
+                yield conn
+            except sqlite3.OperationalError as e:
+                timeout_error = self._query_timeout_error(e)
+                if timeout_error is None:
+                    raise
+                raise timeout_error from e
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        conn.set_trace_callback(self._trace_callback)
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._release(conn)
+
+    @contextmanager
+    def read_only(self, timeout: Optional[float] = None):
+        """
+        以唯讀連接執行區塊內的查詢 (上下文管理器)
+
+        區塊內的 connection() / get_cursor() 會改用唯讀連接池的連接,
+        統計與儀表板查詢不會佔用寫入連接;每個查詢在 WAL 快照上執行。
+        已持有連接時 (例如在寫入交易中) 沿用原連接,才能讀到尚未提交的資料。
+
+        Args:
+            timeout: 區塊內查詢的總時間限制 (秒),None 使用 read_timeout,0 表示不限
+
+        Raises:
+            QueryTimeoutError: 查詢超過時間限制
+        """
+        if getattr(self._local, 'conn', None) is not None:
+            with self.connection():
+                yield
+            return
+
+        timeout = self.read_timeout if timeout is None else timeout
+        conn = self._acquire(readonly=True)
+        conn.set_trace_callback(self._trace_callback)
+        deadline = time.monotonic() + timeout if timeout else None
+        if deadline is not None:
+            # 回傳非 0 值會中斷目前的查詢 (sqlite3.OperationalError: interrupted)
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, self.READ_PROGRESS_STEPS)
+        self._local.conn = conn
+        self._local.depth = 1
+        self._local.read_deadline = (deadline, timeout)
+        try:
+            yield
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._local.read_deadline = None
+            conn.set_progress_handler(None, 0)
+            self._release(conn, readonly=True)
+
+    def _query_timeout_error(self, error: sqlite3.OperationalError) -> Optional[QueryTimeoutError]:
+        """
+        判斷錯誤是否為唯讀查詢逾時造成的中斷
+
+        Args:
+            error: 查詢拋出的錯誤
+
+        Returns:
+            對應的 QueryTimeoutError,不是逾時則返回 None
+        """
+        deadline, timeout = getattr(self._local, 'read_deadline', None) or (None, None)
+        if isinstance(error, QueryTimeoutError) or deadline is None:
+            return None
+        if 'interrupted' not in str(error) or time.monotonic() <= deadline:
+            return None
+        with self._pool_lock:
+            self._read_pool_stats['query_timeouts'] += 1
+        return QueryTimeoutError(f"唯讀查詢超過 {timeout} 秒")
+
+    def set_trace_callback(self, callback: Optional[Callable[[str], None]]):
+        """
+        設定 SQL 追蹤回呼,套用於之後借出的所有連接
+
+        Args:
+            callback: 接收已展開參數的 SQL 字串,None 表示停用
+        """
+        self._trace_callback = callback
 
     @contextmanager
     def get_cursor(self):
@@ -62,38 +1005,39 @@ class Database:
         Yields:
             SQLite 游標
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            yield cursor
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"資料庫操作失敗: {e}")
-            raise
-        finally:
-            cursor.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"資料庫操作失敗: {e}")
+                raise
+            finally:
+                cursor.close()
 
     def init_database(self):
         """初始化資料庫表結構"""
         logger.info("初始化資料庫表結構")
 
         with self.get_cursor() as cursor:
+            # users / messages / chat_history 在遷移 v8 改為整數鍵 (見 _migrate_surrogate_keys)
             # 使用者表
-            cursor.execute("""
+            cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS users (
                     user_id TEXT PRIMARY KEY,
                     platform TEXT NOT NULL,
                     display_name TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    created_at INTEGER DEFAULT ({NOW_MS_SQL}),
+                    updated_at INTEGER DEFAULT ({NOW_MS_SQL}),
                     is_active BOOLEAN DEFAULT 1,
                     metadata TEXT
                 )
             """)
 
             # 訊息表
-            cursor.execute("""
+            cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS messages (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     message_id TEXT UNIQUE,
@@ -102,34 +1046,26 @@ class Database:
                     group_id TEXT,
                     content TEXT,
                     message_type TEXT DEFAULT 'text',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    created_at INTEGER DEFAULT ({NOW_MS_SQL}),
                     metadata TEXT,
                     FOREIGN KEY (user_id) REFERENCES users (user_id)
                 )
             """)
 
-            # 建立訊息索引
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_messages_user_id
-                ON messages (user_id)
-            """)
+            # 建立訊息索引 (複合索引見 MIGRATIONS)
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_messages_created_at
                 ON messages (created_at DESC)
             """)
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_messages_group_id
-                ON messages (group_id)
-            """)
 
             # 對話歷史表
-            cursor.execute("""
+            cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS chat_history (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id TEXT NOT NULL,
                     role TEXT NOT NULL,
                     content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    created_at INTEGER DEFAULT ({NOW_MS_SQL}),
                     FOREIGN KEY (user_id) REFERENCES users (user_id)
                 )
             """)
@@ -141,7 +1077,7 @@ class Database:
             """)
 
             # 配額表
-            cursor.execute("""
+            cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS quotas (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id TEXT NOT NULL,
@@ -149,9 +1085,9 @@ class Database:
                     usage_count INTEGER DEFAULT 0,
                     limit_count INTEGER NOT NULL,
                     reset_period TEXT NOT NULL,
-                    last_reset TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_reset INTEGER DEFAULT ({NOW_MS_SQL}),
+                    created_at INTEGER DEFAULT ({NOW_MS_SQL}),
+                    updated_at INTEGER DEFAULT ({NOW_MS_SQL}),
                     FOREIGN KEY (user_id) REFERENCES users (user_id),
                     UNIQUE (user_id, quota_type, reset_period)
                 )
@@ -164,49 +1100,47 @@ class Database:
             """)
 
             # 系統配額表 (全域配額)
-            cursor.execute("""
+            cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS system_quotas (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     quota_type TEXT UNIQUE NOT NULL,
                     usage_count INTEGER DEFAULT 0,
                     limit_count INTEGER NOT NULL,
                     reset_period TEXT NOT NULL,
-                    last_reset TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    last_reset INTEGER DEFAULT ({NOW_MS_SQL}),
+                    updated_at INTEGER DEFAULT ({NOW_MS_SQL})
                 )
             """)
 
             # 初始化系統配額
-            cursor.execute("""
+            cursor.executemany("""
                 INSERT OR IGNORE INTO system_quotas
                 (quota_type, usage_count, limit_count, reset_period)
-                VALUES
-                ('line_monthly', 0, 500, 'monthly'),
-                ('gemini_rpm', 0, 30, 'minute')
-            """)
+                VALUES (?, 0, ?, ?)
+            """, DEFAULT_SYSTEM_QUOTAS)
 
             # 群組配對表
-            cursor.execute("""
+            cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS group_mappings (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     discord_channel_id TEXT NOT NULL,
                     line_group_id TEXT NOT NULL,
                     name TEXT,
                     is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    created_at INTEGER DEFAULT ({NOW_MS_SQL}),
+                    updated_at INTEGER DEFAULT ({NOW_MS_SQL}),
                     UNIQUE (discord_channel_id, line_group_id)
                 )
             """)
 
             # 待處理訊息佇列
-            cursor.execute("""
+            cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS queued_messages (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     source_platform TEXT NOT NULL,
                     source_user_name TEXT NOT NULL,
                     content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    created_at INTEGER DEFAULT ({NOW_MS_SQL}),
                     status TEXT NOT NULL DEFAULT 'queued'
                 )
             """)
@@ -230,39 +1164,291 @@ class Database:
                 VALUES (1, 'Initial schema')
             """)
 
+        self._apply_migrations()
         logger.info("資料庫初始化完成")
 
+    @property
+    def has_fts(self) -> bool:
+        """是否已建立訊息全文索引"""
+        if self._has_fts is None:
+            with self.get_cursor() as cursor:
+                cursor.execute("""
+                    SELECT 1 FROM sqlite_master
+                    WHERE type = 'table' AND name = 'messages_fts'
+                """)
+                self._has_fts = cursor.fetchone() is not None
+        return self._has_fts
+
+    def get_schema_version(self) -> int:
+        """
+        獲取目前的資料庫結構版本
+
+        Returns:
+            版本號
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            return cursor.fetchone()[0]
+
+    def _apply_migrations(self):
+        """依版本順序套用尚未執行的遷移 (每個遷移一個交易,標記為不使用交易者除外)"""
+        current = self.get_schema_version()
+        for version, description, steps, *options in MIGRATIONS:
+            if version <= current:
+                continue
+            transactional = options[0] if options else True
+
+            with self.get_cursor() as cursor:
+                # 取得寫入鎖後再確認一次,避免多個程序重複套用
+                if transactional:
+                    cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                if cursor.fetchone()[0] >= version:
+                    continue
+
+                logger.info(f"套用資料庫遷移 v{version}: {description}")
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute("""
+                    INSERT INTO schema_version (version, description)
+                    VALUES (?, ?)
+                """, (version, description))
+            current = version
+
+    def database_for(self, table: str) -> 'Database':
+        """
+        獲取資料表所在的資料庫
+
+        Args:
+            table: 資料表名稱
+
+        Returns:
+            STATE_TABLES 中的資料表返回 state,其他返回自己
+        """
+        return self.state if table in STATE_TABLES else self
+
     def close(self):
-        """關閉資料庫連接"""
-        if self._connection:
-            self._connection.close()
-            self._connection = None
-            logger.info("資料庫連接已關閉")
+        """關閉連接池中的所有連接 (包含分離的狀態資料庫)"""
+        if self.state is not self:
+            self.state.close()
+        self._closed = True
+        closed = 0
+        while True:
+            try:
+                conn = self._read_idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._pool_lock:
+                self._read_pool_stats['created'] -= 1
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if closed == 0:
+                try:
+                    # 關閉前將 WAL 內容寫回主檔案
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                except sqlite3.Error as e:
+                    logger.warning(f"WAL checkpoint 失敗: {e}")
+            conn.close()
+            closed += 1
+        with self._pool_lock:
+            self._pool_stats['created'] -= closed
+        logger.info(f"資料庫連接已關閉 ({closed} 個)")
+
+    def get_pool_stats(self, readonly: bool = False) -> Dict[str, Any]:
+        """
+        獲取連接池統計資訊
+
+        Args:
+            readonly: 是否為唯讀連接池
+
+        Returns:
+            統計資訊字典
+        """
+        with self._pool_lock:
+            stats = dict(self._read_pool_stats if readonly else self._pool_stats)
+        stats['max_size'] = self.read_pool_size if readonly else self.pool_size
+        stats['idle'] = (self._read_idle if readonly else self._idle).qsize()
+        stats['in_use'] = max(0, stats['created'] - stats['idle'])
+        stats['wait_time_ms'] = round(stats['wait_time_ms'], 2)
+        return stats
 
     def vacuum(self):
-        """優化資料庫"""
+        """
+        優化資料庫 (完整 VACUUM)
+
+        會重寫整個資料庫並在執行期間持有獨佔鎖;
+        日常空間回收請使用 incremental_vacuum。
+        """
         logger.info("開始優化資料庫")
         with self.get_cursor() as cursor:
             cursor.execute("VACUUM")
         logger.info("資料庫優化完成")
 
-    def backup(self, backup_path: str):
+    def incremental_vacuum_enabled(self) -> bool:
+        """是否已啟用增量 auto-vacuum (incremental_vacuum 才能回收頁面)"""
+        with self.get_cursor() as cursor:
+            cursor.execute("PRAGMA auto_vacuum")
+            return cursor.fetchone()[0] == 2
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        將既有資料庫切換為增量 auto-vacuum
+
+        需要一次完整 VACUUM,執行期間持有獨佔鎖 (大型資料庫可能需要數分鐘),
+        請於離峰時段或停止橋接服務後執行。
+
+        Returns:
+            是否進行了切換 (已啟用時返回 False)
+        """
+        if self.incremental_vacuum_enabled():
+            return False
+        logger.warning("切換為增量 auto-vacuum,開始執行完整 VACUUM")
+        start = time.perf_counter()
+        with self.get_cursor() as cursor:
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+        logger.info(f"已切換為增量 auto-vacuum ({time.perf_counter() - start:.1f} 秒)")
+        return True
+
+    def incremental_vacuum(self, max_pages: int = 0) -> int:
         """
-        備份資料庫
+        回收最多 max_pages 個空閒頁面 (需啟用增量 auto-vacuum)
+
+        每次只持有寫入鎖一小段時間,不會阻塞訊息寫入太久。
+
+        Args:
+            max_pages: 回收的頁面上限 (0 表示全部)
+
+        Returns:
+            實際回收的頁面數
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute("PRAGMA freelist_count")
+            before = cursor.fetchone()[0]
+            if before == 0:
+                return 0
+            # execute() 對無欄位的語句只執行一步 (只回收一頁),executescript 會執行到結束
+            cursor.executescript(f"PRAGMA incremental_vacuum({int(max_pages)})")
+            cursor.execute("PRAGMA freelist_count")
+            freed = before - cursor.fetchone()[0]
+        if freed:
+            logger.debug(f"增量回收 {freed} 個頁面")
+        return freed
+
+    def get_space_stats(self) -> Dict[str, Any]:
+        """
+        獲取空間使用統計
+
+        Returns:
+            page_size, page_count, freelist_count, free_percent, auto_vacuum
+        """
+        with self.get_cursor() as cursor:
+            cursor.execute("PRAGMA page_size")
+            page_size = cursor.fetchone()[0]
+            cursor.execute("PRAGMA page_count")
+            page_count = cursor.fetchone()[0]
+            cursor.execute("PRAGMA freelist_count")
+            freelist_count = cursor.fetchone()[0]
+            cursor.execute("PRAGMA auto_vacuum")
+            auto_vacuum = cursor.fetchone()[0]
+        return {
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_count': freelist_count,
+            'free_bytes': freelist_count * page_size,
+            # 空閒頁面比例,可作為碎片化程度的指標
+            'free_percent': round(freelist_count / page_count * 100, 2) if page_count else 0.0,
+            'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(auto_vacuum, str(auto_vacuum)),
+        }
+
+    def backup(
+        self,
+        backup_path: str,
+        pages: int = DEFAULT_BACKUP_PAGES,
+        sleep_ms: float = DEFAULT_BACKUP_SLEEP_MS,
+        compress: bool = False,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        以 SQLite 線上備份 API 備份資料庫
+
+        每次複製 pages 個頁面後暫停 sleep_ms,讓其他連接可以繼續讀寫。
+        備份期間在來源連接上保持讀取交易: WAL 模式下不會阻塞寫入,
+        並讓備份對應單一一致的快照 (否則其他連接寫入時備份會從頭重來)。
 
         Args:
             backup_path: 備份檔案路徑
+            pages: 每步複製的頁面數 (<= 0 表示一次複製全部)
+            sleep_ms: 每步之間的暫停時間 (毫秒)
+            compress: 是否以 gzip 壓縮 (串流寫入,不需將整個檔案載入記憶體)
+            progress: 進度回呼 progress(已複製頁數, 總頁數)
+
+        Returns:
+            備份結果 (path, size_bytes, pages, elapsed_ms, compressed)
         """
         logger.info(f"備份資料庫到: {backup_path}")
-        import shutil
+        start = time.perf_counter()
 
         # 確保備份目錄存在
         backup_dir = os.path.dirname(backup_path)
         if backup_dir and not os.path.exists(backup_dir):
             os.makedirs(backup_dir)
 
-        shutil.copy2(self.db_path, backup_path)
-        logger.info("資料庫備份完成")
+        # 先寫入暫存檔,完成後再改名,避免留下不完整的備份
+        # (壓縮時資料庫副本另存一個暫存檔,壓縮結果寫入 .tmp)
+        temp_path = f"{backup_path}.tmp"
+        copy_path = f"{backup_path}.raw.tmp" if compress else temp_path
+        total_pages = 0
+
+        def on_progress(status: int, remaining: int, total: int):
+            nonlocal total_pages
+            total_pages = total
+            if progress is not None:
+                progress(total - remaining, total)
+
+        source = sqlite3.connect(self.db_path, isolation_level=None, timeout=self.busy_timeout)
+        target = sqlite3.connect(copy_path)
+        try:
+            source.execute("BEGIN")
+            source.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+            source.backup(target, pages=pages if pages > 0 else -1, progress=on_progress, sleep=sleep_ms / 1000)
+            source.execute("COMMIT")
+        except Exception:
+            target.close()
+            os.remove(copy_path)
+            raise
+        finally:
+            source.close()
+        target.close()
+
+        if compress:
+            try:
+                with open(copy_path, 'rb') as raw, gzip.open(temp_path, 'wb', compresslevel=6) as packed:
+                    shutil.copyfileobj(raw, packed, 1024 * 1024)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            finally:
+                os.remove(copy_path)
+        os.replace(temp_path, backup_path)
+
+        result = {
+            'path': backup_path,
+            'size_bytes': os.path.getsize(backup_path),
+            'pages': total_pages,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+            'compressed': compress,
+        }
+        logger.info(f"資料庫備份完成 ({result['pages']} 頁, {result['elapsed_ms']} ms)")
+        return result
 
     def get_stats(self) -> dict:
         """
@@ -274,52 +1460,311 @@ class Database:
         with self.get_cursor() as cursor:
             stats = {}
 
-            # 使用者數量
-            cursor.execute("SELECT COUNT(*) FROM users")
-            stats['total_users'] = cursor.fetchone()[0]
-
-            # 訊息數量
-            cursor.execute("SELECT COUNT(*) FROM messages")
-            stats['total_messages'] = cursor.fetchone()[0]
-
-            # 對話歷史數量
-            cursor.execute("SELECT COUNT(*) FROM chat_history")
-            stats['total_chat_history'] = cursor.fetchone()[0]
+            # 使用者、訊息、對話歷史數量 (讀取統計彙總表)
+            cursor.execute("""
+                SELECT name, SUM(count) FROM row_counts
+                WHERE name IN ('users', 'messages', 'chat_history')
+                GROUP BY name
+            """)
+            counts = dict(cursor.fetchall())
+            stats['total_users'] = counts.get('users', 0)
+            stats['total_messages'] = counts.get('messages', 0)
+            stats['total_chat_history'] = counts.get('chat_history', 0)
 
             # 群組配對數量
             cursor.execute("SELECT COUNT(*) FROM group_mappings WHERE is_active = 1")
             stats['active_group_mappings'] = cursor.fetchone()[0]
 
+            cursor.execute("PRAGMA journal_mode")
+            stats['journal_mode'] = cursor.fetchone()[0]
+
             # 資料庫大小
             stats['db_size_bytes'] = os.path.getsize(self.db_path)
             stats['db_size_mb'] = round(stats['db_size_bytes'] / 1024 / 1024, 2)
+            wal_path = f"{self.db_path}-wal"
+            stats['wal_size_bytes'] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+
+        # 空間使用與連接池狀態
+        stats['space'] = self.get_space_stats()
+        stats['pool'] = self.get_pool_stats()
+        stats['read_pool'] = self.get_pool_stats(readonly=True)
+
+        if self.state is not self:
+            state_wal_path = f"{self.state.db_path}-wal"
+            stats['state'] = {
+                'path': self.state.db_path,
+                'size_bytes': os.path.getsize(self.state.db_path),
+                'wal_size_bytes': os.path.getsize(state_wal_path) if os.path.exists(state_wal_path) else 0,
+                'pool': self.state.get_pool_stats(),
+            }
 
         return stats
 
 
+class StateDatabase(Database):
+    """
+    配額與待處理佇列的獨立資料庫
+
+    使用自己的檔案、WAL 與連接池: 配額更新只需要這個檔案的寫入鎖,
+    不會排在訊息與對話歷史的寫入 (寫入緩衝批次、保留清理) 後面等待。
+    兩個檔案之間沒有跨檔案交易,quotas.user_id 也不再有外鍵約束。
+    """
+
+    # 狀態資料庫的結構版本
+    IMPORT_VERSION = 2
+
+    def __init__(self, db_path: str, source: Optional[Database] = None, **kwargs):
+        """
+        初始化狀態資料庫
+
+        Args:
+            db_path: 狀態資料庫檔案路徑
+            source: 主資料庫 (第一次分離時由此匯入既有的配額與佇列)
+            **kwargs: 傳給 Database 的連接池參數
+        """
+        self._source = source
+        super().__init__(db_path, **kwargs)
+
+    def init_database(self):
+        """初始化狀態資料庫表結構 (不套用主資料庫的遷移)"""
+        logger.info(f"初始化狀態資料庫: {self.db_path}")
+
+        with self.get_cursor() as cursor:
+            # 配額表 (使用者在主資料庫,無法建立跨檔案外鍵)
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS quotas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    quota_type TEXT NOT NULL,
+                    usage_count INTEGER DEFAULT 0,
+                    limit_count INTEGER NOT NULL,
+                    reset_period TEXT NOT NULL,
+                    last_reset INTEGER DEFAULT ({NOW_MS_SQL}),
+                    created_at INTEGER DEFAULT ({NOW_MS_SQL}),
+                    updated_at INTEGER DEFAULT ({NOW_MS_SQL}),
+                    UNIQUE (user_id, quota_type, reset_period)
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_quotas_user_type
+                ON quotas (user_id, quota_type)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_quotas_updated_at
+                ON quotas (updated_at DESC)
+            """)
+
+            # 系統配額表
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS system_quotas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    quota_type TEXT UNIQUE NOT NULL,
+                    usage_count INTEGER DEFAULT 0,
+                    limit_count INTEGER NOT NULL,
+                    reset_period TEXT NOT NULL,
+                    last_reset INTEGER DEFAULT ({NOW_MS_SQL}),
+                    updated_at INTEGER DEFAULT ({NOW_MS_SQL})
+                )
+            """)
+            cursor.executemany("""
+                INSERT OR IGNORE INTO system_quotas
+                (quota_type, usage_count, limit_count, reset_period)
+                VALUES (?, 0, ?, ?)
+            """, DEFAULT_SYSTEM_QUOTAS)
+
+            # 待處理訊息佇列
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS queued_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source_platform TEXT NOT NULL,
+                    source_user_name TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at INTEGER DEFAULT ({NOW_MS_SQL}),
+                    status TEXT NOT NULL DEFAULT 'queued'
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_queued_messages_status
+                ON queued_messages (status, created_at)
+            """)
+
+            # 配額資料列數 (與主資料庫的 row_counts 相同格式)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS row_counts (
+                    name TEXT NOT NULL,
+                    platform TEXT NOT NULL DEFAULT '',
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (name, platform)
+                ) WITHOUT ROWID
+            """)
+            for event, row, delta in (('INSERT', 'new', 1), ('DELETE', 'old', -1)):
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS rollup_quotas_{event.lower()} AFTER {event} ON quotas BEGIN
+                        INSERT INTO row_counts (name, platform, count) VALUES ('quotas', '', {delta})
+                        ON CONFLICT (name, platform) DO UPDATE SET count = count + excluded.count;
+                    END
+                """)
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    description TEXT
+                )
+            """)
+            cursor.execute("""
+                INSERT OR IGNORE INTO schema_version (version, description)
+                VALUES (1, 'Initial state schema')
+            """)
+
+        if self._source is not None and self.get_schema_version() < self.IMPORT_VERSION:
+            self._import_from(self._source)
+        logger.info("狀態資料庫初始化完成")
+
+    def _import_from(self, source: Database):
+        """
+        第一次分離時複製主資料庫中的配額與佇列
+
+        主資料庫的資料表保持不變 (可作為切換前的紀錄),之後不再寫入。
+
+        Args:
+            source: 主資料庫
+        """
+        with source.get_cursor() as cursor:
+            cursor.execute("SELECT * FROM quotas")
+            quotas = cursor.fetchall()
+            cursor.execute("SELECT * FROM system_quotas")
+            system_quotas = cursor.fetchall()
+            cursor.execute("SELECT * FROM queued_messages")
+            queued = cursor.fetchall()
+
+        with self.get_cursor() as cursor:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            if cursor.fetchone()[0] >= self.IMPORT_VERSION:
+                return
+            for table, rows, verb in (
+                ('quotas', quotas, 'INSERT OR IGNORE'),
+                # 覆寫剛建立的預設系統配額,保留既有的用量與上限
+                ('system_quotas', system_quotas, 'INSERT OR REPLACE'),
+                ('queued_messages', queued, 'INSERT OR IGNORE'),
+            ):
+                if not rows:
+                    continue
+                columns = rows[0].keys()
+                cursor.executemany(f"""
+                    {verb} INTO {table} ({', '.join(columns)})
+                    VALUES ({', '.join('?' for _ in columns)})
+                """, [tuple(row) for row in rows])
+            cursor.execute("""
+                INSERT INTO schema_version (version, description)
+                VALUES (?, 'Imported state tables from main database')
+            """, (self.IMPORT_VERSION,))
+        logger.info(
+            f"已匯入狀態資料: 配額 {len(quotas)} 筆, 系統配額 {len(system_quotas)} 筆, "
+            f"佇列 {len(queued)} 筆"
+        )
+
+
 # 全域資料庫實例
 _db_instance: Optional[Database] = None
+_db_lock = threading.Lock()
 
+# 專用資料庫執行緒池 (供 async 程式碼使用)
+_db_executor: Optional[ThreadPoolExecutor] = None
 
-def get_db(db_path: str = 'data/bot.db') -> Database:
+
+def get_db(db_path: str = 'data/bot.db', **kwargs) -> Database:
     """
-    獲取全域資料庫實例
+    獲取全域資料庫實例 (執行緒安全)
 
     Args:
         db_path: 資料庫路徑
+        **kwargs: 首次建立時傳給 Database 的連接池參數
 
     Returns:
         Database 實例
     """
     global _db_instance
     if _db_instance is None:
-        _db_instance = Database(db_path)
+        with _db_lock:
+            if _db_instance is None:
+                _db_instance = Database(db_path, **kwargs)
     return _db_instance
 
 
+def get_db_executor() -> ThreadPoolExecutor:
+    """
+    獲取資料庫專用執行緒池
+
+    執行緒數與連接池大小一致,避免執行緒等待連接。
+
+    Returns:
+        ThreadPoolExecutor 實例
+    """
+    global _db_executor
+    if _db_executor is None:
+        with _db_lock:
+            if _db_executor is None:
+                workers = _db_instance.pool_size if _db_instance else Database.DEFAULT_POOL_SIZE
+                _db_executor = ThreadPoolExecutor(
+                    max_workers=workers,
+                    thread_name_prefix='db'
+                )
+    return _db_executor
+
+
+async def run_in_db(func: Callable, *args, **kwargs):
+    """
+    在資料庫執行緒池中執行同步的資料庫操作
+
+    讓事件迴圈 (例如 discord.py) 在資料庫緩慢時不被阻塞。
+
+    Args:
+        func: 同步函數
+        *args: 位置參數
+        **kwargs: 關鍵字參數
+
+    Returns:
+        函數返回值
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_db_executor(),
+        functools.partial(func, *args, **kwargs)
+    )
+
+
+async def run_read_only(func: Callable, *args, **kwargs):
+    """
+    在資料庫執行緒池中以唯讀連接執行同步查詢
+
+    供統計等較重的查詢使用,不佔用寫入連接。
+
+    Args:
+        func: 同步函數
+        *args: 位置參數
+        **kwargs: 關鍵字參數
+
+    Returns:
+        函數返回值
+
+    Raises:
+        QueryTimeoutError: 查詢超過時間限制
+    """
+    def run():
+        with get_db().read_only():
+            return func(*args, **kwargs)
+    return await run_in_db(run)
+
+
 def close_db():
     """關閉全域資料庫連接"""
-    global _db_instance
-    if _db_instance:
-        _db_instance.close()
-        _db_instance = None
+    global _db_instance, _db_executor
+    with _db_lock:
+        if _db_executor:
+            _db_executor.shutdown(wait=True)
+            _db_executor = None
+        if _db_instance:
+            _db_instance.close()
+            _db_instance = None
@@ -0,0 +1,505 @@
+"""
+批次匯入歷史訊息
+- 解析 LINE 匯出的聊天記錄 (.txt) 與本系統匯出的 NDJSON (見 api/export)
+- 串流讀取,以大批次 executemany 寫入,message_id 重複的訊息略過
+- 可暫停次要索引、全文索引與彙總觸發器,載入後一次重建 (整個匯入為單一交易)
+
+使用方式:
+    python -m models.importer line chat.txt --group C1234567890      # LINE 聊天記錄
+    python -m models.importer ndjson messages.ndjson.gz              # NDJSON (可為 gzip)
+    python -m models.importer ndjson dump.ndjson --db data/bot.db --no-defer
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import re
+import sys
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterable, Iterator, List, TextIO
+from .compression import get_compression
+from .database import Database, get_db, apply_message_rollups
+from .known_users import get_known_users
+from .recent import invalidate_recent_buffer
+from .rows import encode_metadata
+from .timestamps import now_ms, to_epoch_ms
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+# ==================== LINE 聊天記錄 ====================
+
+# 日期行: 2024/01/14（日）、2024.01.14 星期日、Sun, 1/14/2024
+_LINE_DATE = re.compile(r'^(\d{4})[/.-](\d{1,2})[/.-](\d{1,2})(?:\s*\S*)?$')
+_LINE_DATE_EN = re.compile(r'^[A-Za-z]{3}\w*,\s*(\d{1,2})/(\d{1,2})/(\d{4})$')
+# 時間欄位: 10:15、下午3:05、3:05 PM
+_LINE_TIME = re.compile(r'^(上午|下午|午前|午後)?\s*(\d{1,2}):(\d{2})\s*([AaPp][Mm])?$')
+
+# 匯出檔中的非文字訊息 → message_type
+LINE_PLACEHOLDERS = {
+    '[貼圖]': 'sticker', '[Sticker]': 'sticker',
+    '[照片]': 'image', '[圖片]': 'image', '[Photo]': 'image',
+    '[影片]': 'video', '[Video]': 'video',
+    '[語音訊息]': 'audio', '[Voice message]': 'audio', '[Audio]': 'audio',
+    '[檔案]': 'file', '[File]': 'file',
+    '[位置訊息]': 'location', '[Location]': 'location',
+}
+
+
+def _line_hour(prefix: Optional[str], hour: int, suffix: Optional[str]) -> int:
+    """將上午/下午或 AM/PM 的時間轉為 24 小時制"""
+    meridiem = (prefix or suffix or '').lower()
+    if meridiem in ('下午', '午後', 'pm') and hour < 12:
+        return hour + 12
+    if meridiem in ('上午', '午前', 'am') and hour == 12:
+        return 0
+    return hour
+
+
+def parse_line_export(
+    lines: Iterable[str],
+    group_id: str,
+    platform: str = 'line'
+) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    解析 LINE 匯出的聊天記錄
+
+    格式為日期行後接「時間<TAB>名稱<TAB>內容」,多行訊息以雙引號包住。
+    匯出檔只有顯示名稱,使用者 ID 以群組與名稱的雜湊產生;時間只到分鐘,
+    同一分鐘內依序加上毫秒以保留順序。message_id 由訊息內容決定,
+    重複匯入同一份 (或較新的) 記錄時已匯入的訊息會被略過。
+
+    Args:
+        lines: 文字行 (可為檔案物件)
+        group_id: 匯入的群組 ID
+        platform: 平台名稱
+
+    Yields:
+        訊息資料 (importer 的資料格式);系統訊息等無法匯入的行為 None
+    """
+    day: Optional[datetime] = None
+    pending: Optional[Dict[str, Any]] = None
+    in_quote = False
+    minute_key = None
+    minute_seq = 0
+    occurrences: Dict[tuple, int] = {}
+
+    def finish(message: Dict[str, Any]) -> Dict[str, Any]:
+        text = message['content']
+        if text.startswith('"') and text.endswith('"') and len(text) >= 2:
+            text = text[1:-1].replace('""', '"')
+        key = (message['created_at'] // 60000, message['sender'], text)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        digest = hashlib.sha1('\0'.join((group_id, str(key[0]), key[1], text, str(occurrence))).encode('utf-8'))
+        user_digest = hashlib.sha1(f"{group_id}\0{message['sender']}".encode('utf-8')).hexdigest()[:16]
+        return {
+            'message_id': f"line-import:{digest.hexdigest()[:24]}",
+            'user_id': f"line-import:{user_digest}",
+            'display_name': message['sender'],
+            'platform': platform,
+            'group_id': group_id,
+            'content': text,
+            'message_type': LINE_PLACEHOLDERS.get(text, 'text'),
+            'created_at': message['created_at'],
+            'metadata': encode_metadata({'source': 'line_export', 'sender': message['sender']}),
+        }
+
+    for raw in lines:
+        line = raw.rstrip('\r\n').lstrip('﻿')
+
+        if in_quote:
+            pending['content'] += '\n' + line
+            if line.endswith('"') and not line.endswith('""'):
+                in_quote = False
+            continue
+
+        parts = line.split('\t', 2)
+        time_match = _LINE_TIME.match(parts[0].strip()) if len(parts) > 1 else None
+        if time_match and day is not None:
+            if pending is not None:
+                yield finish(pending)
+                pending = None
+            if len(parts) < 3:
+                # 加入 / 退出群組、收回訊息等系統訊息
+                yield None
+                continue
+            prefix, hour, minute, suffix = time_match.groups()
+            stamp = day.replace(hour=_line_hour(prefix, int(hour), suffix), minute=int(minute))
+            if stamp != minute_key:
+                minute_key, minute_seq = stamp, 0
+            else:
+                minute_seq = min(minute_seq + 1, 59999)
+            pending = {
+                'sender': parts[1].strip(),
+                'content': parts[2],
+                'created_at': to_epoch_ms(stamp) + minute_seq,
+            }
+            in_quote = parts[2].startswith('"') and not (len(parts[2]) > 1 and parts[2].endswith('"'))
+            continue
+
+        date_match = _LINE_DATE.match(line.strip())
+        date_en_match = None if date_match else _LINE_DATE_EN.match(line.strip())
+        if date_match or date_en_match:
+            if pending is not None:
+                yield finish(pending)
+                pending = None
+            if date_match:
+                year, month, mday = (int(v) for v in date_match.groups())
+            else:
+                month, mday, year = (int(v) for v in date_en_match.groups())
+            day = datetime(year, month, mday)
+            continue
+
+        if pending is not None and line:
+            # 未加引號的多行訊息
+            pending['content'] += '\n' + line
+
+    if pending is not None:
+        yield finish(pending)
+
+
+# ==================== NDJSON ====================
+
+def _ndjson_time(value) -> Optional[int]:
+    """NDJSON 的 created_at: epoch 毫秒或 ISO 8601 (無時區時視為本地時間)"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str) and value:
+        return to_epoch_ms(datetime.fromisoformat(value))
+    return None
+
+
+def parse_ndjson(lines: Iterable[str]) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    解析 NDJSON 訊息 (與 /api/export/messages 的格式相同,id 欄位會被忽略)
+
+    Args:
+        lines: 文字行 (可為檔案物件)
+
+    Yields:
+        訊息資料;格式錯誤或缺少必要欄位的行為 None
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            metadata = record.get('metadata')
+            created_at = _ndjson_time(record.get('created_at'))
+            if not record['message_id'] or not record['user_id'] or not record['platform'] or created_at is None:
+                raise ValueError('missing message_id / user_id / platform / created_at')
+            yield {
+                'message_id': str(record['message_id']),
+                'user_id': str(record['user_id']),
+                'display_name': record.get('display_name'),
+                'platform': record['platform'],
+                'group_id': record.get('group_id') or None,
+                'content': record.get('content'),
+                'message_type': record.get('message_type') or 'text',
+                'created_at': created_at,
+                'metadata': metadata if isinstance(metadata, str) else encode_metadata(metadata),
+            }
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"NDJSON 第 {number} 行無法匯入: {e}")
+            yield None
+
+
+PARSERS = {
+    'line': parse_line_export,
+    'ndjson': parse_ndjson,
+}
+
+
+# ==================== 載入 ====================
+
+class BulkImporter:
+    """
+    批次匯入器 (SQLite)
+
+    defer_indexes=True 時整個匯入在單一 IMMEDIATE 交易中執行: 先移除 messages 的
+    次要索引與全文索引 / 彙總的插入觸發器,載入後重建索引並以集合運算補上全文索引與
+    彙總表。DDL 也在交易中,其他連接在提交前仍看到原本的索引與資料,失敗時全部回復;
+    但匯入期間其他寫入會等待 (適合新群組上線或離峰時段)。
+    defer_indexes=False 時每批一個交易,觸發器照常運作,寫入鎖持有時間與批次大小相關。
+    """
+
+    # 載入期間暫停的插入觸發器 (刪除與更新觸發器保留)
+    DEFERRED_TRIGGERS = ('messages_fts_insert', 'rollup_messages_insert')
+
+    # 已存在的使用者不覆寫 (匯入只補上缺少的使用者)
+    INSERT_USER_SQL = """
+        INSERT INTO users (user_id, platform_key, display_name, created_at, updated_at)
+        VALUES (?, (SELECT id FROM platforms WHERE name = ?), ?, ?, ?)
+        ON CONFLICT (user_id) DO NOTHING
+    """
+
+    # 平台與群組鍵在語句內以字典表的唯一索引解析 (不經過 KeyCache,避免巢狀提交)
+    INSERT_MESSAGE_SQL = """
+        INSERT OR IGNORE INTO messages
+        (message_id, user_key, platform_key, group_key, content, message_type, created_at, metadata)
+        VALUES (
+            ?,
+            (SELECT id FROM users WHERE user_id = ?),
+            (SELECT id FROM platforms WHERE name = ?),
+            (SELECT id FROM chat_groups WHERE group_id = ?),
+            ?, ?, ?, ?
+        )
+    """
+
+    def __init__(
+        self,
+        db: Optional[Database] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        defer_indexes: bool = True
+    ):
+        """
+        初始化匯入器
+
+        Args:
+            db: 資料庫實例 (預設使用全域實例)
+            batch_size: 每次 executemany 的訊息數
+            defer_indexes: 是否暫停索引與觸發器,載入後重建
+        """
+        self.db = db or get_db()
+        self.batch_size = max(1, batch_size)
+        self.defer_indexes = defer_indexes
+        self._platforms = set()
+        self._groups = set()
+        self._users = set()
+
+    def _suspend(self, cursor) -> List[tuple]:
+        """移除 messages 的次要索引與延後處理的觸發器,返回 (類型, 名稱, SQL) 以便重建"""
+        placeholders = ', '.join('?' for _ in self.DEFERRED_TRIGGERS)
+        cursor.execute(f"""
+            SELECT type, name, sql FROM sqlite_master
+            WHERE tbl_name = 'messages'
+              AND ((type = 'index' AND sql IS NOT NULL) OR (type = 'trigger' AND name IN ({placeholders})))
+        """, self.DEFERRED_TRIGGERS)
+        suspended = [tuple(row) for row in cursor.fetchall()]
+        for kind, name, _ in suspended:
+            cursor.execute(f"DROP {kind.upper()} {name}")
+        return suspended
+
+    def _resume(self, cursor, suspended: List[tuple], after_id: int):
+        """重建索引,補上新訊息的全文索引與彙總,恢復觸發器"""
+        names = {name for _, name, _ in suspended}
+        for kind, _, sql in suspended:
+            if kind == 'index':
+                cursor.execute(sql)
+        if 'messages_fts_insert' in names:
+            cursor.execute("""
+                INSERT INTO messages_fts (rowid, content)
+                SELECT id, inflate(content) FROM messages WHERE id > ?
+            """, (after_id,))
+        if 'rollup_messages_insert' in names:
+            apply_message_rollups(cursor, after_id)
+        for kind, _, sql in suspended:
+            if kind == 'trigger':
+                cursor.execute(sql)
+
+    def load_batch(self, cursor, batch: List[Dict[str, Any]]) -> int:
+        """
+        在呼叫者的交易中寫入一批訊息 (同時補上缺少的平台、群組與使用者)
+
+        Args:
+            cursor: 資料庫游標
+            batch: 訊息資料 (解析器的格式)
+
+        Returns:
+            實際新增的訊息數 (重複的 message_id 不計入)
+        """
+        platforms = {record['platform'] for record in batch} - self._platforms
+        if platforms:
+            cursor.executemany("INSERT OR IGNORE INTO platforms (name) VALUES (?)", [(p,) for p in platforms])
+            self._platforms |= platforms
+        groups = {record['group_id'] for record in batch if record['group_id']} - self._groups
+        if groups:
+            cursor.executemany("INSERT OR IGNORE INTO chat_groups (group_id) VALUES (?)", [(g,) for g in groups])
+            self._groups |= groups
+
+        users = {}
+        for record in batch:
+            if record['user_id'] not in self._users and record['user_id'] not in users:
+                users[record['user_id']] = record
+        if users:
+            now = now_ms()
+            cursor.executemany(self.INSERT_USER_SQL, [
+                (user_id, record['platform'], record.get('display_name'), record['created_at'], now)
+                for user_id, record in users.items()
+            ])
+            self._users |= users.keys()
+
+        compression = get_compression()
+        encode = compression.encode if compression is not None else (lambda value: value)
+        cursor.executemany(self.INSERT_MESSAGE_SQL, [
+            (
+                record['message_id'],
+                record['user_id'],
+                record['platform'],
+                record['group_id'],
+                encode(record['content']),
+                record['message_type'],
+                record['created_at'],
+                encode(record['metadata']),
+            )
+            for record in batch
+        ])
+        # executemany 的 rowcount 為各次 sqlite3_changes() 的總和 (不含觸發器與被忽略的重複訊息)
+        return cursor.rowcount
+
+    def _batches(self, records: Iterable[Optional[Dict[str, Any]]], stats: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+        """將資料分批,並統計無法匯入的行"""
+        batch = []
+        for record in records:
+            if record is None:
+                stats['skipped'] += 1
+                continue
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def run(self, records: Iterable[Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        匯入訊息
+
+        Args:
+            records: 解析器產生的訊息資料 (見 PARSERS)
+
+        Returns:
+            {'read', 'inserted', 'duplicates', 'skipped', 'batches', 'elapsed_ms', 'rows_per_sec'}
+        """
+        started = time.monotonic()
+        stats = {'read': 0, 'inserted': 0, 'skipped': 0, 'batches': 0}
+
+        def load(cursor, batch):
+            stats['read'] += len(batch)
+            stats['inserted'] += self.load_batch(cursor, batch)
+            stats['batches'] += 1
+
+        if self.defer_indexes:
+            with self.db.get_cursor() as cursor:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+                after_id = cursor.fetchone()[0]
+                suspended = self._suspend(cursor)
+                for batch in self._batches(records, stats):
+                    load(cursor, batch)
+                rebuild_started = time.monotonic()
+                self._resume(cursor, suspended, after_id)
+                stats['rebuild_ms'] = round((time.monotonic() - rebuild_started) * 1000, 1)
+        else:
+            for batch in self._batches(records, stats):
+                with self.db.get_cursor() as cursor:
+                    load(cursor, batch)
+
+        if stats['inserted']:
+            invalidate_recent_buffer()
+            known_users = get_known_users()
+            if known_users is not None:
+                known_users.clear()
+
+        elapsed = time.monotonic() - started
+        stats['duplicates'] = stats['read'] - stats['inserted']
+        stats['elapsed_ms'] = round(elapsed * 1000, 1)
+        stats['rows_per_sec'] = round(stats['read'] / elapsed) if elapsed > 0 else 0
+        logger.info(
+            f"匯入 {stats['inserted']} 則訊息 (讀取 {stats['read']},重複 {stats['duplicates']},"
+            f"略過 {stats['skipped']},{stats['rows_per_sec']} 則/秒)"
+        )
+        return stats
+
+
+def import_messages(
+    fmt: str,
+    stream: TextIO,
+    db: Optional[Database] = None,
+    group_id: Optional[str] = None,
+    platform: str = 'line',
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    defer_indexes: bool = True
+) -> Dict[str, Any]:
+    """
+    解析並匯入訊息
+
+    Args:
+        fmt: 'line' 或 'ndjson'
+        stream: 文字串流
+        db: 資料庫實例
+        group_id: LINE 聊天記錄所屬的群組 ID (line 格式必填)
+        platform: LINE 聊天記錄的平台名稱
+        batch_size: 每批訊息數
+        defer_indexes: 是否暫停索引與觸發器,載入後重建
+
+    Returns:
+        匯入統計 (見 BulkImporter.run)
+
+    Raises:
+        ValueError: 不支援的格式或缺少群組 ID
+    """
+    if fmt not in PARSERS:
+        raise ValueError(f"不支援的匯入格式: {fmt}")
+    if fmt == 'line':
+        if not group_id:
+            raise ValueError("匯入 LINE 聊天記錄需要指定群組 ID")
+        records = parse_line_export(stream, group_id, platform)
+    else:
+        records = parse_ndjson(stream)
+    return BulkImporter(db, batch_size, defer_indexes).run(records)
+
+
+def open_text(path: str) -> TextIO:
+    """開啟匯入檔 (.gz 自動解壓縮,容許 UTF-8 BOM)"""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig')
+    return open(path, encoding='utf-8-sig')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令列入口: 匯入檔案並輸出統計"""
+    parser = argparse.ArgumentParser(prog='python -m models.importer', description='批次匯入歷史訊息')
+    parser.add_argument('format', choices=sorted(PARSERS), help='檔案格式')
+    parser.add_argument('path', help="檔案路徑 (.gz 自動解壓縮,'-' 表示標準輸入)")
+    parser.add_argument('--group', help='LINE 聊天記錄所屬的群組 ID')
+    parser.add_argument('--platform', default='line', help='LINE 聊天記錄的平台名稱')
+    parser.add_argument('--db', help='資料庫路徑 (預設使用 DATABASE_PATH)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--no-defer', action='store_true', help='不暫停索引與觸發器 (每批一個交易)')
+    args = parser.parse_args(argv)
+
+    if args.format == 'line' and not args.group:
+        parser.error('line 格式需要 --group')
+
+    from config import config
+    from .database import close_db
+
+    db = get_db(args.db or config.DATABASE_PATH)
+    try:
+        with open_text(args.path) as stream:
+            stats = import_messages(
+                args.format,
+                stream,
+                db=db,
+                group_id=args.group,
+                platform=args.platform,
+                batch_size=args.batch_size,
+                defer_indexes=not args.no_defer
+            )
+    finally:
+        close_db()
+    print(json.dumps(stats, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
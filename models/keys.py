@@ -0,0 +1,98 @@
+"""
+整數代理鍵對照
+- 平台與群組的字串 ID 對應到 platforms / chat_groups 字典表的整數鍵
+- 行程內快取: 寫入訊息時不需每次查詢字典表,新的平台或群組第一次出現時才寫入
+"""
+import threading
+from typing import Dict, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class KeyCache:
+    """
+    平台與群組的字串 ID → 整數鍵快取
+
+    字典表只會新增不會刪除,鍵一旦分配就不會改變,快取不需失效;
+    平台與群組的數量很少,不設上限。使用者的整數鍵在寫入語句內以
+    users.user_id 的唯一索引解析 (與原本外鍵檢查的查詢成本相同)。
+    """
+
+    # 字典表: (資料表, 字串欄位)
+    TABLES = {
+        'platform': ('platforms', 'name'),
+        'group': ('chat_groups', 'group_id'),
+    }
+
+    def __init__(self, db):
+        """
+        初始化快取
+
+        Args:
+            db: 資料庫實例
+        """
+        self.db = db
+        self._lock = threading.Lock()
+        self._keys: Dict[str, Dict[str, int]] = {kind: {} for kind in self.TABLES}
+
+    def _resolve(self, kind: str, value: str) -> int:
+        """查詢字串 ID 的整數鍵,不存在時寫入字典表"""
+        cache = self._keys[kind]
+        key = cache.get(value)
+        if key is not None:
+            return key
+
+        table, column = self.TABLES[kind]
+        with self._lock:
+            key = cache.get(value)
+            if key is not None:
+                return key
+            with self.db.get_cursor() as cursor:
+                cursor.execute(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (value,))
+                cursor.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,))
+                key = cursor.fetchone()[0]
+            cache[value] = key
+            logger.debug(f"{table} 鍵: {value} -> {key}")
+        return key
+
+    def platform_key(self, platform: str) -> int:
+        """
+        獲取平台的整數鍵
+
+        Args:
+            platform: 平台名稱
+
+        Returns:
+            platforms.id
+        """
+        return self._resolve('platform', platform)
+
+    def group_key(self, group_id: Optional[str]) -> Optional[int]:
+        """
+        獲取群組的整數鍵
+
+        Args:
+            group_id: 群組 ID (None 或空字串表示私訊)
+
+        Returns:
+            chat_groups.id,沒有群組時返回 None
+        """
+        if not group_id:
+            return None
+        return self._resolve('group', group_id)
+
+    def clear(self):
+        """清除快取"""
+        with self._lock:
+            for cache in self._keys.values():
+                cache.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        獲取快取統計資訊
+
+        Returns:
+            各字典表已快取的鍵數量
+        """
+        return {self.TABLES[kind][0]: len(cache) for kind, cache in self._keys.items()}
@@ -0,0 +1,167 @@
+"""
+已知使用者快取
+- 記錄本行程已確認存在的使用者,每則訊息不需再查詢或寫入 users 表
+- LRU 限制精確記錄的數量;可選用 Bloom 過濾器保留被淘汰的使用者 (固定記憶體)
+- 使用者只會停用不會刪除,記錄一旦成立就不需失效
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BloomFilter:
+    """
+    固定大小的 Bloom 過濾器
+
+    只會誤判「存在」,不會漏判;以 blake2b 的兩個 64 位元雜湊做雙重雜湊產生各個位置。
+    """
+
+    def __init__(self, bits: int, hashes: int = 7):
+        """
+        初始化過濾器
+
+        Args:
+            bits: 位元數 (約每個元素 10 位元、7 個雜湊時誤判率約 1%)
+            hashes: 雜湊函數數量
+        """
+        self.bits = max(8, bits)
+        self.hashes = max(1, hashes)
+        self._array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        """元素對應的位元位置"""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: str):
+        """加入元素"""
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class KnownUsers:
+    """
+    已知使用者集合
+
+    先查 LRU (精確),再查 Bloom 過濾器 (若啟用)。Bloom 過濾器的誤判只會讓
+    從未出現過的使用者被當成已存在而略過建立;SQLite 後端寫入訊息時仍會在
+    同一交易中確保使用者存在,因此不影響訊息的寫入。
+    """
+
+    def __init__(self, max_entries: int = 100000, bloom_bits: int = 0):
+        """
+        初始化快取
+
+        Args:
+            max_entries: LRU 保留的使用者數
+            bloom_bits: Bloom 過濾器的位元數 (0 表示不使用,LRU 淘汰的使用者下次需重新確認)
+        """
+        self.max_entries = max(1, max_entries)
+        self.bloom = BloomFilter(bloom_bits) if bloom_bits > 0 else None
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, None]' = OrderedDict()
+        self._stats = {'hits': 0, 'bloom_hits': 0, 'misses': 0, 'evicted': 0}
+
+    @staticmethod
+    def _key(user_id: str, platform: str) -> str:
+        return f"{platform}\0{user_id}"
+
+    def contains(self, user_id: str, platform: str) -> bool:
+        """
+        使用者是否已確認存在
+
+        Args:
+            user_id: 使用者 ID
+            platform: 平台名稱
+
+        Returns:
+            True 表示已知 (啟用 Bloom 過濾器時可能誤判)
+        """
+        key = self._key(user_id, platform)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return True
+            if self.bloom is not None and key in self.bloom:
+                self._stats['bloom_hits'] += 1
+                return True
+            self._stats['misses'] += 1
+            return False
+
+    def add(self, user_id: str, platform: str):
+        """
+        記錄已確認存在的使用者
+
+        Args:
+            user_id: 使用者 ID
+            platform: 平台名稱
+        """
+        key = self._key(user_id, platform)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = None
+            if len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._stats['evicted'] += 1
+                if self.bloom is not None:
+                    self.bloom.add(evicted)
+
+    def clear(self):
+        """清除快取"""
+        with self._lock:
+            self._entries.clear()
+            if self.bloom is not None:
+                self.bloom = BloomFilter(self.bloom.bits, self.bloom.hashes)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取快取統計資訊
+
+        Returns:
+            統計資訊字典
+        """
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), max_entries=self.max_entries)
+            if self.bloom is not None:
+                stats['bloom_bits'] = self.bloom.bits
+                stats['bloom_entries'] = self.bloom.count
+            return stats
+
+
+# 全域已知使用者快取 (未設定時為 None)
+_known_users: Optional[KnownUsers] = None
+
+
+def configure_known_users(max_entries: int = 100000, bloom_bits: int = 0) -> Optional[KnownUsers]:
+    """
+    設定全域已知使用者快取
+
+    Args:
+        max_entries: LRU 保留的使用者數 (0 表示停用)
+        bloom_bits: Bloom 過濾器的位元數 (0 表示不使用)
+
+    Returns:
+        KnownUsers 實例,停用時返回 None
+    """
+    global _known_users
+    _known_users = KnownUsers(max_entries, bloom_bits) if max_entries > 0 else None
+    return _known_users
+
+
+def get_known_users() -> Optional[KnownUsers]:
+    """獲取全域已知使用者快取,未設定時返回 None"""
+    return _known_users
@@ -1,15 +1,32 @@
 """訊息資料模型"""
-import json
+import html
+import re
 from datetime import datetime
-from typing import Optional, List, Dict, Any
-from .database import get_db
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+from .codecs import inflate
+from .database import run_in_db
+from .pagination import encode_cursor, decode_cursor
+from .recent import get_recent_buffer, invalidate_recent_buffer
+from .rows import UNSET, decode_metadata, encode_metadata, isoformat_ms
+from .storage import get_storage, SNIPPET_OPEN, SNIPPET_CLOSE
+from .timestamps import now_ms, to_epoch_ms, from_epoch_ms
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 
 class Message:
-    """訊息類"""
+    """
+    訊息類
+
+    以 __slots__ 儲存欄位;從資料庫載入時保留 metadata 的 JSON 文字與
+    created_at 的 epoch 毫秒,第一次存取時才解碼。
+    """
+
+    __slots__ = (
+        'id', 'message_id', 'user_id', 'platform', 'content', 'message_type', 'group_id',
+        '_created_at', '_created_at_ms', '_metadata', '_metadata_json',
+    )
 
     def __init__(
         self,
@@ -35,38 +52,72 @@ class Message:
 
     @classmethod
     def from_db_row(cls, row) -> 'Message':
-        """從資料庫行建立訊息物件"""
-        metadata = json.loads(row['metadata']) if row['metadata'] else {}
-        return cls(
-            id=row['id'],
-            message_id=row['message_id'],
-            user_id=row['user_id'],
-            platform=row['platform'],
-            content=row['content'],
-            message_type=row['message_type'],
-            group_id=row['group_id'],
-            created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None,
-            metadata=metadata
-        )
+        """從資料庫行建立訊息物件 (壓縮的欄位在此還原,metadata 與 created_at 延後解碼)"""
+        message = cls.__new__(cls)
+        message.id = row['id']
+        message.message_id = row['message_id']
+        message.user_id = row['user_id']
+        message.platform = row['platform']
+        message.content = inflate(row['content'])
+        message.message_type = row['message_type']
+        message.group_id = row['group_id']
+        message._created_at = UNSET
+        message._created_at_ms = row['created_at']
+        message._metadata = UNSET
+        message._metadata_json = inflate(row['metadata'])
+        return message
+
+    @property
+    def created_at(self) -> Optional[datetime]:
+        """建立時間 (第一次存取時解碼)"""
+        if self._created_at is UNSET:
+            self._created_at = from_epoch_ms(self._created_at_ms)
+        return self._created_at
+
+    @created_at.setter
+    def created_at(self, value: Optional[datetime]):
+        self._created_at = value
+        self._created_at_ms = to_epoch_ms(value)
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """附加資料 (第一次存取時解碼;之後對字典的修改會在 save() 時寫回)"""
+        if self._metadata is UNSET:
+            self._metadata = decode_metadata(self._metadata_json)
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value: Optional[Dict[str, Any]]):
+        self._metadata = value or {}
+        self._metadata_json = UNSET
+
+    def _to_db_row(self) -> Dict[str, Any]:
+        """轉換為儲存後端的資料列 (metadata 未解碼時直接沿用原始 JSON)"""
+        return {
+            'message_id': self.message_id,
+            'user_id': self.user_id,
+            'platform': self.platform,
+            'content': self.content,
+            'message_type': self.message_type,
+            'group_id': self.group_id,
+            'created_at': to_epoch_ms(self.created_at) if isinstance(self._created_at_ms, str) else self._created_at_ms,
+            'metadata': (self._metadata_json or '{}') if self._metadata is UNSET else encode_metadata(self._metadata)
+        }
 
     def save(self):
-        """儲存訊息到資料庫"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                INSERT OR IGNORE INTO messages
-                (message_id, user_id, platform, content, message_type, group_id, created_at, metadata)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                self.message_id,
-                self.user_id,
-                self.platform,
-                self.content,
-                self.message_type,
-                self.group_id,
-                self.created_at.isoformat(),
-                json.dumps(self.metadata, ensure_ascii=False)
-            ))
+        """
+        儲存訊息到資料庫
+
+        SQLite 後端啟用寫入緩衝時只會加入佇列,由背景執行緒批次提交,
+        並一併確保所屬使用者存在。啟用最近訊息緩衝時一併加入緩衝。
+        """
+        row = self._to_db_row()
+        row_id = get_storage().insert_message(row)
+        if row_id is not None:
+            self.id = row_id
+        recent = get_recent_buffer()
+        if recent is not None:
+            recent.add(dict(row, id=row_id))
         logger.debug(f"儲存訊息: {self.message_id} ({self.platform})")
 
     @classmethod
@@ -80,14 +131,8 @@ class Message:
         Returns:
             Message 物件或 None
         """
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM messages
-                WHERE message_id = ?
-            """, (message_id,))
-            row = cursor.fetchone()
-            return cls.from_db_row(row) if row else None
+        row = get_storage().get_message(message_id)
+        return cls.from_db_row(row) if row else None
 
     @classmethod
     def get_user_messages(
@@ -102,20 +147,13 @@ class Message:
         Args:
             user_id: 使用者 ID
             limit: 限制數量
-            offset: 偏移量
+            offset: 偏移量 (深分頁請改用 paginate)
 
         Returns:
             訊息列表
         """
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM messages
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                LIMIT ? OFFSET ?
-            """, (user_id, limit, offset))
-            return [cls.from_db_row(row) for row in cursor.fetchall()]
+        rows = get_storage().list_messages(limit, offset, user_id=user_id)
+        return [cls.from_db_row(row) for row in rows]
 
     @classmethod
     def get_group_messages(
@@ -125,30 +163,123 @@ class Message:
         offset: int = 0
     ) -> List['Message']:
         """
-        獲取群組的訊息
+        獲取群組的訊息 (啟用最近訊息緩衝時,最近的訊息直接由記憶體回答)
 
         Args:
             group_id: 群組 ID
             limit: 限制數量
-            offset: 偏移量
+            offset: 偏移量 (深分頁請改用 paginate)
 
         Returns:
             訊息列表
         """
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM messages
-                WHERE group_id = ?
-                ORDER BY created_at DESC
-                LIMIT ? OFFSET ?
-            """, (group_id, limit, offset))
-            return [cls.from_db_row(row) for row in cursor.fetchall()]
+        rows = cls._recent_rows(limit, offset, group_id=group_id)
+        if rows is None:
+            rows = get_storage().list_messages(limit, offset, group_id=group_id)
+        return [cls.from_db_row(row) for row in rows]
+
+    @classmethod
+    def paginate(
+        cls,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None,
+        platform: Optional[str] = None,
+        include_archive: bool = False
+    ) -> Tuple[List['Message'], Optional[str]]:
+        """
+        以游標分頁獲取訊息 (新到舊)
+
+        以 (created_at, id) 作為鍵集,每一頁的成本都與第一頁相同,
+        不受 OFFSET 深度影響。
+
+        Args:
+            limit: 每頁數量
+            cursor: 上一頁返回的游標 (None 表示第一頁)
+            user_id: 篩選使用者
+            group_id: 篩選群組
+            platform: 篩選平台
+            include_archive: 熱資料不足一頁時繼續查詢月份封存檔
+
+        Returns:
+            (訊息列表, 下一頁游標或 None)
+
+        Raises:
+            ValueError: 游標格式錯誤
+        """
+        rows = None
+        if cursor is None and not user_id:
+            # 第一頁 (儀表板的最近訊息) 優先由最近訊息緩衝回答;游標需要 id,
+            # 尚未寫入資料庫 (寫入緩衝) 的訊息沒有 id,此時改查資料庫
+            rows = cls._recent_rows(limit + 1, group_id=group_id, platform=platform)
+            if rows is not None and (
+                any(row['id'] is None for row in rows)
+                or (include_archive and len(rows) <= limit)
+            ):
+                rows = None
+        if rows is None:
+            after = decode_cursor(cursor, 2) if cursor else None
+            rows = get_storage().paginate_messages(limit + 1, after, user_id, group_id, platform, include_archive)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return [cls.from_db_row(row) for row in rows], next_cursor
+
+    @classmethod
+    def iter_dicts(
+        cls,
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        逐筆產生訊息字典 (匯出用,順序與 paginate 相同)
+
+        由儲存後端逐批讀取並直接以 row_to_dict 轉換,不建立 Message 物件,
+        記憶體用量不受資料表大小影響。須在同一執行緒內迭代完畢或關閉。
+
+        Args:
+            platform: 篩選平台
+            group_id: 篩選群組
+            since: 起始時間 (含)
+            until: 結束時間 (不含)
+
+        Yields:
+            to_dict() 格式的字典
+        """
+        rows = get_storage().iter_messages(
+            platform=platform,
+            group_id=group_id,
+            since=to_epoch_ms(since),
+            until=to_epoch_ms(until)
+        )
+        try:
+            for row in rows:
+                yield cls.row_to_dict(row)
+        finally:
+            # 提前結束 (例如用戶端中斷下載) 時立即歸還連接
+            rows.close()
+
+    @classmethod
+    def estimate_total(cls) -> int:
+        """
+        估計訊息總數
+
+        SQLite 後端以 id 範圍估算,只需讀取主鍵兩端 (刪除過的訊息會讓結果偏高)。
+
+        Returns:
+            估計的訊息數量
+        """
+        return get_storage().estimate_message_total()
 
     @classmethod
     def get_recent_messages(cls, limit: int = 100) -> List['Message']:
         """
-        獲取最近的訊息
+        獲取最近的訊息 (啟用最近訊息緩衝時直接由記憶體回答)
 
         Args:
             limit: 限制數量
@@ -156,78 +287,168 @@ class Message:
         Returns:
             訊息列表
         """
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM messages
-                ORDER BY created_at DESC
-                LIMIT ?
-            """, (limit,))
-            return [cls.from_db_row(row) for row in cursor.fetchall()]
+        rows = cls._recent_rows(limit)
+        if rows is None:
+            rows = get_storage().list_messages(limit)
+        return [cls.from_db_row(row) for row in rows]
+
+    @staticmethod
+    def _recent_rows(
+        limit: int,
+        offset: int = 0,
+        group_id: Optional[str] = None,
+        platform: Optional[str] = None
+    ) -> Optional[list]:
+        """
+        由最近訊息緩衝獲取資料列 (新到舊)
+
+        Returns:
+            資料列列表,未啟用緩衝或緩衝無法完整回答時返回 None (改查資料庫)
+        """
+        recent = get_recent_buffer()
+        if recent is None:
+            return None
+        return recent.recent(
+            limit,
+            offset,
+            group_id=group_id,
+            platform=platform,
+            load=lambda n: get_storage().list_messages(n, group_id=group_id)
+        )
+
+    @classmethod
+    def _search_rows(
+        cls,
+        keyword: str,
+        platform: Optional[str] = None,
+        limit: int = 50,
+        group_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        order: str = 'rank',
+        include_archive: bool = False
+    ) -> list:
+        """
+        執行搜尋並返回資料庫行 (含 snippet 與 rank 欄位)
+
+        SQLite 後端有全文索引時以 FTS5 MATCH 搜尋並依 BM25 排序,否則退回 LIKE;
+        include_archive 時,熱資料庫結果不足 limit 筆會再依序搜尋月份封存檔。
+        """
+        terms = [term for term in keyword.split() if term]
+        return get_storage().search_messages(
+            terms,
+            limit,
+            platform=platform,
+            group_id=group_id,
+            since=to_epoch_ms(since),
+            until=to_epoch_ms(until),
+            order=order,
+            include_archive=include_archive
+        )
 
     @classmethod
     def search(
         cls,
         keyword: str,
         platform: Optional[str] = None,
-        limit: int = 50
+        limit: int = 50,
+        group_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        order: str = 'rank',
+        include_archive: bool = False
     ) -> List['Message']:
         """
         搜尋訊息
 
         Args:
-            keyword: 關鍵字
+            keyword: 關鍵字 (以空白分隔多個詞,需全部符合)
             platform: 篩選平台
             limit: 限制數量
+            group_id: 篩選群組
+            since: 起始時間 (含)
+            until: 結束時間 (不含)
+            order: 'rank' 依相關度排序, 'recent' 依時間排序
+            include_archive: 同時搜尋月份封存檔
 
         Returns:
             訊息列表
         """
-        db = get_db()
-        with db.get_cursor() as cursor:
-            if platform:
-                cursor.execute("""
-                    SELECT * FROM messages
-                    WHERE content LIKE ? AND platform = ?
-                    ORDER BY created_at DESC
-                    LIMIT ?
-                """, (f'%{keyword}%', platform, limit))
-            else:
-                cursor.execute("""
-                    SELECT * FROM messages
-                    WHERE content LIKE ?
-                    ORDER BY created_at DESC
-                    LIMIT ?
-                """, (f'%{keyword}%', limit))
-
-            return [cls.from_db_row(row) for row in cursor.fetchall()]
+        rows = cls._search_rows(keyword, platform, limit, group_id, since, until, order, include_archive)
+        return [cls.from_db_row(row) for row in rows]
+
+    @classmethod
+    def _make_snippet(cls, content: str, terms: List[str], width: int = 24) -> str:
+        """在 Python 端產生摘要 (LIKE 搜尋時使用),格式與 FTS5 snippet() 相同"""
+        lowered = content.lower()
+        positions = [lowered.find(t.lower()) for t in terms]
+        first = min((p for p in positions if p >= 0), default=0)
+        start = max(0, first - width // 2)
+        end = min(len(content), start + width * 2)
+        snippet = content[start:end]
+        for term in terms:
+            snippet = re.sub(
+                re.escape(term),
+                lambda m: f"{SNIPPET_OPEN}{m.group(0)}{SNIPPET_CLOSE}",
+                snippet,
+                flags=re.IGNORECASE
+            )
+        return ('…' if start > 0 else '') + snippet + ('…' if end < len(content) else '')
+
+    @classmethod
+    def search_with_snippets(
+        cls,
+        keyword: str,
+        platform: Optional[str] = None,
+        limit: int = 50,
+        group_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        order: str = 'rank',
+        include_archive: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        搜尋訊息並附上命中摘要
+
+        參數同 search()。摘要已做 HTML 轉義,命中處以 <mark> 標示。
+
+        Returns:
+            訊息字典列表 (額外包含 snippet 與 rank)
+        """
+        rows = cls._search_rows(keyword, platform, limit, group_id, since, until, order, include_archive)
+        terms = [term for term in keyword.split() if term]
+        results = []
+        for row in rows:
+            data = cls.row_to_dict(row)
+            snippet = row['snippet']
+            if snippet is None:
+                snippet = cls._make_snippet(inflate(row['content']) or '', terms)
+            data['snippet'] = (
+                html.escape(snippet)
+                .replace(SNIPPET_OPEN, '<mark>')
+                .replace(SNIPPET_CLOSE, '</mark>')
+            )
+            data['rank'] = row['rank']
+            results.append(data)
+        return results
 
     @classmethod
     def count_by_user(cls, user_id: str) -> int:
         """統計使用者訊息數量"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT COUNT(*) FROM messages
-                WHERE user_id = ?
-            """, (user_id,))
-            return cursor.fetchone()[0]
+        return get_storage().count_messages(user_id=user_id)
 
     @classmethod
     def count_by_platform(cls, platform: str) -> int:
         """統計平台訊息數量"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT COUNT(*) FROM messages
-                WHERE platform = ?
-            """, (platform,))
-            return cursor.fetchone()[0]
+        return get_storage().count_messages(platform=platform)
 
     @classmethod
     def delete_old_messages(cls, days: int = 30) -> int:
         """
-        刪除舊訊息
+        刪除舊訊息 (所有類型與平台一律套用相同天數)
+
+        SQLite 後端以 rowid 範圍分批刪除;依類型或平台設定不同期限、
+        並清理 chat_history 與佇列請改用 models.retention。
 
         Args:
             days: 保留天數
@@ -235,18 +456,68 @@ class Message:
         Returns:
             刪除的訊息數量
         """
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                DELETE FROM messages
-                WHERE created_at < datetime('now', '-' || ? || ' days')
-            """, (days,))
-            deleted_count = cursor.rowcount
+        cutoff = now_ms() - days * 86400000
+        deleted_count = get_storage().delete_messages_before(cutoff)
+        if deleted_count:
+            invalidate_recent_buffer()
         logger.info(f"刪除 {deleted_count} 條超過 {days} 天的訊息")
         return deleted_count
 
+    # ==================== 非同步介面 ====================
+    # 於資料庫執行緒池執行,供事件迴圈中的協程使用
+
+    async def asave(self):
+        """非同步儲存訊息"""
+        await run_in_db(self.save)
+
+    @classmethod
+    async def aget_by_id(cls, message_id: str) -> Optional['Message']:
+        """非同步根據 ID 獲取訊息"""
+        return await run_in_db(cls.get_by_id, message_id)
+
+    @classmethod
+    async def aget_user_messages(cls, user_id: str, limit: int = 50, offset: int = 0) -> List['Message']:
+        """非同步獲取使用者的訊息"""
+        return await run_in_db(cls.get_user_messages, user_id, limit, offset)
+
+    @classmethod
+    async def aget_group_messages(cls, group_id: str, limit: int = 50, offset: int = 0) -> List['Message']:
+        """非同步獲取群組的訊息"""
+        return await run_in_db(cls.get_group_messages, group_id, limit, offset)
+
+    @classmethod
+    async def apaginate(cls, limit: int = 50, cursor: Optional[str] = None, **filters) -> Tuple[List['Message'], Optional[str]]:
+        """非同步以游標分頁獲取訊息"""
+        return await run_in_db(cls.paginate, limit, cursor, **filters)
+
+    @classmethod
+    async def aget_recent_messages(cls, limit: int = 100) -> List['Message']:
+        """非同步獲取最近的訊息"""
+        return await run_in_db(cls.get_recent_messages, limit)
+
+    @classmethod
+    async def asearch(cls, keyword: str, platform: Optional[str] = None, limit: int = 50, **kwargs) -> List['Message']:
+        """非同步搜尋訊息"""
+        return await run_in_db(cls.search, keyword, platform, limit, **kwargs)
+
+    @classmethod
+    async def acount_by_user(cls, user_id: str) -> int:
+        """非同步統計使用者訊息數量"""
+        return await run_in_db(cls.count_by_user, user_id)
+
+    @classmethod
+    async def acount_by_platform(cls, platform: str) -> int:
+        """非同步統計平台訊息數量"""
+        return await run_in_db(cls.count_by_platform, platform)
+
+    @classmethod
+    async def adelete_old_messages(cls, days: int = 30) -> int:
+        """非同步刪除舊訊息"""
+        return await run_in_db(cls.delete_old_messages, days)
+
     def to_dict(self) -> Dict[str, Any]:
-        """轉換為字典"""
+        """轉換為字典 (created_at 尚未解碼時直接由 epoch 毫秒格式化,不快取 datetime)"""
+        created_at = self._created_at
         return {
             'id': self.id,
             'message_id': self.message_id,
@@ -255,9 +526,33 @@ class Message:
             'content': self.content,
             'message_type': self.message_type,
             'group_id': self.group_id,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'created_at': isoformat_ms(self._created_at_ms) if created_at is UNSET
+            else created_at.isoformat() if created_at else None,
             'metadata': self.metadata
         }
 
+    @staticmethod
+    def row_to_dict(row) -> Dict[str, Any]:
+        """
+        直接將資料庫行轉為 to_dict() 的格式,不建立 Message 物件
+
+        Args:
+            row: 儲存後端返回的資料列
+
+        Returns:
+            與 Message.from_db_row(row).to_dict() 相同的字典
+        """
+        return {
+            'id': row['id'],
+            'message_id': row['message_id'],
+            'user_id': row['user_id'],
+            'platform': row['platform'],
+            'content': inflate(row['content']),
+            'message_type': row['message_type'],
+            'group_id': row['group_id'],
+            'created_at': isoformat_ms(row['created_at']),
+            'metadata': decode_metadata(inflate(row['metadata']))
+        }
+
     def __repr__(self):
         return f"<Message {self.message_id} from {self.user_id}@{self.platform}>"
@@ -0,0 +1,47 @@
+"""
+游標分頁工具
+- 以 (排序欄位, 唯一鍵) 編碼為不透明游標
+- 取代 LIMIT/OFFSET,深分頁成本與第一頁相同
+"""
+import base64
+import json
+from typing import Any, Tuple
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    將最後一筆資料的排序鍵編碼為游標
+
+    Args:
+        *values: 排序鍵 (例如 created_at, id)
+
+    Returns:
+        URL 安全的游標字串
+    """
+    raw = json.dumps(values, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> Tuple[Any, ...]:
+    """
+    解碼游標
+
+    Args:
+        cursor: encode_cursor 產生的字串
+        size: 預期的排序鍵數量
+
+    Returns:
+        排序鍵 tuple
+
+    Raises:
+        ValueError: 游標格式錯誤
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"無效的分頁游標: {cursor}") from e
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError(f"無效的分頁游標: {cursor}")
+    return tuple(values)
@@ -0,0 +1,254 @@
+"""
+查詢計畫稽核工具
+- 追蹤模型實際發出的 SQL
+- 以 EXPLAIN QUERY PLAN 分析
+- 標記全表掃描與暫存 B-tree 排序
+
+使用方式:
+    python -m models.query_audit            # 以暫存資料庫執行所有模型查詢
+    python -m models.query_audit data/bot.db   # 在資料庫副本上執行
+"""
+import re
+import sys
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+from .database import Database
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class QueryPlanAuditor:
+    """查詢計畫稽核器"""
+
+    # 只分析會讀取資料表的語句
+    AUDITED_PREFIXES = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH', 'REPLACE')
+
+    _LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    _WHITESPACE_PATTERN = re.compile(r'\s+')
+    _FULL_SCAN_PATTERN = re.compile(r'^SCAN (\w+)$')
+    _TABLE_PATTERN = re.compile(r'^(?:SCAN|SEARCH) (?:\w+\.)?(\w+)')
+
+    # 固定只有少量資料列的表,全表掃描不視為問題
+    SMALL_TABLES = {'system_quotas', 'schema_version', 'group_mappings', 'sqlite_master', 'row_counts'}
+    # 統計彙總表: 資料列數與時間桶數成正比,範圍內的彙總排序不視為問題
+    ROLLUP_TABLES = {'message_counts_hourly', 'message_counts_daily'}
+
+    def __init__(self, db: Database):
+        """
+        初始化稽核器
+
+        Args:
+            db: 資料庫實例
+        """
+        self.db = db
+        self._lock = threading.Lock()
+        # 正規化後的語句 -> (範例 SQL, 執行次數)
+        self._statements: Dict[str, List[Any]] = {}
+
+    def start(self):
+        """開始追蹤 SQL"""
+        self.db.set_trace_callback(self._record)
+        logger.info("查詢計畫稽核已啟動")
+
+    def stop(self):
+        """停止追蹤 SQL"""
+        self.db.set_trace_callback(None)
+
+    @classmethod
+    def normalize(cls, sql: str) -> str:
+        """將字面值替換為 ? 並壓縮空白,用於合併相同語句"""
+        sql = cls._LITERAL_PATTERN.sub('?', sql)
+        return cls._WHITESPACE_PATTERN.sub(' ', sql).strip()
+
+    def _record(self, sql: str):
+        """追蹤回呼: 記錄語句 (不可在此執行查詢)"""
+        head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+        if head not in self.AUDITED_PREFIXES:
+            return
+        key = self.normalize(sql)
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                self._statements[key] = [sql, 1]
+            else:
+                entry[1] += 1
+
+    def explain(self, sql: str) -> List[str]:
+        """
+        取得語句的查詢計畫
+
+        Args:
+            sql: 已展開參數的 SQL
+
+        Returns:
+            查詢計畫的每一行描述
+        """
+        with self.db.connection() as conn:
+            conn.set_trace_callback(None)
+            try:
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            finally:
+                conn.set_trace_callback(self.db._trace_callback)
+        return [row[3] for row in rows]
+
+    @classmethod
+    def classify(cls, plan: List[str]) -> List[str]:
+        """
+        找出查詢計畫中的問題
+
+        Args:
+            plan: 查詢計畫描述
+
+        Returns:
+            問題列表 (空列表表示沒有問題)
+        """
+        tables = {
+            match.group(1)
+            for match in (cls._TABLE_PATTERN.match(detail.strip()) for detail in plan)
+            if match
+        }
+        bounded = bool(tables) and tables <= (cls.SMALL_TABLES | cls.ROLLUP_TABLES)
+
+        issues = []
+        for detail in plan:
+            match = cls._FULL_SCAN_PATTERN.match(detail.strip())
+            if match and match.group(1) not in cls.SMALL_TABLES:
+                issues.append(f"full scan: {match.group(1)}")
+            if 'USE TEMP B-TREE' in detail and not bounded:
+                issues.append(detail.strip().lower())
+        return issues
+
+    def report(self) -> List[Dict[str, Any]]:
+        """
+        分析所有追蹤到的語句
+
+        Returns:
+            每個語句的分析結果,有問題的排在前面
+        """
+        with self._lock:
+            statements = [(key, sample, count) for key, (sample, count) in self._statements.items()]
+
+        results = []
+        for key, sample, count in statements:
+            try:
+                plan = self.explain(sample)
+                issues = self.classify(plan)
+            except sqlite3.Error as e:
+                plan, issues = [], [f"explain failed: {e}"]
+            results.append({
+                'sql': key,
+                'calls': count,
+                'plan': plan,
+                'issues': issues,
+            })
+
+        results.sort(key=lambda r: (not r['issues'], r['sql']))
+        return results
+
+
+def exercise_models():
+    """執行所有模型的查詢方法,讓稽核器記錄其 SQL"""
+    from .user import User
+    from .message import Message
+    from .quota import Quota, SystemQuota
+    from .queued_message import QueuedMessage
+    from .stats import Stats
+    from .database import get_db
+    from .retention import RetentionEngine, parse_policies
+
+    user = User.get_or_create('audit_user', 'line', display_name='audit')
+    User.get_all()
+    User.get_all(platform='line')
+    User.count()
+    User.count(platform='line')
+    list(User.iter_dicts())
+    list(User.iter_dicts(platform='line', since=datetime.now() - timedelta(days=30)))
+    user.update(display_name='audit2')
+
+    Message('audit_msg', 'audit_user', 'line', content='audit', group_id='audit_group').save()
+    Message.get_by_id('audit_msg')
+    Message.get_user_messages('audit_user')
+    Message.get_group_messages('audit_group')
+    Message.get_recent_messages()
+    Message.search('audit')
+    Message.search('audit', platform='line')
+    Message.count_by_user('audit_user')
+    Message.count_by_platform('line')
+    list(Message.iter_dicts())
+    list(Message.iter_dicts(platform='line', since=datetime.now() - timedelta(days=1)))
+    list(Message.iter_dicts(group_id='audit_group'))
+    Message.delete_old_messages(days=3650)
+
+    quota = Quota.get_or_create('audit_user', 'ai_daily', 20)
+    quota.increment()
+    Quota.get_user_quotas('audit_user')
+    Quota.get_all_quotas()
+
+    SystemQuota.can_use('gemini_rpm')
+    SystemQuota.increment_usage('gemini_rpm')
+    SystemQuota.get_all()
+
+    get_db().get_stats()
+    now = datetime.now()
+    Stats.get_counts()
+    Stats.count('messages', 'line')
+    Stats.count_messages_since(now, platform='line')
+    Stats.message_series(now - timedelta(days=1), now, 'hour', group_id='audit_group')
+    Stats.message_series(now - timedelta(days=30), now, 'week', platform='line')
+    Stats.platform_distribution(now - timedelta(days=7))
+
+    queued = QueuedMessage('discord', 'audit', 'audit')
+    queued.save()
+    QueuedMessage.get_queued_messages()
+    QueuedMessage.mark_as_sent([queued.id])
+
+    policies = parse_policies('messages=3650,messages.ai_request@line=3650,chat_history=3650,queued_messages=3650')
+    RetentionEngine(get_db(), policies, pause_ms=0).run()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令列入口: 輸出稽核結果,有問題時返回 1"""
+    from . import database
+
+    argv = sys.argv[1:] if argv is None else argv
+    db_path = f"{tempfile.mkdtemp(prefix='converge_audit_')}/audit.db"
+    if argv:
+        # 稽核會寫入測試資料,因此在副本上執行,讓計畫反映實際資料分布
+        source = sqlite3.connect(argv[0])
+        target = sqlite3.connect(db_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    database.close_db()
+    db = database.get_db(db_path)
+    auditor = QueryPlanAuditor(db)
+    auditor.start()
+    try:
+        exercise_models()
+    finally:
+        auditor.stop()
+
+    results = auditor.report()
+    flagged = [r for r in results if r['issues']]
+    for result in results:
+        status = '⚠️ ' if result['issues'] else '✅'
+        print(f"{status} [{result['calls']}x] {result['sql']}")
+        for detail in result['plan']:
+            print(f"      {detail}")
+        for issue in result['issues']:
+            print(f"    -> {issue}")
+
+    print(f"\n共 {len(results)} 個語句,{len(flagged)} 個有問題")
+    database.close_db()
+    return 1 if flagged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
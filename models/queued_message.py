@@ -3,7 +3,9 @@
 """
 from datetime import datetime
 from typing import List, Dict, Any
-from .database import get_db
+from .database import run_in_db
+from .storage import get_storage
+from .timestamps import to_epoch_ms, from_epoch_ms
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -30,35 +32,19 @@ class QueuedMessage:
 
     def save(self):
         """儲存到資料庫"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO queued_messages
-                (source_platform, source_user_name, content, created_at, status)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                self.source_platform,
-                self.source_user_name,
-                self.content,
-                self.created_at.isoformat(),
-                self.status
-            ))
-            self.id = cursor.lastrowid
-            logger.info(f"新增待處理訊息到佇列: {self.id}")
+        self.id = get_storage().insert_queued_message({
+            'source_platform': self.source_platform,
+            'source_user_name': self.source_user_name,
+            'content': self.content,
+            'created_at': to_epoch_ms(self.created_at),
+            'status': self.status
+        })
+        logger.info(f"新增待處理訊息到佇列: {self.id}")
 
     @classmethod
     def get_queued_messages(cls, limit: int = 10) -> List['QueuedMessage']:
         """獲取佇列中待處理的訊息"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM queued_messages
-                WHERE status = 'queued'
-                ORDER BY created_at ASC
-                LIMIT ?
-            """, (limit,))
-            rows = cursor.fetchall()
-            return [cls._from_row(row) for row in rows]
+        return [cls._from_row(row) for row in get_storage().list_queued_messages(limit)]
 
     @classmethod
     def mark_as_sent(cls, ids: List[int]):
@@ -66,15 +52,22 @@ class QueuedMessage:
         if not ids:
             return
 
-        db = get_db()
-        with db.get_cursor() as cursor:
-            placeholders = ', '.join('?' for _ in ids)
-            cursor.execute(f"""
-                UPDATE queued_messages
-                SET status = 'sent'
-                WHERE id IN ({placeholders})
-            """, ids)
-            logger.info(f"標記 {len(ids)} 則訊息為已發送")
+        get_storage().mark_queued_sent(ids)
+        logger.info(f"標記 {len(ids)} 則訊息為已發送")
+
+    async def asave(self):
+        """非同步儲存到資料庫"""
+        await run_in_db(self.save)
+
+    @classmethod
+    async def aget_queued_messages(cls, limit: int = 10) -> List['QueuedMessage']:
+        """非同步獲取佇列中待處理的訊息"""
+        return await run_in_db(cls.get_queued_messages, limit)
+
+    @classmethod
+    async def amark_as_sent(cls, ids: List[int]):
+        """非同步將訊息標記為已發送"""
+        await run_in_db(cls.mark_as_sent, ids)
 
     @classmethod
     def _from_row(cls, row: Dict[str, Any]) -> 'QueuedMessage':
@@ -84,6 +77,6 @@ class QueuedMessage:
             source_platform=row['source_platform'],
             source_user_name=row['source_user_name'],
             content=row['content'],
-            created_at=datetime.fromisoformat(row['created_at']),
+            created_at=from_epoch_ms(row['created_at']),
             status=row['status']
         )
@@ -1,7 +1,14 @@
-"""配額管理模型"""
+"""
+配額管理模型
+- 啟用配額引擎 (models/quota_engine.py) 時計數在記憶體中,定期寫回資料庫
+- 未啟用時每次檢查與遞增直接讀寫資料庫
+"""
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
-from .database import get_db
+from .database import run_in_db
+from .quota_engine import QuotaCounter, Reservation, get_quota_engine
+from .storage import get_storage
+from .timestamps import now_ms, to_epoch_ms, from_epoch_ms
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -50,43 +57,75 @@ class Quota:
             usage_count=row['usage_count'],
             limit_count=row['limit_count'],
             reset_period=row['reset_period'],
-            last_reset=datetime.fromisoformat(row['last_reset']) if row['last_reset'] else None,
-            created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None,
-            updated_at=datetime.fromisoformat(row['updated_at']) if row['updated_at'] else None
+            last_reset=from_epoch_ms(row['last_reset']),
+            created_at=from_epoch_ms(row['created_at']),
+            updated_at=from_epoch_ms(row['updated_at'])
         )
 
+    # ==================== 配額引擎 ====================
+
+    @property
+    def key(self) -> tuple:
+        """配額引擎中的鍵"""
+        return ('user', self.user_id, self.quota_type, self.reset_period)
+
+    def _counter(self) -> QuotaCounter:
+        """以目前的欄位建立計數器 (引擎中尚無此配額時載入)"""
+        period = self.RESET_PERIODS.get(self.reset_period)
+        return QuotaCounter(
+            usage=self.usage_count,
+            limit=self.limit_count,
+            reset_period=self.reset_period,
+            period_ms=int(period.total_seconds() * 1000) if period else None,
+            last_reset=to_epoch_ms(self.last_reset),
+            created_at=to_epoch_ms(self.created_at),
+            updated_at=to_epoch_ms(self.updated_at),
+            row_id=self.id,
+            dirty=self.id is None
+        )
+
+    def _sync(self, engine) -> 'Quota':
+        """確保引擎中有此配額,並以引擎中的狀態更新欄位"""
+        state = engine.get(self.key) or engine.load(self.key, self._counter())
+        self.id = state['id']
+        self.usage_count = state['usage_count']
+        self.limit_count = state['limit_count']
+        self.last_reset = from_epoch_ms(state['last_reset'])
+        if state['created_at']:
+            self.created_at = from_epoch_ms(state['created_at'])
+        if state['updated_at']:
+            self.updated_at = from_epoch_ms(state['updated_at'])
+        return self
+
     def save(self):
-        """儲存配額到資料庫"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            if self.id:
-                cursor.execute("""
-                    UPDATE quotas
-                    SET usage_count = ?, limit_count = ?, last_reset = ?, updated_at = ?
-                    WHERE id = ?
-                """, (
-                    self.usage_count,
-                    self.limit_count,
-                    self.last_reset.isoformat(),
-                    datetime.now().isoformat(),
-                    self.id
-                ))
-            else:
-                cursor.execute("""
-                    INSERT INTO quotas
-                    (user_id, quota_type, usage_count, limit_count, reset_period, last_reset, created_at, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    self.user_id,
-                    self.quota_type,
-                    self.usage_count,
-                    self.limit_count,
-                    self.reset_period,
-                    self.last_reset.isoformat(),
-                    self.created_at.isoformat(),
-                    datetime.now().isoformat()
-                ))
-                self.id = cursor.lastrowid
+        """儲存配額到資料庫 (啟用配額引擎時寫入引擎,由引擎寫回)"""
+        engine = get_quota_engine()
+        if engine is not None:
+            if not engine.contains(self.key):
+                engine.load(self.key, self._counter())
+            engine.store(self.key, self.usage_count, self.limit_count, to_epoch_ms(self.last_reset))
+            return
+
+        storage = get_storage()
+        if self.id:
+            storage.update_quota(
+                self.id,
+                self.usage_count,
+                self.limit_count,
+                to_epoch_ms(self.last_reset),
+                now_ms()
+            )
+        else:
+            self.id = storage.insert_quota({
+                'user_id': self.user_id,
+                'quota_type': self.quota_type,
+                'usage_count': self.usage_count,
+                'limit_count': self.limit_count,
+                'reset_period': self.reset_period,
+                'last_reset': to_epoch_ms(self.last_reset),
+                'created_at': to_epoch_ms(self.created_at),
+                'updated_at': now_ms()
+            })
 
     def check_and_reset(self) -> bool:
         """
@@ -99,6 +138,15 @@ class Quota:
             logger.warning(f"未知的重置週期: {self.reset_period}")
             return False
 
+        engine = get_quota_engine()
+        if engine is not None:
+            self._sync(engine)
+            reset = engine.roll(self.key)
+            if reset:
+                self._sync(engine)
+                logger.info(f"重置配額: {self.user_id} - {self.quota_type}")
+            return reset
+
         reset_delta = self.RESET_PERIODS[self.reset_period]
         if datetime.now() - self.last_reset > reset_delta:
             self.usage_count = 0
@@ -113,8 +161,13 @@ class Quota:
         檢查是否可以使用
 
         Returns:
-            是否還有配額
+            是否還有配額 (啟用配額引擎時扣除已預留的數量)
         """
+        engine = get_quota_engine()
+        if engine is not None:
+            self._sync(engine)
+            return engine.can_use(self.key)
+
         self.check_and_reset()
         return self.usage_count < self.limit_count
 
@@ -128,6 +181,15 @@ class Quota:
         Returns:
             是否成功 (未超過限制)
         """
+        engine = get_quota_engine()
+        if engine is not None:
+            self._sync(engine)
+            success = engine.increment(self.key, amount)
+            self._sync(engine)
+            if not success:
+                logger.warning(f"配額超限: {self.user_id} - {self.quota_type}: {self.usage_count}/{self.limit_count}")
+            return success
+
         self.check_and_reset()
         if self.usage_count + amount <= self.limit_count:
             self.usage_count += amount
@@ -144,6 +206,27 @@ class Quota:
         self.check_and_reset()
         return max(0, self.limit_count - self.usage_count)
 
+    def reserve(self, amount: int = 1) -> Optional[Reservation]:
+        """
+        預留配額 (呼叫外部 API 前),成功後 commit() 計入用量,失敗時 release() 歸還
+
+        未啟用配額引擎時只檢查剩餘量,提交時才寫入資料庫 (不防止同時預留)。
+
+        Args:
+            amount: 預留數量
+
+        Returns:
+            Reservation,配額不足時返回 None
+        """
+        engine = get_quota_engine()
+        if engine is not None:
+            self._sync(engine)
+            return engine.reserve(self.key, amount)
+
+        if self.get_remaining() < amount:
+            return None
+        return Reservation(amount, on_commit=lambda: self.increment(amount), blocking=True)
+
     def get_usage_percentage(self) -> float:
         """獲取使用百分比"""
         if self.limit_count == 0:
@@ -170,48 +253,111 @@ class Quota:
         Returns:
             Quota 物件
         """
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM quotas
-                WHERE user_id = ? AND quota_type = ? AND reset_period = ?
-            """, (user_id, quota_type, reset_period))
-            row = cursor.fetchone()
-
-            if row:
-                quota = cls.from_db_row(row)
-                # 檢查並重置
-                quota.check_and_reset()
-                return quota
-            else:
-                quota = cls(
-                    user_id=user_id,
-                    quota_type=quota_type,
-                    limit_count=limit_count,
-                    reset_period=reset_period
-                )
-                quota.save()
-                logger.info(f"建立新配額: {user_id} - {quota_type}")
-                return quota
+        engine = get_quota_engine()
+        key = ('user', user_id, quota_type, reset_period)
+        if engine is not None and engine.contains(key):
+            return cls(user_id=user_id, quota_type=quota_type, reset_period=reset_period)._sync(engine)
+
+        row = get_storage().get_quota(user_id, quota_type, reset_period)
+
+        if row:
+            quota = cls.from_db_row(row)
+            # 檢查並重置
+            quota.check_and_reset()
+            return quota
+
+        quota = cls(
+            user_id=user_id,
+            quota_type=quota_type,
+            limit_count=limit_count,
+            reset_period=reset_period
+        )
+        if engine is not None:
+            # 由引擎寫回時建立資料列
+            quota._sync(engine)
+        else:
+            quota.save()
+        logger.info(f"建立新配額: {user_id} - {quota_type}")
+        return quota
+
+    @classmethod
+    def _from_rows(cls, rows) -> List['Quota']:
+        """資料庫行轉為配額物件 (已載入配額引擎的配額使用引擎中的狀態)"""
+        engine = get_quota_engine()
+        quotas = [cls.from_db_row(row) for row in rows]
+        if engine is not None:
+            for quota in quotas:
+                if engine.contains(quota.key):
+                    quota._sync(engine)
+        return quotas
 
     @classmethod
     def get_user_quotas(cls, user_id: str) -> List['Quota']:
         """獲取使用者的所有配額"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM quotas
-                WHERE user_id = ?
-            """, (user_id,))
-            return [cls.from_db_row(row) for row in cursor.fetchall()]
+        return cls._from_rows(get_storage().list_quotas(user_id))
 
     @classmethod
     def get_all_quotas(cls) -> List['Quota']:
         """獲取所有配額"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("SELECT * FROM quotas ORDER BY updated_at DESC")
-            return [cls.from_db_row(row) for row in cursor.fetchall()]
+        return cls._from_rows(get_storage().list_quotas())
+
+    # ==================== 非同步介面 ====================
+    # 於資料庫執行緒池執行,供事件迴圈中的協程使用;
+    # 啟用配額引擎時只操作記憶體,直接在事件迴圈中執行
+
+    async def asave(self):
+        """非同步儲存配額"""
+        if get_quota_engine() is not None:
+            return self.save()
+        await run_in_db(self.save)
+
+    async def acan_use(self) -> bool:
+        """非同步檢查是否可以使用"""
+        if get_quota_engine() is not None:
+            return self.can_use()
+        return await run_in_db(self.can_use)
+
+    async def aincrement(self, amount: int = 1) -> bool:
+        """非同步增加使用次數"""
+        if get_quota_engine() is not None:
+            return self.increment(amount)
+        return await run_in_db(self.increment, amount)
+
+    async def aget_remaining(self) -> int:
+        """非同步獲取剩餘配額"""
+        if get_quota_engine() is not None:
+            return self.get_remaining()
+        return await run_in_db(self.get_remaining)
+
+    async def areserve(self, amount: int = 1) -> Optional[Reservation]:
+        """非同步預留配額"""
+        if get_quota_engine() is not None:
+            return self.reserve(amount)
+        return await run_in_db(self.reserve, amount)
+
+    @classmethod
+    async def aget_or_create(
+        cls,
+        user_id: str,
+        quota_type: str,
+        limit_count: int,
+        reset_period: str = 'daily'
+    ) -> 'Quota':
+        """非同步獲取或建立配額 (已載入配額引擎時不存取資料庫)"""
+        engine = get_quota_engine()
+        if engine is not None and engine.contains(('user', user_id, quota_type, reset_period)):
+            return cls.get_or_create(user_id, quota_type, limit_count, reset_period)
+        return await run_in_db(cls.get_or_create, user_id, quota_type, limit_count, reset_period)
+
+    @classmethod
+    async def aget_user_quotas(cls, user_id: str) -> List['Quota']:
+        """非同步獲取使用者的所有配額"""
+        return await run_in_db(cls.get_user_quotas, user_id)
+
+    @classmethod
+    async def aget_all_quotas(cls) -> List['Quota']:
+        """非同步獲取所有配額"""
+        return await run_in_db(cls.get_all_quotas)
 
     def to_dict(self) -> Dict[str, Any]:
         """轉換為字典"""
@@ -236,24 +382,109 @@ class Quota:
 class SystemQuota:
     """系統級配額 (全域配額)"""
 
+    # ==================== 配額引擎 ====================
+
+    @staticmethod
+    def _engine_state(engine, quota_type: str) -> Optional[Dict[str, Any]]:
+        """
+        獲取引擎中的系統配額狀態 (第一次使用時由資料庫載入)
+
+        Returns:
+            狀態快照,資料庫中沒有此配額時返回 None
+        """
+        key = ('system', quota_type)
+        state = engine.get(key)
+        if state is not None:
+            return state
+        row = get_storage().get_system_quota(quota_type)
+        if not row:
+            return None
+        period = Quota.RESET_PERIODS.get(row['reset_period'])
+        return engine.load(key, QuotaCounter(
+            usage=row['usage_count'],
+            limit=row['limit_count'],
+            reset_period=row['reset_period'],
+            period_ms=int(period.total_seconds() * 1000) if period else None,
+            last_reset=row['last_reset'],
+            updated_at=row['updated_at'],
+            row_id=row['id']
+        ))
+
+    @staticmethod
+    def _ensure(engine, quota_type: str) -> bool:
+        """確保系統配額已載入配額引擎,資料庫中沒有此配額時返回 False"""
+        return engine.contains(('system', quota_type)) or SystemQuota._engine_state(engine, quota_type) is not None
+
+    @staticmethod
+    def _loaded(quota_type: str) -> bool:
+        """系統配額是否已載入配額引擎 (非同步介面可直接在事件迴圈中執行)"""
+        engine = get_quota_engine()
+        return engine is not None and engine.contains(('system', quota_type))
+
+    @staticmethod
+    def reserve(quota_type: str, amount: int = 1) -> Optional[Reservation]:
+        """
+        預留系統配額 (呼叫外部 API 前),成功後 commit() 計入用量,失敗時 release() 歸還
+
+        未啟用配額引擎時只檢查是否可用,提交時才寫入資料庫 (不防止同時預留)。
+
+        Args:
+            quota_type: 配額類型
+            amount: 預留數量
+
+        Returns:
+            Reservation,配額不足或不存在時返回 None
+        """
+        engine = get_quota_engine()
+        if engine is not None:
+            if not SystemQuota._ensure(engine, quota_type):
+                return None
+            return engine.reserve(('system', quota_type), amount)
+
+        if not SystemQuota.can_use(quota_type):
+            return None
+        return Reservation(
+            amount,
+            on_commit=lambda: SystemQuota.increment_usage(quota_type, amount),
+            blocking=True
+        )
+
+    # ==================== 查詢與使用 ====================
+
     @staticmethod
     def get_quota(quota_type: str) -> Optional[Dict[str, Any]]:
         """獲取系統配額"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM system_quotas
-                WHERE quota_type = ?
-            """, (quota_type,))
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-        return None
+        engine = get_quota_engine()
+        if engine is not None:
+            state = SystemQuota._engine_state(engine, quota_type)
+            if state is None:
+                return None
+            return {
+                'id': state['id'],
+                'quota_type': quota_type,
+                'usage_count': state['usage_count'],
+                'limit_count': state['limit_count'],
+                'reset_period': state['reset_period'],
+                'last_reset': state['last_reset'],
+                'updated_at': state['updated_at'],
+            }
+
+        row = get_storage().get_system_quota(quota_type)
+        return dict(row) if row else None
 
     @staticmethod
     def increment_usage(quota_type: str, amount: int = 1) -> bool:
         """增加系統配額使用量"""
-        db = get_db()
+        engine = get_quota_engine()
+        if engine is not None:
+            if not SystemQuota._ensure(engine, quota_type):
+                logger.error(f"未找到系統配額: {quota_type}")
+                return False
+            if not engine.increment(('system', quota_type), amount):
+                logger.warning(f"系統配額超限: {quota_type}")
+                return False
+            return True
+
         quota = SystemQuota.get_quota(quota_type)
 
         if not quota:
@@ -262,7 +493,7 @@ class SystemQuota:
 
         # 檢查是否需要重置
         reset_period = quota['reset_period']
-        last_reset = datetime.fromisoformat(quota['last_reset'])
+        last_reset = from_epoch_ms(quota['last_reset'])
 
         reset_deltas = {
             'minute': timedelta(minutes=1),
@@ -276,38 +507,36 @@ class SystemQuota:
             if datetime.now() - last_reset > reset_deltas[reset_period]:
                 should_reset = True
 
-        with db.get_cursor() as cursor:
-            if should_reset:
-                cursor.execute("""
-                    UPDATE system_quotas
-                    SET usage_count = ?, last_reset = ?, updated_at = ?
-                    WHERE quota_type = ?
-                """, (amount, datetime.now().isoformat(), datetime.now().isoformat(), quota_type))
-                logger.info(f"重置系統配額: {quota_type}")
-            else:
-                new_usage = quota['usage_count'] + amount
-                if new_usage > quota['limit_count']:
-                    logger.warning(f"系統配額超限: {quota_type}: {new_usage}/{quota['limit_count']}")
-                    return False
-
-                cursor.execute("""
-                    UPDATE system_quotas
-                    SET usage_count = usage_count + ?, updated_at = ?
-                    WHERE quota_type = ?
-                """, (amount, datetime.now().isoformat(), quota_type))
+        storage = get_storage()
+        if should_reset:
+            storage.reset_system_quota(quota_type, amount, now_ms())
+            logger.info(f"重置系統配額: {quota_type}")
+        else:
+            new_usage = quota['usage_count'] + amount
+            if new_usage > quota['limit_count']:
+                logger.warning(f"系統配額超限: {quota_type}: {new_usage}/{quota['limit_count']}")
+                return False
+
+            storage.add_system_quota_usage(quota_type, amount, now_ms())
 
         return True
 
     @staticmethod
     def can_use(quota_type: str) -> bool:
-        """檢查系統配額是否可用"""
+        """檢查系統配額是否可用 (啟用配額引擎時扣除已預留的數量)"""
+        engine = get_quota_engine()
+        if engine is not None:
+            if not SystemQuota._ensure(engine, quota_type):
+                return False
+            return engine.can_use(('system', quota_type))
+
         quota = SystemQuota.get_quota(quota_type)
         if not quota:
             return False
 
         # 檢查重置
         reset_period = quota['reset_period']
-        last_reset = datetime.fromisoformat(quota['last_reset'])
+        last_reset = from_epoch_ms(quota['last_reset'])
 
         reset_deltas = {
             'minute': timedelta(minutes=1),
@@ -324,8 +553,62 @@ class SystemQuota:
 
     @staticmethod
     def get_all() -> List[Dict[str, Any]]:
-        """獲取所有系統配額"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("SELECT * FROM system_quotas")
-            return [dict(row) for row in cursor.fetchall()]
+        """獲取所有系統配額 (已載入配額引擎的配額使用引擎中的用量)"""
+        engine = get_quota_engine()
+        quotas = []
+        for row in get_storage().list_system_quotas():
+            quota = dict(row)
+            state = engine.get(('system', quota['quota_type'])) if engine is not None else None
+            if state is not None:
+                quota.update(
+                    usage_count=state['usage_count'],
+                    last_reset=state['last_reset'],
+                    updated_at=state['updated_at']
+                )
+            quotas.append(SystemQuota._to_dict(quota))
+        return quotas
+
+    @staticmethod
+    def _to_dict(row) -> Dict[str, Any]:
+        """資料庫行轉為字典 (時間欄位轉為 ISO 8601)"""
+        quota = dict(row)
+        for key in ('last_reset', 'updated_at'):
+            value = from_epoch_ms(quota[key])
+            quota[key] = value.isoformat() if value else None
+        return quota
+
+    # ==================== 非同步介面 ====================
+    # 於資料庫執行緒池執行,供事件迴圈中的協程使用
+
+    @staticmethod
+    async def aget_quota(quota_type: str) -> Optional[Dict[str, Any]]:
+        """非同步獲取系統配額"""
+        if SystemQuota._loaded(quota_type):
+            return SystemQuota.get_quota(quota_type)
+        return await run_in_db(SystemQuota.get_quota, quota_type)
+
+    @staticmethod
+    async def aincrement_usage(quota_type: str, amount: int = 1) -> bool:
+        """非同步增加系統配額使用量"""
+        if SystemQuota._loaded(quota_type):
+            return SystemQuota.increment_usage(quota_type, amount)
+        return await run_in_db(SystemQuota.increment_usage, quota_type, amount)
+
+    @staticmethod
+    async def acan_use(quota_type: str) -> bool:
+        """非同步檢查系統配額是否可用"""
+        if SystemQuota._loaded(quota_type):
+            return SystemQuota.can_use(quota_type)
+        return await run_in_db(SystemQuota.can_use, quota_type)
+
+    @staticmethod
+    async def areserve(quota_type: str, amount: int = 1) -> Optional[Reservation]:
+        """非同步預留系統配額"""
+        if SystemQuota._loaded(quota_type):
+            return SystemQuota.reserve(quota_type, amount)
+        return await run_in_db(SystemQuota.reserve, quota_type, amount)
+
+    @staticmethod
+    async def aget_all() -> List[Dict[str, Any]]:
+        """非同步獲取所有系統配額"""
+        return await run_in_db(SystemQuota.get_all)
@@ -0,0 +1,455 @@
+"""
+記憶體配額引擎
+- 使用者配額與系統配額的計數保存在記憶體,檢查與遞增不存取資料庫
+- 以單一鎖保護的計數器提供原子的檢查 + 遞增,以及預留 / 提交 / 歸還 (reserve / commit / release)
+- 計數器第一次使用時由資料庫載入,變更定期與關閉時寫回 (寫回前當機最多遺失一個間隔的用量)
+- 僅適用於單一行程 (多個行程共用資料庫時各自的計數不會合併)
+"""
+import threading
+from typing import Optional, Dict, Any, Callable, Tuple
+from .database import run_in_db
+from .storage import get_storage
+from .timestamps import now_ms
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# ('user', user_id, quota_type, reset_period) 或 ('system', quota_type)
+QuotaKey = Tuple[str, ...]
+
+
+class QuotaCounter:
+    """單一配額的計數狀態 (只在 QuotaEngine 的鎖內讀寫)"""
+
+    __slots__ = (
+        'usage', 'reserved', 'limit', 'reset_period', 'period_ms',
+        'last_reset', 'created_at', 'updated_at', 'row_id', 'dirty',
+    )
+
+    def __init__(
+        self,
+        usage: int,
+        limit: int,
+        reset_period: str,
+        period_ms: Optional[int],
+        last_reset: int,
+        created_at: Optional[int] = None,
+        updated_at: Optional[int] = None,
+        row_id: Optional[int] = None,
+        dirty: bool = False
+    ):
+        self.usage = usage
+        self.reserved = 0
+        self.limit = limit
+        self.reset_period = reset_period
+        self.period_ms = period_ms
+        self.last_reset = last_reset
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.row_id = row_id
+        self.dirty = dirty
+
+    def snapshot(self) -> Dict[str, Any]:
+        """目前的狀態 (與資料庫資料列相同的欄位名稱)"""
+        return {
+            'id': self.row_id,
+            'usage_count': self.usage,
+            'reserved': self.reserved,
+            'limit_count': self.limit,
+            'reset_period': self.reset_period,
+            'last_reset': self.last_reset,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+        }
+
+
+class Reservation:
+    """
+    預留的配額
+
+    呼叫 commit() 計入用量,或 release() 歸還;只有第一次呼叫有效。
+    blocking 為 True 時 (未啟用配額引擎,提交需寫入資料庫) 非同步介面改在資料庫執行緒池執行。
+    """
+
+    __slots__ = ('amount', 'settled', '_on_commit', '_on_release', '_blocking', '_lock')
+
+    def __init__(
+        self,
+        amount: int,
+        on_commit: Callable[[], Any],
+        on_release: Optional[Callable[[], Any]] = None,
+        blocking: bool = False
+    ):
+        self.amount = amount
+        self.settled = False
+        self._on_commit = on_commit
+        self._on_release = on_release
+        self._blocking = blocking
+        self._lock = threading.Lock()
+
+    def _settle(self) -> bool:
+        with self._lock:
+            if self.settled:
+                return False
+            self.settled = True
+            return True
+
+    def commit(self):
+        """將預留的數量計入用量"""
+        if self._settle():
+            self._on_commit()
+
+    def release(self):
+        """歸還預留的數量 (例如呼叫外部 API 失敗)"""
+        if self._settle() and self._on_release is not None:
+            self._on_release()
+
+    async def acommit(self):
+        """非同步提交"""
+        if self._blocking:
+            await run_in_db(self.commit)
+        else:
+            self.commit()
+
+    async def arelease(self):
+        """非同步歸還"""
+        if self._blocking:
+            await run_in_db(self.release)
+        else:
+            self.release()
+
+
+class QuotaEngine:
+    """
+    記憶體配額引擎
+
+    計數器由 Quota / SystemQuota 在第一次使用時以 load() 放入 (已存在時保留記憶體中的狀態),
+    之後的檢查、遞增與預留都只在記憶體中進行。用量 + 預留量不會超過上限;
+    預留量不寫入資料庫,行程結束時尚未提交的預留視同歸還。
+    """
+
+    def __init__(self):
+        """初始化配額引擎"""
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters: Dict[QuotaKey, QuotaCounter] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            'checks': 0, 'increments': 0, 'rejected': 0,
+            'reservations': 0, 'commits': 0, 'releases': 0,
+            'flushes': 0, 'rows_written': 0, 'flush_errors': 0,
+        }
+
+    # ==================== 計數器 ====================
+
+    def get(self, key: QuotaKey) -> Optional[Dict[str, Any]]:
+        """
+        獲取已載入的配額狀態
+
+        Args:
+            key: 配額鍵
+
+        Returns:
+            狀態快照,尚未載入時返回 None
+        """
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                return None
+            self._roll(counter, now_ms())
+            return counter.snapshot()
+
+    def contains(self, key: QuotaKey) -> bool:
+        """計數器是否已載入"""
+        return key in self._counters
+
+    def load(self, key: QuotaKey, counter: QuotaCounter) -> Dict[str, Any]:
+        """
+        放入由資料庫載入 (或新建) 的計數器,已存在時保留記憶體中的狀態
+
+        Args:
+            key: 配額鍵
+            counter: 計數器
+
+        Returns:
+            狀態快照
+        """
+        with self._lock:
+            counter = self._counters.setdefault(key, counter)
+            self._roll(counter, now_ms())
+            return counter.snapshot()
+
+    def store(self, key: QuotaKey, usage: int, limit: int, last_reset: int):
+        """
+        直接設定計數器的用量、上限與重置時間 (例如管理操作),下次寫回時寫入資料庫
+
+        Args:
+            key: 配額鍵 (必須已載入)
+            usage: 用量
+            limit: 上限
+            last_reset: 上次重置時間 (epoch 毫秒)
+        """
+        with self._lock:
+            counter = self._counters[key]
+            counter.usage = usage
+            counter.limit = limit
+            counter.last_reset = last_reset
+            counter.updated_at = now_ms()
+            counter.dirty = True
+
+    @staticmethod
+    def _roll(counter: QuotaCounter, now: int) -> bool:
+        """超過重置週期時歸零 (須持有鎖),返回是否重置"""
+        if counter.period_ms is None or now - counter.last_reset <= counter.period_ms:
+            return False
+        counter.usage = 0
+        counter.last_reset = now
+        counter.updated_at = now
+        counter.dirty = True
+        return True
+
+    def roll(self, key: QuotaKey) -> bool:
+        """
+        檢查並重置配額
+
+        Args:
+            key: 配額鍵 (必須已載入)
+
+        Returns:
+            是否進行了重置
+        """
+        with self._lock:
+            return self._roll(self._counters[key], now_ms())
+
+    # ==================== 檢查與使用 ====================
+
+    def can_use(self, key: QuotaKey, amount: int = 1) -> bool:
+        """
+        是否還有配額 (用量 + 預留量 + amount 不超過上限)
+
+        Args:
+            key: 配額鍵 (必須已載入)
+            amount: 需要的數量
+
+        Returns:
+            是否可以使用
+        """
+        with self._lock:
+            counter = self._counters[key]
+            self._roll(counter, now_ms())
+            self._stats['checks'] += 1
+            return counter.usage + counter.reserved + amount <= counter.limit
+
+    def increment(self, key: QuotaKey, amount: int = 1) -> bool:
+        """
+        檢查並增加用量 (原子操作)
+
+        Args:
+            key: 配額鍵 (必須已載入)
+            amount: 增加數量
+
+        Returns:
+            是否成功 (超過上限時不增加)
+        """
+        with self._lock:
+            counter = self._counters[key]
+            now = now_ms()
+            self._roll(counter, now)
+            if counter.usage + counter.reserved + amount > counter.limit:
+                self._stats['rejected'] += 1
+                return False
+            counter.usage += amount
+            counter.updated_at = now
+            counter.dirty = True
+            self._stats['increments'] += 1
+            return True
+
+    def reserve(self, key: QuotaKey, amount: int = 1) -> Optional[Reservation]:
+        """
+        預留配額 (呼叫外部 API 前),之後以 commit() 計入用量或 release() 歸還
+
+        Args:
+            key: 配額鍵 (必須已載入)
+            amount: 預留數量
+
+        Returns:
+            Reservation,配額不足時返回 None
+        """
+        with self._lock:
+            counter = self._counters[key]
+            self._roll(counter, now_ms())
+            if counter.usage + counter.reserved + amount > counter.limit:
+                self._stats['rejected'] += 1
+                return None
+            counter.reserved += amount
+            self._stats['reservations'] += 1
+        return Reservation(
+            amount,
+            on_commit=lambda: self._commit(key, amount),
+            on_release=lambda: self._release(key, amount)
+        )
+
+    def _commit(self, key: QuotaKey, amount: int):
+        """預留轉為用量 (預留期間跨過重置時,計入新的週期)"""
+        with self._lock:
+            counter = self._counters[key]
+            now = now_ms()
+            self._roll(counter, now)
+            counter.reserved = max(0, counter.reserved - amount)
+            counter.usage += amount
+            counter.updated_at = now
+            counter.dirty = True
+            self._stats['commits'] += 1
+
+    def _release(self, key: QuotaKey, amount: int):
+        """歸還預留"""
+        with self._lock:
+            counter = self._counters[key]
+            counter.reserved = max(0, counter.reserved - amount)
+            self._stats['releases'] += 1
+
+    # ==================== 寫回 ====================
+
+    def flush(self) -> int:
+        """
+        將有變更的計數器寫回資料庫
+
+        Returns:
+            寫入的配額數
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending = []
+                for key, counter in self._counters.items():
+                    if counter.dirty:
+                        pending.append((key, counter, counter.snapshot()))
+                        counter.dirty = False
+
+            written = 0
+            storage = get_storage()
+            for key, counter, snapshot in pending:
+                try:
+                    row_id = self._write(storage, key, snapshot)
+                except Exception as e:
+                    with self._lock:
+                        counter.dirty = True
+                        self._stats['flush_errors'] += 1
+                    logger.error(f"寫回配額失敗 {key}: {e}")
+                    continue
+                if row_id is not None:
+                    with self._lock:
+                        counter.row_id = row_id
+                written += 1
+
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['rows_written'] += written
+            return written
+
+    @staticmethod
+    def _write(storage, key: QuotaKey, snapshot: Dict[str, Any]) -> Optional[int]:
+        """寫入單一配額,新建的使用者配額返回新的 id"""
+        updated_at = snapshot['updated_at'] or now_ms()
+        if key[0] == 'system':
+            storage.save_system_quota(key[1], snapshot['usage_count'], snapshot['last_reset'], updated_at)
+            return None
+        if snapshot['id'] is not None:
+            storage.update_quota(
+                snapshot['id'],
+                snapshot['usage_count'],
+                snapshot['limit_count'],
+                snapshot['last_reset'],
+                updated_at
+            )
+            return None
+        _, user_id, quota_type, reset_period = key
+        return storage.insert_quota({
+            'user_id': user_id,
+            'quota_type': quota_type,
+            'usage_count': snapshot['usage_count'],
+            'limit_count': snapshot['limit_count'],
+            'reset_period': reset_period,
+            'last_reset': snapshot['last_reset'],
+            'created_at': snapshot['created_at'] or updated_at,
+            'updated_at': updated_at,
+        })
+
+    def start(self, interval_seconds: float = 5.0):
+        """
+        啟動背景寫回
+
+        Args:
+            interval_seconds: 寫回間隔 (秒)
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop_event.wait(interval_seconds):
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.exception(f"配額寫回失敗: {e}")
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=run, daemon=True, name="QuotaEngine")
+        self._thread.start()
+        logger.info(f"配額引擎已啟動 (每 {interval_seconds} 秒寫回)")
+
+    def stop(self):
+        """停止背景寫回並寫入剩餘的變更"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取配額引擎統計資訊
+
+        Returns:
+            統計資訊字典
+        """
+        with self._lock:
+            return {
+                **self._stats,
+                'counters': len(self._counters),
+                'dirty': sum(1 for counter in self._counters.values() if counter.dirty),
+                'reserved': sum(counter.reserved for counter in self._counters.values()),
+            }
+
+
+# 全域配額引擎 (未啟動時為 None)
+_engine: Optional[QuotaEngine] = None
+
+
+def start_quota_engine(interval_seconds: float = 5.0) -> QuotaEngine:
+    """
+    啟動全域配額引擎
+
+    Args:
+        interval_seconds: 寫回間隔 (秒)
+
+    Returns:
+        QuotaEngine 實例
+    """
+    global _engine
+    if _engine is None:
+        _engine = QuotaEngine()
+        _engine.start(interval_seconds)
+    return _engine
+
+
+def get_quota_engine() -> Optional[QuotaEngine]:
+    """獲取全域配額引擎,未啟動時返回 None"""
+    return _engine
+
+
+def stop_quota_engine():
+    """停止全域配額引擎 (寫入剩餘的變更)"""
+    global _engine
+    if _engine is not None:
+        _engine.stop()
+        _engine = None
@@ -0,0 +1,292 @@
+"""
+最近訊息環狀緩衝
+- 每個群組與全域各保留最近 N 則訊息,由 Message.save 寫入
+- 最近訊息、群組訊息與第一頁分頁直接由記憶體回答,更深的歷史仍查詢資料庫
+- 總大小以位元組估算設上限,超過時淘汰最久未使用的群組
+- 僅適用於單一行程寫入 (其他行程寫入的訊息不會出現在緩衝中)
+"""
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Callable
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 每則訊息的固定成本估算 (字典、鍵與其他欄位)
+ROW_OVERHEAD_BYTES = 400
+
+
+def _order_key(row: Dict[str, Any]):
+    """
+    緩衝內的排序鍵 (由舊到新)
+
+    反轉後須與分頁的 ORDER BY created_at DESC, id ASC 一致:
+    同一時間的訊息 id 較大的排在前面,尚未寫入資料庫 (id 為 None) 的排在最前面。
+    """
+    row_id = row['id']
+    return (row['created_at'], float('-inf') if row_id is None else -row_id)
+
+
+def _row_size(row: Dict[str, Any]) -> int:
+    """估算一則訊息在緩衝中佔用的位元組數"""
+    return ROW_OVERHEAD_BYTES + len(row.get('content') or '') + len(row.get('metadata') or '')
+
+
+class _Ring:
+    """單一群組 (或全域) 的訊息緩衝,依 _order_key 由舊到新排列"""
+
+    __slots__ = ('capacity', 'rows', 'keys', 'message_ids', 'bytes', 'primed', 'exhaustive')
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.rows: List[Dict[str, Any]] = []
+        # 與 rows 對應的排序鍵 (bisect 的 key 參數需要 Python 3.10 以上)
+        self.keys: List[tuple] = []
+        self.message_ids = set()
+        self.bytes = 0
+        # primed: 已由資料庫載入,緩衝是完整歷史的最新一段
+        # exhaustive: 緩衝包含該群組的全部訊息 (從未淘汰過)
+        self.primed = False
+        self.exhaustive = False
+
+    def add(self, row: Dict[str, Any]) -> int:
+        """
+        加入訊息
+
+        Returns:
+            緩衝大小的變化 (位元組)
+        """
+        if row['message_id'] in self.message_ids:
+            return 0
+        key = _order_key(row)
+        position = bisect_left(self.keys, key)
+        if position == 0 and self.rows and self.primed and not self.exhaustive:
+            # 比緩衝中最舊的訊息還舊 (例如匯入歷史),屬於已不在緩衝中的範圍
+            return 0
+
+        before = self.bytes
+        self.rows.insert(position, row)
+        self.keys.insert(position, key)
+        self.message_ids.add(row['message_id'])
+        self.bytes += _row_size(row)
+        while len(self.rows) > self.capacity:
+            self.pop_oldest()
+        return self.bytes - before
+
+    def pop_oldest(self) -> int:
+        """
+        淘汰最舊的訊息
+
+        Returns:
+            釋放的位元組數
+        """
+        row = self.rows.pop(0)
+        self.keys.pop(0)
+        self.message_ids.discard(row['message_id'])
+        size = _row_size(row)
+        self.bytes -= size
+        self.exhaustive = False
+        return size
+
+    def replace(self, rows: List[Dict[str, Any]], exhaustive: bool):
+        """以資料庫載入的訊息與目前的緩衝合併後取代內容"""
+        merged: Dict[str, Dict[str, Any]] = {row['message_id']: row for row in self.rows}
+        # 資料庫的資料列有 id,優先使用
+        merged.update((row['message_id'], row) for row in rows)
+        ordered = sorted(merged.values(), key=_order_key)
+        self.rows = ordered[-self.capacity:]
+        self.keys = [_order_key(row) for row in self.rows]
+        self.message_ids = {row['message_id'] for row in self.rows}
+        self.bytes = sum(_row_size(row) for row in self.rows)
+        self.primed = True
+        self.exhaustive = exhaustive and len(ordered) <= self.capacity
+
+
+class RecentMessages:
+    """
+    最近訊息環狀緩衝
+
+    資料列與儲存後端返回的格式相同 (created_at 為 epoch 毫秒、metadata 為 JSON 文字),
+    讀取時同樣以 Message.from_db_row 轉換。群組緩衝第一次被讀取時才由資料庫載入
+    最新的一段 (之後的寫入持續附加),無法完整回答的查詢返回 None,由呼叫者查詢資料庫。
+    """
+
+    def __init__(
+        self,
+        per_group: int = 200,
+        global_size: int = 500,
+        max_bytes: int = 16 * 1024 * 1024
+    ):
+        """
+        初始化緩衝
+
+        Args:
+            per_group: 每個群組保留的訊息數
+            global_size: 全域保留的訊息數
+            max_bytes: 所有緩衝合計的大小上限 (估算值)
+        """
+        self.per_group = max(1, per_group)
+        self.global_size = max(1, global_size)
+        self.max_bytes = max(0, max_bytes)
+        self._lock = threading.Lock()
+        # 群組緩衝依最近使用排序 (最久未使用的在前)
+        self._groups: 'OrderedDict[str, _Ring]' = OrderedDict()
+        self._global = _Ring(self.global_size)
+        self._bytes = 0
+        # 每次 clear() 遞增,避免載入途中被清除的緩衝再被填入舊資料
+        self._generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'loads': 0, 'evicted_groups': 0}
+
+    def _ring(self, group_id: Optional[str], create: bool = False) -> Optional[_Ring]:
+        """取得群組 (或全域) 緩衝並標記為最近使用"""
+        if not group_id:
+            return self._global
+        ring = self._groups.get(group_id)
+        if ring is None and create:
+            ring = self._groups[group_id] = _Ring(self.per_group)
+        if ring is not None:
+            self._groups.move_to_end(group_id)
+        return ring
+
+    def _enforce_budget(self):
+        """超過大小上限時淘汰最久未使用的群組,仍超過時縮減全域緩衝"""
+        while self._bytes > self.max_bytes and self._groups:
+            _, ring = self._groups.popitem(last=False)
+            self._bytes -= ring.bytes
+            self._stats['evicted_groups'] += 1
+        while self._bytes > self.max_bytes and self._global.rows:
+            self._bytes -= self._global.pop_oldest()
+
+    def add(self, row: Dict[str, Any]):
+        """
+        加入剛寫入的訊息
+
+        Args:
+            row: messages 的資料列 (id 未知時為 None)
+        """
+        with self._lock:
+            self._bytes += self._global.add(row)
+            if row.get('group_id'):
+                self._bytes += self._ring(row['group_id'], create=True).add(row)
+            self._enforce_budget()
+
+    def recent(
+        self,
+        limit: int,
+        offset: int = 0,
+        group_id: Optional[str] = None,
+        platform: Optional[str] = None,
+        load: Optional[Callable[[int], List[Any]]] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        由緩衝獲取最近的訊息 (新到舊)
+
+        Args:
+            limit: 數量
+            offset: 偏移量
+            group_id: 群組 ID (None 表示全域)
+            platform: 篩選平台
+            load: 緩衝尚未載入時呼叫 load(n) 由資料庫取得最新的 n 則 (新到舊)
+
+        Returns:
+            訊息資料列列表,緩衝無法完整回答時返回 None
+        """
+        with self._lock:
+            ring = self._ring(group_id)
+            primed = ring is not None and ring.primed
+            generation = self._generation
+
+        if not primed:
+            if load is None:
+                with self._lock:
+                    self._stats['misses'] += 1
+                return None
+            capacity = self.per_group if group_id else self.global_size
+            rows = [dict(row) for row in load(capacity)]
+            with self._lock:
+                if generation != self._generation:
+                    self._stats['misses'] += 1
+                    return None
+                ring = self._ring(group_id, create=True)
+                self._bytes -= ring.bytes
+                ring.replace(rows, exhaustive=len(rows) < capacity)
+                self._bytes += ring.bytes
+                self._stats['loads'] += 1
+                self._enforce_budget()
+
+        with self._lock:
+            ring = self._ring(group_id)
+            if ring is None or not ring.primed:
+                # 載入後隨即因大小上限被淘汰
+                self._stats['misses'] += 1
+                return None
+            rows = ring.rows[::-1]
+            if platform:
+                rows = [row for row in rows if row['platform'] == platform]
+            end = offset + limit
+            if len(rows) < end and not ring.exhaustive:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            return rows[offset:end]
+
+    def clear(self):
+        """清除所有緩衝 (刪除或封存訊息後呼叫,之後的讀取會重新由資料庫載入)"""
+        with self._lock:
+            self._groups.clear()
+            self._global = _Ring(self.global_size)
+            self._bytes = 0
+            self._generation += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取緩衝統計資訊
+
+        Returns:
+            統計資訊字典
+        """
+        with self._lock:
+            return {
+                **self._stats,
+                'groups': len(self._groups),
+                'global_rows': len(self._global.rows),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# 全域最近訊息緩衝 (未設定時為 None)
+_recent: Optional[RecentMessages] = None
+
+
+def configure_recent_buffer(
+    per_group: int = 200,
+    global_size: int = 500,
+    max_bytes: int = 16 * 1024 * 1024
+) -> Optional[RecentMessages]:
+    """
+    設定全域最近訊息緩衝
+
+    Args:
+        per_group: 每個群組保留的訊息數 (0 表示停用)
+        global_size: 全域保留的訊息數
+        max_bytes: 大小上限 (位元組)
+
+    Returns:
+        RecentMessages 實例,停用時返回 None
+    """
+    global _recent
+    _recent = RecentMessages(per_group, global_size, max_bytes) if per_group > 0 else None
+    return _recent
+
+
+def get_recent_buffer() -> Optional[RecentMessages]:
+    """獲取全域最近訊息緩衝,未設定時返回 None"""
+    return _recent
+
+
+def invalidate_recent_buffer():
+    """清除全域最近訊息緩衝 (未設定時不做任何事)"""
+    if _recent is not None:
+        _recent.clear()
@@ -0,0 +1,406 @@
+"""
+資料保留期限模組
+- 依 message_type / 平台設定不同的保留天數 (例如 AI 對話較短、橋接訊息較長)
+- 以 rowid 範圍分批刪除,每批一個短交易,批次間暫停讓即時流量取得寫入鎖
+- 一併清理 chat_history 與已發送的 queued_messages
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
+from .database import Database, get_db
+from .recent import invalidate_recent_buffer
+from .timestamps import now_ms
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class RetentionPolicy:
+    """單一保留規則"""
+
+    TABLES = ('messages', 'chat_history', 'queued_messages')
+
+    def __init__(
+        self,
+        table: str,
+        days: int,
+        message_type: Optional[str] = None,
+        platform: Optional[str] = None
+    ):
+        """
+        初始化保留規則
+
+        Args:
+            table: 'messages'、'chat_history' 或 'queued_messages' (只刪除已發送的)
+            days: 保留天數 (0 表示永久保留,可用來排除特定類型)
+            message_type: 只套用於此訊息類型 (僅 messages)
+            platform: 只套用於此平台 (僅 messages)
+
+        Raises:
+            ValueError: 不支援的資料表或篩選條件
+        """
+        if table not in self.TABLES:
+            raise ValueError(f"不支援的保留資料表: {table}")
+        if table != 'messages' and (message_type or platform):
+            raise ValueError(f"{table} 不支援依訊息類型或平台設定保留期限")
+        if days < 0:
+            raise ValueError(f"保留天數不可為負數: {days}")
+        self.table = table
+        self.days = days
+        self.message_type = message_type
+        self.platform = platform
+
+    @property
+    def specificity(self) -> int:
+        """規則的明確程度 (類型 + 平台 > 類型 > 平台 > 全部)"""
+        return (2 if self.message_type else 0) + (1 if self.platform else 0)
+
+    def cutoff(self, now: int) -> Optional[int]:
+        """
+        計算刪除界線
+
+        Args:
+            now: 目前時間 (epoch 毫秒)
+
+        Returns:
+            早於此時間 (epoch 毫秒) 的資料列會被刪除,永久保留時返回 None
+        """
+        if self.days == 0:
+            return None
+        return now - self.days * 86400000
+
+    def __repr__(self):
+        scope = self.table
+        if self.message_type:
+            scope += f".{self.message_type}"
+        if self.platform:
+            scope += f"@{self.platform}"
+        return f"{scope}={self.days}"
+
+
+def parse_policies(value: str) -> List[RetentionPolicy]:
+    """
+    解析保留規則設定
+
+    格式為以逗號分隔的 '範圍=天數',範圍為 資料表[.訊息類型][@平台],例如
+    'messages=180,messages.ai_request=30,messages@discord=365,chat_history=30,queued_messages=7'。
+    同一則訊息符合多個規則時,以最明確的規則為準。
+
+    Args:
+        value: 設定字串 (空字串表示沒有規則)
+
+    Returns:
+        規則列表
+
+    Raises:
+        ValueError: 格式錯誤或範圍重複
+    """
+    policies = []
+    seen = set()
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        scope, sep, days = item.partition('=')
+        if not sep or not days.strip().isdigit():
+            raise ValueError(f"無效的保留規則: {item}")
+        scope, _, platform = scope.strip().partition('@')
+        table, _, message_type = scope.partition('.')
+        policy = RetentionPolicy(table, int(days), message_type or None, platform or None)
+        key = (policy.table, policy.message_type, policy.platform)
+        if key in seen:
+            raise ValueError(f"重複的保留規則: {item}")
+        seen.add(key)
+        policies.append(policy)
+    return policies
+
+
+class RetentionEngine:
+    """分批刪除過期資料的保留引擎"""
+
+    def __init__(
+        self,
+        db: Database,
+        policies: Optional[List[RetentionPolicy]] = None,
+        batch_size: int = 1000,
+        pause_ms: float = 50.0
+    ):
+        """
+        初始化保留引擎
+
+        Args:
+            db: 資料庫實例
+            policies: 保留規則
+            batch_size: 每批涵蓋的 rowid 範圍 (每批一個交易)
+            pause_ms: 批次之間的暫停時間 (毫秒)
+        """
+        self.db = db
+        self.policies = list(policies or [])
+        self.batch_size = max(1, batch_size)
+        self.pause_ms = pause_ms
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats: Dict[str, Any] = {
+            'runs': 0,
+            'deleted_total': 0,
+            'last_run': None,
+            'last_result': {},
+        }
+
+    # ==================== 分批刪除 ====================
+
+    def delete_in_batches(
+        self,
+        table: str,
+        condition: str,
+        params: tuple,
+        bound: str,
+        bound_params: tuple
+    ) -> Dict[str, Any]:
+        """
+        以 rowid 範圍分批刪除符合條件的資料列
+
+        先以索引找出需要處理的最大 rowid,之後每批只處理 [lo, lo + batch_size)
+        的 rowid 範圍,寫入鎖持有時間與資料表大小無關。
+
+        Args:
+            table: 資料表 (需以 id 為 INTEGER PRIMARY KEY)
+            condition: 刪除條件 (WHERE 子句)
+            params: 刪除條件的參數
+            bound: 可走索引的必要條件,用來決定 rowid 上限
+            bound_params: 必要條件的參數
+
+        Returns:
+            {'deleted', 'batches', 'elapsed_ms', 'max_batch_ms', 'rows_per_sec'}
+        """
+        started = time.monotonic()
+        deleted = 0
+        batches = 0
+        max_batch_ms = 0.0
+        # queued_messages 可能位於獨立的狀態資料庫
+        db = self.db.database_for(table)
+
+        with db.get_cursor() as cursor:
+            # +id: 避免 SQLite 以 rowid 由尾端倒序逐列檢查 (會讀過所有保留的資料列),改走 bound 的索引
+            cursor.execute(f"SELECT MAX(+id) FROM {table} WHERE {bound}", bound_params)
+            upper_id = cursor.fetchone()[0]
+            cursor.execute(f"SELECT MIN(id) FROM {table}")
+            low = cursor.fetchone()[0]
+
+        while upper_id is not None and low is not None and low <= upper_id:
+            if self._stop_event.is_set():
+                logger.info(f"保留作業已中止 ({table})")
+                break
+
+            high = min(low + self.batch_size, upper_id + 1)
+            batch_started = time.monotonic()
+            with db.get_cursor() as cursor:
+                cursor.execute(f"""
+                    DELETE FROM {table}
+                    WHERE id >= ? AND id < ? AND {condition}
+                """, (low, high, *params))
+                deleted += cursor.rowcount
+                # 跳過已刪除造成的 rowid 空洞
+                cursor.execute(f"SELECT MIN(id) FROM {table} WHERE id >= ?", (high,))
+                low = cursor.fetchone()[0]
+            batches += 1
+            max_batch_ms = max(max_batch_ms, (time.monotonic() - batch_started) * 1000)
+
+            if self.pause_ms > 0:
+                self._stop_event.wait(self.pause_ms / 1000)
+
+        if table == 'messages' and deleted:
+            # 最近訊息緩衝可能含有已刪除的訊息
+            invalidate_recent_buffer()
+        elapsed = time.monotonic() - started
+        return {
+            'deleted': deleted,
+            'batches': batches,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'max_batch_ms': round(max_batch_ms, 2),
+            'rows_per_sec': round(deleted / elapsed) if elapsed > 0 else 0,
+        }
+
+    def _message_condition(self, now: int) -> Optional[Tuple[str, tuple, int]]:
+        """
+        組合訊息的刪除條件
+
+        以 CASE 依明確程度逐一比對規則,每則訊息只套用最明確的一條;
+        沒有任何規則符合或規則為永久保留時,CASE 結果為 NULL (不刪除)。
+
+        Returns:
+            (條件, 參數, 最晚的刪除界線),沒有會刪除資料的規則時返回 None
+        """
+        policies = sorted(
+            (p for p in self.policies if p.table == 'messages'),
+            key=lambda p: p.specificity,
+            reverse=True
+        )
+        cutoffs = [p.cutoff(now) for p in policies if p.cutoff(now) is not None]
+        if not cutoffs:
+            return None
+
+        branches = []
+        params: list = []
+        fallback = None
+        for policy in policies:
+            if policy.specificity == 0:
+                fallback = policy.cutoff(now)
+                continue
+            tests = []
+            if policy.message_type:
+                tests.append("message_type = ?")
+                params.append(policy.message_type)
+            if policy.platform:
+                # 平台以整數鍵儲存,子查詢只在語句開始時執行一次
+                tests.append("platform_key = (SELECT id FROM platforms WHERE name = ?)")
+                params.append(policy.platform)
+            branches.append(f"WHEN {' AND '.join(tests)} THEN ?")
+            params.append(policy.cutoff(now))
+        params.append(fallback)
+
+        if branches:
+            condition = f"created_at < CASE {' '.join(branches)} ELSE ? END"
+        else:
+            condition = "created_at < ?"
+        return condition, tuple(params), max(cutoffs)
+
+    def run(self) -> Dict[str, Dict[str, Any]]:
+        """
+        依規則清理所有資料表
+
+        Returns:
+            各資料表的結果 (見 delete_in_batches)
+        """
+        if not self._lock.acquire(blocking=False):
+            logger.info("保留作業進行中,略過本次")
+            return {}
+
+        try:
+            now = now_ms()
+            results: Dict[str, Dict[str, Any]] = {}
+
+            message_condition = self._message_condition(now)
+            if message_condition is not None:
+                condition, params, latest = message_condition
+                results['messages'] = self.delete_in_batches(
+                    'messages', condition, params,
+                    "created_at < ?", (latest,)
+                )
+
+            for policy in self.policies:
+                cutoff = policy.cutoff(now)
+                if cutoff is None:
+                    continue
+                if policy.table == 'chat_history':
+                    results['chat_history'] = self.delete_in_batches(
+                        'chat_history', "created_at < ?", (cutoff,),
+                        "created_at < ?", (cutoff,)
+                    )
+                elif policy.table == 'queued_messages':
+                    sent = "status = 'sent' AND created_at < ?"
+                    results['queued_messages'] = self.delete_in_batches(
+                        'queued_messages', sent, (cutoff,), sent, (cutoff,)
+                    )
+
+            deleted = sum(result['deleted'] for result in results.values())
+            self._stats['runs'] += 1
+            self._stats['deleted_total'] += deleted
+            self._stats['last_run'] = datetime.now().isoformat()
+            self._stats['last_result'] = results
+            for table, result in results.items():
+                if result['deleted']:
+                    logger.info(
+                        f"清理 {table}: {result['deleted']} 筆 "
+                        f"({result['batches']} 批, {result['rows_per_sec']} 筆/秒, "
+                        f"單批最長 {result['max_batch_ms']} ms)"
+                    )
+            return results
+        finally:
+            self._lock.release()
+
+    # ==================== 排程 ====================
+
+    def start(self, interval_hours: float = 24.0):
+        """
+        啟動背景保留排程
+
+        Args:
+            interval_hours: 執行間隔 (小時)
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop_event.wait(interval_hours * 3600):
+                try:
+                    self.run()
+                except Exception as e:
+                    logger.exception(f"保留作業失敗: {e}")
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=run, daemon=True, name="RetentionEngine")
+        self._thread.start()
+        logger.info(f"保留排程已啟動 (規則: {self.policies}, 每 {interval_hours} 小時)")
+
+    def stop(self):
+        """停止背景保留排程 (進行中的作業會在目前批次結束後中止)"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取保留統計資訊
+
+        Returns:
+            統計資訊字典
+        """
+        stats = dict(self._stats)
+        stats['policies'] = [repr(policy) for policy in self.policies]
+        return stats
+
+
+# 全域保留引擎 (未設定時為 None)
+_engine: Optional[RetentionEngine] = None
+
+
+def start_retention_engine(
+    db: Optional[Database] = None,
+    policies: Optional[List[RetentionPolicy]] = None,
+    interval_hours: float = 24.0,
+    **kwargs
+) -> RetentionEngine:
+    """
+    啟動全域保留引擎
+
+    Args:
+        db: 資料庫實例 (預設使用全域實例)
+        policies: 保留規則
+        interval_hours: 執行間隔 (小時)
+        **kwargs: 傳給 RetentionEngine 的參數
+
+    Returns:
+        RetentionEngine 實例
+    """
+    global _engine
+    if _engine is None:
+        _engine = RetentionEngine(db or get_db(), policies, **kwargs)
+        _engine.start(interval_hours)
+    return _engine
+
+
+def get_retention_engine() -> Optional[RetentionEngine]:
+    """獲取全域保留引擎,未啟動時返回 None"""
+    return _engine
+
+
+def stop_retention_engine():
+    """停止全域保留引擎"""
+    global _engine
+    if _engine is not None:
+        _engine.stop()
+        _engine = None
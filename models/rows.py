@@ -0,0 +1,49 @@
+"""
+資料列延遲解碼工具
+- 模型從資料庫載入時保留 metadata 的 JSON 文字與 epoch 毫秒原始值
+- 第一次存取 metadata / 時間屬性時才解碼,只需要 content 或計數的呼叫者不付出解碼成本
+"""
+import json
+from typing import Any, Dict, Optional, Union
+from .timestamps import from_epoch_ms
+
+# 尚未解碼的標記 (metadata 可能合法地為空字典,時間可能為 None)
+UNSET = object()
+
+# 不需呼叫 json.loads 即可得知為空的 metadata 原始值
+EMPTY_METADATA = frozenset(('', '{}', 'null'))
+
+
+def decode_metadata(raw: Optional[str]) -> Dict[str, Any]:
+    """
+    解碼 metadata 欄位
+
+    Args:
+        raw: 資料庫中的 JSON 文字
+
+    Returns:
+        metadata 字典 (空值時為新的空字典)
+    """
+    if raw is None or raw in EMPTY_METADATA:
+        return {}
+    return json.loads(raw) or {}
+
+
+def encode_metadata(metadata: Optional[Dict[str, Any]]) -> str:
+    """將 metadata 字典編碼為資料庫中的 JSON 文字"""
+    return json.dumps(metadata or {}, ensure_ascii=False)
+
+
+def isoformat_ms(value: Union[int, float, str, None]) -> Optional[str]:
+    """
+    將資料庫中的 epoch 毫秒直接轉為 ISO 8601 字串 (與 datetime.isoformat() 相同)
+
+    Args:
+        value: epoch 毫秒 (舊封存檔可能仍為 ISO 字串)
+
+    Returns:
+        ISO 8601 字串,None 時返回 None
+    """
+    if value is None:
+        return None
+    return from_epoch_ms(value).isoformat()
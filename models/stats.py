@@ -0,0 +1,213 @@
+"""
+統計彙總模型
+- 讀取由觸發器維護的彙總表 (見 database._migrate_rollups)
+- 資料列數與訊息時間桶,查詢成本與資料量無關
+"""
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any
+from .database import Database, get_db, run_in_db
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class Stats:
+    """統計彙總"""
+
+    # 支援的時間粒度
+    GRANULARITIES = ('hour', 'day', 'week')
+
+    @staticmethod
+    def count(name: str, platform: Optional[str] = None, db: Optional[Database] = None) -> int:
+        """
+        獲取資料列數
+
+        Args:
+            name: 'users', 'active_users', 'messages', 'chat_history' 或 'quotas'
+            platform: 篩選平台 (None 表示全部)
+            db: 資料庫實例 (預設使用全域實例)
+
+        Returns:
+            資料列數
+        """
+        # quotas 的計數在狀態資料庫 (分離時)
+        db = (db or get_db()).database_for(name)
+        with db.get_cursor() as cursor:
+            if platform:
+                cursor.execute("""
+                    SELECT count FROM row_counts
+                    WHERE name = ? AND platform = ?
+                """, (name, platform))
+                row = cursor.fetchone()
+                return row[0] if row else 0
+
+            cursor.execute("""
+                SELECT COALESCE(SUM(count), 0) FROM row_counts
+                WHERE name = ?
+            """, (name,))
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def get_counts() -> Dict[str, Dict[str, int]]:
+        """
+        獲取所有資料列數
+
+        Returns:
+            {name: {platform: count}},platform 為空字串表示不分平台的表
+        """
+        db = get_db()
+        counts: Dict[str, Dict[str, int]] = {}
+        with db.get_cursor() as cursor:
+            cursor.execute("SELECT name, platform, count FROM row_counts")
+            for name, platform, count in cursor.fetchall():
+                counts.setdefault(name, {})[platform] = count
+        if db.state is not db:
+            # 分離後主資料庫的 quotas 計數不再更新,改用狀態資料庫的計數
+            with db.state.get_cursor() as cursor:
+                cursor.execute("SELECT name, platform, count FROM row_counts")
+                state_counts: Dict[str, Dict[str, int]] = {}
+                for name, platform, count in cursor.fetchall():
+                    state_counts.setdefault(name, {})[platform] = count
+            counts.update(state_counts)
+            counts.setdefault('quotas', {'': 0})
+        return counts
+
+    @staticmethod
+    def count_messages_since(
+        since: datetime,
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None
+    ) -> int:
+        """
+        統計某時間之後 (以日為單位) 收到的訊息數
+
+        Args:
+            since: 起始日期 (含)
+            platform: 篩選平台
+            group_id: 篩選群組
+
+        Returns:
+            訊息數量
+        """
+        conditions = ["day >= ?"]
+        params: list = [since.strftime('%Y-%m-%d')]
+        if platform:
+            conditions.append("platform = ?")
+            params.append(platform)
+        if group_id:
+            conditions.append("group_id = ?")
+            params.append(group_id)
+
+        db = get_db()
+        with db.get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT COALESCE(SUM(count), 0) FROM message_counts_daily
+                WHERE {' AND '.join(conditions)}
+            """, params)
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def message_series(
+        start: datetime,
+        end: datetime,
+        granularity: str = 'day',
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        獲取訊息數時間序列
+
+        Args:
+            start: 起始時間 (含)
+            end: 結束時間 (不含)
+            granularity: 'hour', 'day' 或 'week' (週一為一週起點)
+            platform: 篩選平台
+            group_id: 篩選群組
+
+        Returns:
+            [{'bucket': str, 'count': int}],依時間排序,沒有訊息的桶不列出
+
+        Raises:
+            ValueError: 不支援的時間粒度
+        """
+        if granularity not in Stats.GRANULARITIES:
+            raise ValueError(f"不支援的時間粒度: {granularity}")
+
+        if granularity == 'hour':
+            table, column = 'message_counts_hourly', 'hour'
+            bucket = 'hour'
+            bounds = [start.strftime('%Y-%m-%d %H:00'), end.strftime('%Y-%m-%d %H:00')]
+            # 結束時間不在整點時包含其所在的桶
+            if end.minute or end.second or end.microsecond:
+                bounds[1] = (end + timedelta(hours=1)).strftime('%Y-%m-%d %H:00')
+        else:
+            table, column = 'message_counts_daily', 'day'
+            bucket = 'day' if granularity == 'day' else "date(day, '-6 days', 'weekday 1')"
+            bounds = [start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')]
+            if end.time() != datetime.min.time():
+                bounds[1] = (end + timedelta(days=1)).strftime('%Y-%m-%d')
+
+        conditions = [f"{column} >= ?", f"{column} < ?"]
+        params: list = bounds
+        if platform:
+            conditions.append("platform = ?")
+            params.append(platform)
+        if group_id:
+            conditions.append("group_id = ?")
+            params.append(group_id)
+
+        db = get_db()
+        with db.get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {bucket} AS bucket, SUM(count)
+                FROM {table}
+                WHERE {' AND '.join(conditions)}
+                GROUP BY 1
+                ORDER BY 1
+            """, params)
+            return [{'bucket': row[0], 'count': row[1]} for row in cursor.fetchall()]
+
+    @staticmethod
+    def platform_distribution(start: datetime, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        獲取時間範圍內各平台的訊息數
+
+        Args:
+            start: 起始日期 (含)
+            end: 結束日期 (不含,None 表示至今)
+
+        Returns:
+            [{'platform': str, 'count': int}]
+        """
+        conditions = ["day >= ?"]
+        params: list = [start.strftime('%Y-%m-%d')]
+        if end:
+            conditions.append("day < ?")
+            params.append(end.strftime('%Y-%m-%d'))
+
+        db = get_db()
+        with db.get_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT platform, SUM(count)
+                FROM message_counts_daily
+                WHERE {' AND '.join(conditions)}
+                GROUP BY platform
+            """, params)
+            return [{'platform': row[0], 'count': row[1]} for row in cursor.fetchall()]
+
+    # ==================== 非同步介面 ====================
+
+    @staticmethod
+    async def acount(name: str, platform: Optional[str] = None) -> int:
+        """非同步獲取資料列數"""
+        return await run_in_db(Stats.count, name, platform)
+
+    @staticmethod
+    async def aget_counts() -> Dict[str, Dict[str, int]]:
+        """非同步獲取所有資料列數"""
+        return await run_in_db(Stats.get_counts)
+
+    @staticmethod
+    async def acount_messages_since(since: datetime, **filters) -> int:
+        """非同步統計某時間之後收到的訊息數"""
+        return await run_in_db(Stats.count_messages_since, since, **filters)
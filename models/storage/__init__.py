@@ -0,0 +1,90 @@
+"""
+儲存後端
+- sqlite: 本機 SQLite (預設,支援寫入緩衝、全文索引、統計彙總表與封存)
+- memory: 行程內記憶體 (測試與效能評測)
+- dbapi: 任何 DB-API 2.0 驅動程式 (多個橋接行程共用伺服器資料庫)
+"""
+import threading
+from typing import Optional
+from .base import StorageBackend, Row, SNIPPET_OPEN, SNIPPET_CLOSE, DEFAULT_BATCH_SIZE
+from .sqlite import SQLiteStorage
+from .memory import MemoryStorage
+from .dbapi import DBAPIStorage
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+BACKENDS = {
+    'sqlite': SQLiteStorage,
+    'memory': MemoryStorage,
+    'dbapi': DBAPIStorage,
+}
+
+# 全域儲存後端 (未設定時使用全域 SQLite 資料庫)
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(backend: str = 'sqlite', *args, **kwargs) -> StorageBackend:
+    """
+    建立儲存後端
+
+    Args:
+        backend: 'sqlite'、'memory' 或 'dbapi'
+        *args: 傳給後端的位置參數
+        **kwargs: 傳給後端的關鍵字參數
+
+    Returns:
+        StorageBackend 實例
+
+    Raises:
+        ValueError: 未知的後端
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的儲存後端: {backend} (可用: {', '.join(BACKENDS)})")
+    return BACKENDS[backend](*args, **kwargs)
+
+
+def configure_storage(storage: StorageBackend) -> StorageBackend:
+    """
+    設定全域儲存後端
+
+    Args:
+        storage: 儲存後端實例
+
+    Returns:
+        設定的儲存後端
+    """
+    global _storage
+    with _storage_lock:
+        previous, _storage = _storage, storage
+    if previous is not None and previous is not storage:
+        previous.close()
+    logger.info(f"儲存後端: {storage.name}")
+    return storage
+
+
+def get_storage() -> StorageBackend:
+    """獲取全域儲存後端,未設定時使用全域 SQLite 資料庫"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = SQLiteStorage()
+    return _storage
+
+
+def reset_storage():
+    """釋放全域儲存後端,恢復為預設的 SQLite 後端"""
+    global _storage
+    with _storage_lock:
+        previous, _storage = _storage, None
+    if previous is not None:
+        previous.close()
+
+
+__all__ = [
+    'StorageBackend', 'Row', 'SNIPPET_OPEN', 'SNIPPET_CLOSE', 'DEFAULT_BATCH_SIZE',
+    'SQLiteStorage', 'MemoryStorage', 'DBAPIStorage',
+    'create_storage', 'configure_storage', 'get_storage', 'reset_storage',
+]
@@ -0,0 +1,288 @@
+"""
+儲存後端介面
+- 模型 (User/Message/Quota/SystemQuota/QueuedMessage) 只透過此介面存取資料
+- 資料列以欄位名稱索引 (row['col']),時間欄位一律為 epoch 毫秒
+"""
+from abc import ABC, abstractmethod
+from typing import Optional, List, Dict, Any, Tuple, Mapping, Iterator, Sequence
+
+# 資料列: sqlite3.Row 或 dict,皆可用 row['col'] 讀取
+Row = Mapping[str, Any]
+
+# 搜尋摘要中標記命中位置的控制字元 (由模型轉義後再換成 HTML 標籤)
+SNIPPET_OPEN = '\x02'
+SNIPPET_CLOSE = '\x03'
+
+# 逐批讀取 (匯出) 時每批的資料列數
+DEFAULT_BATCH_SIZE = 500
+
+# 使用者已存在時可更新的欄位 (created_at 一律保留)
+USER_UPDATE_COLUMNS = ('platform', 'display_name', 'updated_at', 'is_active', 'metadata')
+
+
+class StorageBackend(ABC):
+    """儲存後端基底類"""
+
+    # 後端名稱 (顯示於日誌與統計)
+    name = 'base'
+
+    # ==================== 使用者 ====================
+
+    @abstractmethod
+    def get_user(self, user_id: str, platform: str) -> Optional[Row]:
+        """根據 ID 和平台獲取使用者"""
+
+    @abstractmethod
+    def save_user(self, row: Dict[str, Any], columns: Optional[Sequence[str]] = None):
+        """
+        新增或更新使用者 (已存在時保留 created_at)
+
+        Args:
+            row: users 表的所有欄位
+            columns: 已存在時只更新這些欄位 (None 表示 created_at 以外的所有欄位)
+        """
+
+    @abstractmethod
+    def ensure_user(self, user_id: str, platform: str, now: int):
+        """使用者不存在時建立 (不覆寫既有資料)"""
+
+    @abstractmethod
+    def list_users(self, platform: Optional[str] = None, is_active: bool = True) -> List[Row]:
+        """獲取使用者 (新到舊)"""
+
+    @abstractmethod
+    def paginate_users(
+        self,
+        limit: int,
+        after: Optional[Tuple[int, Any]] = None,
+        platform: Optional[str] = None,
+        is_active: bool = True
+    ) -> List[Row]:
+        """
+        以鍵集分頁獲取使用者 (新到舊)
+
+        Args:
+            limit: 最多返回的資料列數
+            after: 上一頁最後一列的 (created_at, row_key)
+            platform: 篩選平台
+            is_active: 只獲取活躍使用者
+
+        Returns:
+            資料列 (含 row_key 欄位,作為同一時間內的排序鍵)
+        """
+
+    @abstractmethod
+    def count_users(self, platform: Optional[str] = None, is_active: bool = True) -> int:
+        """統計使用者數量"""
+
+    @abstractmethod
+    def iter_users(
+        self,
+        platform: Optional[str] = None,
+        is_active: bool = True,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[Row]:
+        """
+        逐批讀取使用者 (順序與 paginate_users 相同)
+
+        記憶體用量只與 batch_size 有關,不受資料表大小影響。
+        產生器須在同一執行緒內迭代完畢或關閉。
+
+        Args:
+            platform: 篩選平台
+            is_active: True 讀取活躍使用者, False 讀取停用使用者
+            since: 建立時間起點 (epoch 毫秒,含)
+            until: 建立時間終點 (epoch 毫秒,不含)
+            batch_size: 每批從資料庫讀取的資料列數
+        """
+
+    # ==================== 訊息 ====================
+
+    @abstractmethod
+    def insert_message(self, row: Dict[str, Any]):
+        """
+        新增訊息 (message_id 重複時略過)
+
+        Args:
+            row: messages 表除 id 外的欄位
+
+        Returns:
+            新訊息的 id;重複、尚未實際寫入 (寫入緩衝) 或後端無法得知時返回 None
+        """
+
+    @abstractmethod
+    def get_message(self, message_id: str) -> Optional[Row]:
+        """根據訊息 ID 獲取訊息"""
+
+    @abstractmethod
+    def list_messages(
+        self,
+        limit: int,
+        offset: int = 0,
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None
+    ) -> List[Row]:
+        """獲取訊息 (新到舊)"""
+
+    @abstractmethod
+    def paginate_messages(
+        self,
+        limit: int,
+        after: Optional[Tuple[int, int]] = None,
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None,
+        platform: Optional[str] = None,
+        include_archive: bool = False
+    ) -> List[Row]:
+        """
+        以鍵集分頁獲取訊息 (created_at 新到舊,同一時間依 id 遞增)
+
+        Args:
+            limit: 最多返回的資料列數
+            after: 上一頁最後一列的 (created_at, id)
+            user_id: 篩選使用者
+            group_id: 篩選群組
+            platform: 篩選平台
+            include_archive: 同時查詢封存資料 (後端不支援時忽略)
+        """
+
+    @abstractmethod
+    def search_messages(
+        self,
+        terms: List[str],
+        limit: int,
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        order: str = 'rank',
+        include_archive: bool = False
+    ) -> List[Row]:
+        """
+        搜尋內容包含所有詞的訊息
+
+        Args:
+            terms: 搜尋詞
+            limit: 最多返回的資料列數
+            platform: 篩選平台
+            group_id: 篩選群組
+            since: 起始時間 (epoch 毫秒,含)
+            until: 結束時間 (epoch 毫秒,不含)
+            order: 'rank' 依相關度, 'recent' 依時間 (不支援相關度的後端一律依時間)
+            include_archive: 同時搜尋封存資料 (後端不支援時忽略)
+
+        Returns:
+            資料列,額外包含 snippet 與 rank 欄位 (不支援時為 None)
+        """
+
+    @abstractmethod
+    def iter_messages(
+        self,
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[Row]:
+        """
+        逐批讀取訊息 (順序與 paginate_messages 相同,不含封存資料)
+
+        記憶體用量只與 batch_size 有關,不受資料表大小影響。
+        產生器須在同一執行緒內迭代完畢或關閉。
+
+        Args:
+            platform: 篩選平台
+            group_id: 篩選群組
+            since: 起始時間 (epoch 毫秒,含)
+            until: 結束時間 (epoch 毫秒,不含)
+            batch_size: 每批從資料庫讀取的資料列數
+        """
+
+    @abstractmethod
+    def count_messages(self, user_id: Optional[str] = None, platform: Optional[str] = None) -> int:
+        """統計訊息數量"""
+
+    def estimate_message_total(self) -> int:
+        """估計訊息總數 (預設為精確計數)"""
+        return self.count_messages()
+
+    @abstractmethod
+    def delete_messages_before(self, cutoff: int) -> int:
+        """
+        刪除早於 cutoff 的訊息
+
+        Args:
+            cutoff: epoch 毫秒
+
+        Returns:
+            刪除的訊息數量
+        """
+
+    # ==================== 配額 ====================
+
+    @abstractmethod
+    def get_quota(self, user_id: str, quota_type: str, reset_period: str) -> Optional[Row]:
+        """獲取使用者配額"""
+
+    @abstractmethod
+    def insert_quota(self, row: Dict[str, Any]) -> int:
+        """
+        新增使用者配額
+
+        Returns:
+            新配額的 id
+        """
+
+    @abstractmethod
+    def update_quota(self, quota_id: int, usage_count: int, limit_count: int, last_reset: int, updated_at: int):
+        """更新使用者配額"""
+
+    @abstractmethod
+    def list_quotas(self, user_id: Optional[str] = None) -> List[Row]:
+        """獲取配額 (未指定使用者時依 updated_at 新到舊)"""
+
+    # ==================== 系統配額 ====================
+
+    @abstractmethod
+    def get_system_quota(self, quota_type: str) -> Optional[Row]:
+        """獲取系統配額"""
+
+    @abstractmethod
+    def list_system_quotas(self) -> List[Row]:
+        """獲取所有系統配額"""
+
+    @abstractmethod
+    def reset_system_quota(self, quota_type: str, usage_count: int, now: int):
+        """重置系統配額並設定新的使用量"""
+
+    @abstractmethod
+    def add_system_quota_usage(self, quota_type: str, amount: int, now: int):
+        """增加系統配額使用量"""
+
+    @abstractmethod
+    def save_system_quota(self, quota_type: str, usage_count: int, last_reset: int, updated_at: int):
+        """寫入系統配額的使用量與重置時間 (配額引擎寫回)"""
+
+    # ==================== 待處理訊息佇列 ====================
+
+    @abstractmethod
+    def insert_queued_message(self, row: Dict[str, Any]) -> int:
+        """
+        加入待處理訊息
+
+        Returns:
+            新訊息的 id
+        """
+
+    @abstractmethod
+    def list_queued_messages(self, limit: int) -> List[Row]:
+        """獲取待處理的訊息 (舊到新)"""
+
+    @abstractmethod
+    def mark_queued_sent(self, ids: List[int]):
+        """將訊息標記為已發送"""
+
+    def close(self):
+        """釋放後端資源"""
@@ -0,0 +1,645 @@
+"""
+DB-API 2.0 (PEP 249) 儲存後端
+- 透過任何相容的驅動程式 (psycopg2、pymysql、sqlite3...) 存取伺服器資料庫
+- 多個橋接行程可共用同一份使用者、訊息、配額與佇列狀態
+- 只使用可攜的 SQL;全文索引、統計彙總表與封存仍為 SQLite 專屬功能
+"""
+import importlib
+import re
+import threading
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Optional, List, Dict, Any, Tuple, Union, Iterator, Sequence
+from ..database import DEFAULT_SYSTEM_QUOTAS
+from ..timestamps import now_ms
+from .base import StorageBackend, Row, DEFAULT_BATCH_SIZE, USER_UPDATE_COLUMNS
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+USER_COLUMNS = ('user_id', 'platform', 'display_name', 'created_at', 'updated_at', 'is_active', 'metadata')
+MESSAGE_COLUMNS = ('message_id', 'user_id', 'platform', 'content', 'message_type', 'group_id', 'created_at', 'metadata')
+
+
+class DBAPIStorage(StorageBackend):
+    """DB-API 2.0 儲存後端"""
+
+    name = 'dbapi'
+
+    # 驅動程式模組 -> SQL 方言
+    DIALECTS = {
+        'sqlite3': 'sqlite',
+        'psycopg2': 'postgresql',
+        'psycopg': 'postgresql',
+        'pg8000': 'postgresql',
+        'pymysql': 'mysql',
+        'MySQLdb': 'mysql',
+        'mysql.connector': 'mysql',
+    }
+
+    # 各方言的自動遞增主鍵
+    ID_COLUMNS = {
+        'sqlite': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+        'postgresql': 'BIGSERIAL PRIMARY KEY',
+        'mysql': 'BIGINT AUTO_INCREMENT PRIMARY KEY',
+    }
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id VARCHAR(255) PRIMARY KEY,
+            platform VARCHAR(32) NOT NULL,
+            display_name VARCHAR(255),
+            created_at BIGINT,
+            updated_at BIGINT,
+            is_active INTEGER DEFAULT 1,
+            metadata TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id {id_column},
+            message_id VARCHAR(255) UNIQUE,
+            user_id VARCHAR(255) NOT NULL,
+            platform VARCHAR(32) NOT NULL,
+            group_id VARCHAR(255),
+            content TEXT,
+            message_type VARCHAR(32) DEFAULT 'text',
+            created_at BIGINT,
+            metadata TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS quotas (
+            id {id_column},
+            user_id VARCHAR(255) NOT NULL,
+            quota_type VARCHAR(64) NOT NULL,
+            usage_count INTEGER DEFAULT 0,
+            limit_count INTEGER NOT NULL,
+            reset_period VARCHAR(16) NOT NULL,
+            last_reset BIGINT,
+            created_at BIGINT,
+            updated_at BIGINT,
+            UNIQUE (user_id, quota_type, reset_period)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS system_quotas (
+            id {id_column},
+            quota_type VARCHAR(64) NOT NULL UNIQUE,
+            usage_count INTEGER DEFAULT 0,
+            limit_count INTEGER NOT NULL,
+            reset_period VARCHAR(16) NOT NULL,
+            last_reset BIGINT,
+            updated_at BIGINT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS queued_messages (
+            id {id_column},
+            source_platform VARCHAR(32) NOT NULL,
+            source_user_name VARCHAR(255) NOT NULL,
+            content TEXT NOT NULL,
+            created_at BIGINT,
+            status VARCHAR(16) NOT NULL DEFAULT 'queued'
+        )
+        """,
+    )
+
+    INDEXES = (
+        "CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_user_created ON messages (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_group_created ON messages (group_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_users_active_created ON users (is_active, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_quotas_updated_at ON quotas (updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_queued_messages_status ON queued_messages (status, created_at)",
+    )
+
+    _PLACEHOLDER = re.compile(r'\?')
+
+    def __init__(
+        self,
+        module: Union[str, ModuleType],
+        *connect_args,
+        dialect: Optional[str] = None,
+        create_schema: bool = True,
+        **connect_kwargs
+    ):
+        """
+        初始化 DB-API 儲存後端
+
+        Args:
+            module: 驅動程式模組或其名稱 (例如 'psycopg2')
+            *connect_args: 傳給 module.connect() 的位置參數 (例如 DSN)
+            dialect: SQL 方言 ('sqlite'/'postgresql'/'mysql',預設依模組推斷)
+            create_schema: 是否建立資料表並初始化系統配額
+            **connect_kwargs: 傳給 module.connect() 的關鍵字參數
+
+        Raises:
+            ImportError: 找不到驅動程式模組
+            ValueError: 無法推斷或不支援的方言
+        """
+        self.module = importlib.import_module(module) if isinstance(module, str) else module
+        self.dialect = dialect or self.DIALECTS.get(self.module.__name__)
+        if self.dialect not in self.ID_COLUMNS:
+            raise ValueError(f"不支援的資料庫方言: {self.dialect} ({self.module.__name__})")
+        self.paramstyle = self.module.paramstyle
+        if self.module.__name__ == 'sqlite3':
+            # 每個連接只由建立它的執行緒使用,但 close() 可能在其他執行緒呼叫
+            connect_kwargs.setdefault('check_same_thread', False)
+        self._connect_args = connect_args
+        self._connect_kwargs = connect_kwargs
+        # DB-API 連接不一定能跨執行緒使用,每個執行緒各自持有一個連接
+        self._local = threading.local()
+        self._connections: List[Any] = []
+        self._connections_lock = threading.Lock()
+        self._sql_cache: Dict[str, str] = {}
+
+        if create_schema:
+            self.create_schema()
+
+    # ==================== 連接與 SQL ====================
+
+    def _connection(self):
+        """獲取目前執行緒的連接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self.module.connect(*self._connect_args, **self._connect_kwargs)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+            logger.debug(f"建立 DB-API 連接 ({self.module.__name__})")
+        return conn
+
+    def _sql(self, sql: str) -> str:
+        """將 ? 佔位符轉為驅動程式的 paramstyle"""
+        converted = self._sql_cache.get(sql)
+        if converted is None:
+            if self.paramstyle == 'qmark':
+                converted = sql
+            elif self.paramstyle in ('format', 'pyformat'):
+                converted = sql.replace('?', '%s')
+            else:
+                # numeric (:1) 與 named (:p1) 皆以位置編號
+                prefix = ':' if self.paramstyle == 'numeric' else ':p'
+                counter = iter(range(1, sql.count('?') + 1))
+                converted = self._PLACEHOLDER.sub(lambda _: f"{prefix}{next(counter)}", sql)
+            self._sql_cache[sql] = converted
+        return converted
+
+    def _params(self, params: tuple):
+        """轉換參數格式 (named paramstyle 需要字典)"""
+        if self.paramstyle == 'named':
+            return {f"p{i}": value for i, value in enumerate(params, 1)}
+        return params
+
+    @contextmanager
+    def _cursor(self):
+        """獲取游標 (成功時提交,失敗時回滾)"""
+        conn = self._connection()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _execute(self, cursor, sql: str, params: tuple = ()):
+        """以轉換後的 SQL 與參數執行語句"""
+        cursor.execute(self._sql(sql), self._params(params))
+
+    @staticmethod
+    def _rows(cursor) -> List[Dict[str, Any]]:
+        """將查詢結果轉為字典列表"""
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _fetchall(self, sql: str, params: tuple = ()) -> List[Row]:
+        """執行查詢並返回所有資料列"""
+        with self._cursor() as cursor:
+            self._execute(cursor, sql, params)
+            return self._rows(cursor)
+
+    def _fetchone(self, sql: str, params: tuple = ()) -> Optional[Row]:
+        """執行查詢並返回第一列"""
+        rows = self._fetchall(sql, params)
+        return rows[0] if rows else None
+
+    def _iterate(
+        self,
+        select: str,
+        conditions: List[str],
+        params: list,
+        key: str,
+        batch_size: int
+    ) -> Iterator[Row]:
+        """
+        以 (created_at, key) 鍵集逐批執行 LIMIT 查詢並產生資料列
+
+        許多驅動程式 (例如 psycopg2 的預設游標) 在 execute 時就載入整個結果,
+        fetchmany 無法限制記憶體,因此每批各自查詢,且不會長時間佔住交易。
+        """
+        after = None
+        while True:
+            batch_conditions, batch_params = list(conditions), list(params)
+            if after:
+                batch_conditions.append(f"(created_at < ? OR (created_at = ? AND {key} > ?))")
+                batch_params.extend([after[0], after[0], after[1]])
+            rows = self._fetchall(f"""
+                {select}
+                WHERE {' AND '.join(batch_conditions) or '1 = 1'}
+                ORDER BY created_at DESC, {key} ASC
+                LIMIT ?
+            """, (*batch_params, batch_size))
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1]['created_at'], rows[-1][key])
+
+    @staticmethod
+    def _time_range(conditions: List[str], params: list, since: Optional[int], until: Optional[int]):
+        """加入 created_at 的時間範圍條件"""
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(until)
+
+    def _insert(self, sql: str, params: tuple) -> int:
+        """執行 INSERT 並返回新資料列的 id"""
+        with self._cursor() as cursor:
+            if self.dialect == 'postgresql':
+                self._execute(cursor, f"{sql} RETURNING id", params)
+                return cursor.fetchone()[0]
+            self._execute(cursor, sql, params)
+            return cursor.lastrowid
+
+    def create_schema(self):
+        """建立資料表與索引,並初始化系統配額"""
+        id_column = self.ID_COLUMNS[self.dialect]
+        with self._cursor() as cursor:
+            for statement in self.SCHEMA:
+                cursor.execute(statement.format(id_column=id_column))
+        for statement in self.INDEXES:
+            try:
+                with self._cursor() as cursor:
+                    cursor.execute(statement)
+            except self.module.Error as e:
+                # 部分資料庫 (例如 MySQL) 不支援 CREATE INDEX IF NOT EXISTS
+                logger.debug(f"略過索引建立: {e}")
+
+        now = now_ms()
+        for quota_type, limit_count, reset_period in DEFAULT_SYSTEM_QUOTAS:
+            if self.get_system_quota(quota_type) is None:
+                try:
+                    with self._cursor() as cursor:
+                        self._execute(cursor, """
+                            INSERT INTO system_quotas
+                            (quota_type, usage_count, limit_count, reset_period, last_reset, updated_at)
+                            VALUES (?, 0, ?, ?, ?, ?)
+                        """, (quota_type, limit_count, reset_period, now, now))
+                except self.module.IntegrityError:
+                    # 其他行程同時建立
+                    pass
+        logger.info(f"DB-API 儲存後端已就緒 ({self.module.__name__}, {self.dialect})")
+
+    def close(self):
+        """關閉所有執行緒的連接"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except self.module.Error as e:
+                logger.warning(f"關閉 DB-API 連接失敗: {e}")
+        self._local = threading.local()
+
+    # ==================== 使用者 ====================
+
+    def get_user(self, user_id: str, platform: str) -> Optional[Row]:
+        return self._fetchone("""
+            SELECT * FROM users
+            WHERE user_id = ? AND platform = ?
+        """, (user_id, platform))
+
+    def save_user(self, row: Dict[str, Any], columns: Optional[Sequence[str]] = None):
+        values = dict(row, is_active=int(bool(row['is_active'])))
+        # 已存在時只更新指定的欄位 (保留 created_at)
+        updates = list(columns or USER_UPDATE_COLUMNS)
+        with self._cursor() as cursor:
+            self._execute(cursor, f"""
+                UPDATE users
+                SET {', '.join(f'{column} = ?' for column in updates)}
+                WHERE user_id = ?
+            """, (*(values[column] for column in updates), values['user_id']))
+            if cursor.rowcount:
+                return
+            self._execute(cursor, f"""
+                INSERT INTO users ({', '.join(USER_COLUMNS)})
+                VALUES ({', '.join('?' for _ in USER_COLUMNS)})
+            """, tuple(values[column] for column in USER_COLUMNS))
+
+    def ensure_user(self, user_id: str, platform: str, now: int):
+        if self._fetchone("SELECT 1 FROM users WHERE user_id = ?", (user_id,)):
+            return
+        try:
+            with self._cursor() as cursor:
+                self._execute(cursor, """
+                    INSERT INTO users (user_id, platform, created_at, updated_at, is_active)
+                    VALUES (?, ?, ?, ?, 1)
+                """, (user_id, platform, now, now))
+        except self.module.IntegrityError:
+            # 其他行程同時建立
+            pass
+
+    def list_users(self, platform: Optional[str] = None, is_active: bool = True) -> List[Row]:
+        conditions = ["is_active = ?"]
+        params: list = [int(is_active)]
+        if platform:
+            conditions.append("platform = ?")
+            params.append(platform)
+        return self._fetchall(f"""
+            SELECT * FROM users
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC
+        """, tuple(params))
+
+    def paginate_users(
+        self,
+        limit: int,
+        after: Optional[Tuple[int, Any]] = None,
+        platform: Optional[str] = None,
+        is_active: bool = True
+    ) -> List[Row]:
+        # 以 (created_at, user_id) 作為鍵集
+        conditions = ["is_active = ?"]
+        params: list = [int(is_active)]
+        if platform:
+            conditions.append("platform = ?")
+            params.append(platform)
+        if after:
+            last_created_at, last_user_id = after
+            conditions.append("(created_at < ? OR (created_at = ? AND user_id > ?))")
+            params.extend([last_created_at, last_created_at, last_user_id])
+        return self._fetchall(f"""
+            SELECT users.*, user_id AS row_key FROM users
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, user_id ASC
+            LIMIT ?
+        """, (*params, limit))
+
+    def iter_users(
+        self,
+        platform: Optional[str] = None,
+        is_active: bool = True,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[Row]:
+        conditions = ["is_active = ?"]
+        params: list = [int(is_active)]
+        if platform:
+            conditions.append("platform = ?")
+            params.append(platform)
+        self._time_range(conditions, params, since, until)
+        return self._iterate(
+            "SELECT users.*, user_id AS row_key FROM users",
+            conditions, params, 'user_id', batch_size
+        )
+
+    def count_users(self, platform: Optional[str] = None, is_active: bool = True) -> int:
+        conditions = ["is_active = ?"]
+        params: list = [int(is_active)]
+        if platform:
+            conditions.append("platform = ?")
+            params.append(platform)
+        row = self._fetchone(f"""
+            SELECT COUNT(*) AS count FROM users
+            WHERE {' AND '.join(conditions)}
+        """, tuple(params))
+        return row['count']
+
+    # ==================== 訊息 ====================
+
+    def insert_message(self, row: Dict[str, Any]):
+        try:
+            with self._cursor() as cursor:
+                self._execute(cursor, f"""
+                    INSERT INTO messages ({', '.join(MESSAGE_COLUMNS)})
+                    VALUES ({', '.join('?' for _ in MESSAGE_COLUMNS)})
+                """, tuple(row[column] for column in MESSAGE_COLUMNS))
+        except self.module.IntegrityError:
+            # message_id 重複 (例如 webhook 重送)
+            logger.debug(f"略過重複訊息: {row['message_id']}")
+
+    def get_message(self, message_id: str) -> Optional[Row]:
+        return self._fetchone("""
+            SELECT * FROM messages
+            WHERE message_id = ?
+        """, (message_id,))
+
+    @staticmethod
+    def _message_filters(
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None,
+        platform: Optional[str] = None
+    ) -> Tuple[List[str], list]:
+        """組合訊息篩選條件"""
+        conditions = []
+        params: list = []
+        for column, value in (('user_id', user_id), ('group_id', group_id), ('platform', platform)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        return conditions, params
+
+    def list_messages(
+        self,
+        limit: int,
+        offset: int = 0,
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None
+    ) -> List[Row]:
+        conditions, params = self._message_filters(user_id, group_id)
+        return self._fetchall(f"""
+            SELECT * FROM messages
+            WHERE {' AND '.join(conditions) or '1 = 1'}
+            ORDER BY created_at DESC, id ASC
+            LIMIT ? OFFSET ?
+        """, (*params, limit, offset))
+
+    def paginate_messages(
+        self,
+        limit: int,
+        after: Optional[Tuple[int, int]] = None,
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None,
+        platform: Optional[str] = None,
+        include_archive: bool = False
+    ) -> List[Row]:
+        conditions, params = self._message_filters(user_id, group_id, platform)
+        if after:
+            last_created_at, last_id = after
+            conditions.append("(created_at < ? OR (created_at = ? AND id > ?))")
+            params.extend([last_created_at, last_created_at, last_id])
+        return self._fetchall(f"""
+            SELECT * FROM messages
+            WHERE {' AND '.join(conditions) or '1 = 1'}
+            ORDER BY created_at DESC, id ASC
+            LIMIT ?
+        """, (*params, limit))
+
+    def search_messages(
+        self,
+        terms: List[str],
+        limit: int,
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        order: str = 'rank',
+        include_archive: bool = False
+    ) -> List[Row]:
+        # 可攜的 LIKE 搜尋 (不分大小寫),一律依時間排序
+        conditions, params = self._message_filters(group_id=group_id, platform=platform)
+        for term in terms:
+            conditions.append("LOWER(content) LIKE ?")
+            params.append(f'%{term.lower()}%')
+        self._time_range(conditions, params, since, until)
+        rows = self._fetchall(f"""
+            SELECT * FROM messages
+            WHERE {' AND '.join(conditions) or '1 = 1'}
+            ORDER BY created_at DESC, id ASC
+            LIMIT ?
+        """, (*params, limit))
+        return [dict(row, snippet=None, rank=None) for row in rows]
+
+    def iter_messages(
+        self,
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[Row]:
+        conditions, params = self._message_filters(group_id=group_id, platform=platform)
+        self._time_range(conditions, params, since, until)
+        return self._iterate("SELECT * FROM messages", conditions, params, 'id', batch_size)
+
+    def count_messages(self, user_id: Optional[str] = None, platform: Optional[str] = None) -> int:
+        conditions, params = self._message_filters(user_id=user_id, platform=platform)
+        row = self._fetchone(f"""
+            SELECT COUNT(*) AS count FROM messages
+            WHERE {' AND '.join(conditions) or '1 = 1'}
+        """, tuple(params))
+        return row['count']
+
+    def delete_messages_before(self, cutoff: int) -> int:
+        with self._cursor() as cursor:
+            self._execute(cursor, "DELETE FROM messages WHERE created_at < ?", (cutoff,))
+            return cursor.rowcount
+
+    # ==================== 配額 ====================
+
+    def get_quota(self, user_id: str, quota_type: str, reset_period: str) -> Optional[Row]:
+        return self._fetchone("""
+            SELECT * FROM quotas
+            WHERE user_id = ? AND quota_type = ? AND reset_period = ?
+        """, (user_id, quota_type, reset_period))
+
+    def insert_quota(self, row: Dict[str, Any]) -> int:
+        return self._insert("""
+            INSERT INTO quotas
+            (user_id, quota_type, usage_count, limit_count, reset_period, last_reset, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            row['user_id'],
+            row['quota_type'],
+            row['usage_count'],
+            row['limit_count'],
+            row['reset_period'],
+            row['last_reset'],
+            row['created_at'],
+            row['updated_at']
+        ))
+
+    def update_quota(self, quota_id: int, usage_count: int, limit_count: int, last_reset: int, updated_at: int):
+        with self._cursor() as cursor:
+            self._execute(cursor, """
+                UPDATE quotas
+                SET usage_count = ?, limit_count = ?, last_reset = ?, updated_at = ?
+                WHERE id = ?
+            """, (usage_count, limit_count, last_reset, updated_at, quota_id))
+
+    def list_quotas(self, user_id: Optional[str] = None) -> List[Row]:
+        if user_id:
+            return self._fetchall("SELECT * FROM quotas WHERE user_id = ?", (user_id,))
+        return self._fetchall("SELECT * FROM quotas ORDER BY updated_at DESC")
+
+    # ==================== 系統配額 ====================
+
+    def get_system_quota(self, quota_type: str) -> Optional[Row]:
+        return self._fetchone("SELECT * FROM system_quotas WHERE quota_type = ?", (quota_type,))
+
+    def list_system_quotas(self) -> List[Row]:
+        return self._fetchall("SELECT * FROM system_quotas")
+
+    def reset_system_quota(self, quota_type: str, usage_count: int, now: int):
+        with self._cursor() as cursor:
+            self._execute(cursor, """
+                UPDATE system_quotas
+                SET usage_count = ?, last_reset = ?, updated_at = ?
+                WHERE quota_type = ?
+            """, (usage_count, now, now, quota_type))
+
+    def add_system_quota_usage(self, quota_type: str, amount: int, now: int):
+        with self._cursor() as cursor:
+            # 由資料庫遞增,多個行程同時使用也不會遺失計數
+            self._execute(cursor, """
+                UPDATE system_quotas
+                SET usage_count = usage_count + ?, updated_at = ?
+                WHERE quota_type = ?
+            """, (amount, now, quota_type))
+
+    def save_system_quota(self, quota_type: str, usage_count: int, last_reset: int, updated_at: int):
+        with self._cursor() as cursor:
+            self._execute(cursor, """
+                UPDATE system_quotas
+                SET usage_count = ?, last_reset = ?, updated_at = ?
+                WHERE quota_type = ?
+            """, (usage_count, last_reset, updated_at, quota_type))
+
+    # ==================== 待處理訊息佇列 ====================
+
+    def insert_queued_message(self, row: Dict[str, Any]) -> int:
+        return self._insert("""
+            INSERT INTO queued_messages
+            (source_platform, source_user_name, content, created_at, status)
+            VALUES (?, ?, ?, ?, ?)
+        """, (
+            row['source_platform'],
+            row['source_user_name'],
+            row['content'],
+            row['created_at'],
+            row['status']
+        ))
+
+    def list_queued_messages(self, limit: int) -> List[Row]:
+        return self._fetchall("""
+            SELECT * FROM queued_messages
+            WHERE status = 'queued'
+            ORDER BY created_at ASC, id ASC
+            LIMIT ?
+        """, (limit,))
+
+    def mark_queued_sent(self, ids: List[int]):
+        with self._cursor() as cursor:
+            self._execute(cursor, f"""
+                UPDATE queued_messages
+                SET status = 'sent'
+                WHERE id IN ({', '.join('?' for _ in ids)})
+            """, tuple(ids))
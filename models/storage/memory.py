@@ -0,0 +1,316 @@
+"""
+記憶體儲存後端
+- 所有資料存放於行程內的字典,不寫入磁碟
+- 供測試與效能評測使用,行程結束後資料即消失
+"""
+import itertools
+import threading
+from typing import Optional, List, Dict, Any, Tuple, Iterator, Sequence
+from ..database import DEFAULT_SYSTEM_QUOTAS
+from ..timestamps import now_ms
+from .base import StorageBackend, Row, DEFAULT_BATCH_SIZE, USER_UPDATE_COLUMNS
+
+
+class MemoryStorage(StorageBackend):
+    """記憶體儲存後端"""
+
+    name = 'memory'
+
+    def __init__(self):
+        """初始化記憶體儲存後端 (含預設系統配額)"""
+        self._lock = threading.Lock()
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._user_keys = itertools.count(1)
+        # message_id -> 訊息 (依插入順序,id 遞增)
+        self._messages: Dict[str, Dict[str, Any]] = {}
+        self._message_ids = itertools.count(1)
+        self._quotas: Dict[int, Dict[str, Any]] = {}
+        self._quota_ids = itertools.count(1)
+        self._system_quotas: Dict[str, Dict[str, Any]] = {}
+        self._queued: Dict[int, Dict[str, Any]] = {}
+        self._queued_ids = itertools.count(1)
+
+        now = now_ms()
+        for quota_id, (quota_type, limit_count, reset_period) in enumerate(DEFAULT_SYSTEM_QUOTAS, 1):
+            self._system_quotas[quota_type] = {
+                'id': quota_id,
+                'quota_type': quota_type,
+                'usage_count': 0,
+                'limit_count': limit_count,
+                'reset_period': reset_period,
+                'last_reset': now,
+                'updated_at': now,
+            }
+
+    @staticmethod
+    def _newest_first(rows, key: str = 'id') -> List[Dict[str, Any]]:
+        """依 created_at 新到舊、同一時間依 key 遞增排序,返回複本"""
+        return [dict(row) for row in sorted(rows, key=lambda row: (-(row['created_at'] or 0), row[key]))]
+
+    @staticmethod
+    def _in_range(row: Dict[str, Any], since: Optional[int], until: Optional[int]) -> bool:
+        """created_at 是否在時間範圍內"""
+        return (since is None or row['created_at'] >= since) and (until is None or row['created_at'] < until)
+
+    # ==================== 使用者 ====================
+
+    def get_user(self, user_id: str, platform: str) -> Optional[Row]:
+        with self._lock:
+            user = self._users.get(user_id)
+            return dict(user) if user and user['platform'] == platform else None
+
+    def save_user(self, row: Dict[str, Any], columns: Optional[Sequence[str]] = None):
+        with self._lock:
+            user = self._users.get(row['user_id'])
+            if user is None:
+                self._users[row['user_id']] = dict(row, row_key=next(self._user_keys))
+                return
+            # 與 SQLite 的 UPSERT 相同: 保留排序鍵與 created_at,只更新指定的欄位
+            user.update((column, row[column]) for column in (columns or USER_UPDATE_COLUMNS))
+
+    def ensure_user(self, user_id: str, platform: str, now: int):
+        with self._lock:
+            if user_id not in self._users:
+                self._users[user_id] = {
+                    'user_id': user_id,
+                    'platform': platform,
+                    'display_name': None,
+                    'created_at': now,
+                    'updated_at': now,
+                    'is_active': True,
+                    'metadata': None,
+                    'row_key': next(self._user_keys),
+                }
+
+    def _filter_users(self, platform: Optional[str], is_active: bool) -> List[Dict[str, Any]]:
+        """依平台與啟用狀態篩選使用者"""
+        return [
+            user for user in self._users.values()
+            if (not platform or user['platform'] == platform) and bool(user['is_active']) == bool(is_active)
+        ]
+
+    def list_users(self, platform: Optional[str] = None, is_active: bool = True) -> List[Row]:
+        with self._lock:
+            return self._newest_first(self._filter_users(platform, is_active), key='row_key')
+
+    def paginate_users(
+        self,
+        limit: int,
+        after: Optional[Tuple[int, Any]] = None,
+        platform: Optional[str] = None,
+        is_active: bool = True
+    ) -> List[Row]:
+        with self._lock:
+            users = self._filter_users(platform, is_active)
+            if after:
+                last_created_at, last_key = after
+                users = [
+                    user for user in users
+                    if user['created_at'] < last_created_at
+                    or (user['created_at'] == last_created_at and user['row_key'] > last_key)
+                ]
+            return self._newest_first(users, key='row_key')[:limit]
+
+    def iter_users(
+        self,
+        platform: Optional[str] = None,
+        is_active: bool = True,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[Row]:
+        # 資料本來就在記憶體中,取得快照後逐列產生
+        with self._lock:
+            users = [user for user in self._filter_users(platform, is_active) if self._in_range(user, since, until)]
+        yield from self._newest_first(users, key='row_key')
+
+    def count_users(self, platform: Optional[str] = None, is_active: bool = True) -> int:
+        with self._lock:
+            return len(self._filter_users(platform, is_active))
+
+    # ==================== 訊息 ====================
+
+    def insert_message(self, row: Dict[str, Any]):
+        with self._lock:
+            if row['message_id'] in self._messages:
+                return None
+            row_id = next(self._message_ids)
+            self._messages[row['message_id']] = dict(row, id=row_id)
+            return row_id
+
+    def get_message(self, message_id: str) -> Optional[Row]:
+        with self._lock:
+            message = self._messages.get(message_id)
+            return dict(message) if message else None
+
+    def _filter_messages(
+        self,
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None,
+        platform: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """依使用者、群組與平台篩選訊息"""
+        return [
+            message for message in self._messages.values()
+            if (not user_id or message['user_id'] == user_id)
+            and (not group_id or message['group_id'] == group_id)
+            and (not platform or message['platform'] == platform)
+        ]
+
+    def list_messages(
+        self,
+        limit: int,
+        offset: int = 0,
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None
+    ) -> List[Row]:
+        with self._lock:
+            return self._newest_first(self._filter_messages(user_id, group_id))[offset:offset + limit]
+
+    def paginate_messages(
+        self,
+        limit: int,
+        after: Optional[Tuple[int, int]] = None,
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None,
+        platform: Optional[str] = None,
+        include_archive: bool = False
+    ) -> List[Row]:
+        with self._lock:
+            messages = self._filter_messages(user_id, group_id, platform)
+            if after:
+                last_created_at, last_id = after
+                messages = [
+                    message for message in messages
+                    if message['created_at'] < last_created_at
+                    or (message['created_at'] == last_created_at and message['id'] > last_id)
+                ]
+            return self._newest_first(messages)[:limit]
+
+    def search_messages(
+        self,
+        terms: List[str],
+        limit: int,
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        order: str = 'rank',
+        include_archive: bool = False
+    ) -> List[Row]:
+        lowered = [term.lower() for term in terms]
+        with self._lock:
+            matches = [
+                message for message in self._filter_messages(group_id=group_id, platform=platform)
+                if all(term in (message['content'] or '').lower() for term in lowered)
+                and self._in_range(message, since, until)
+            ]
+            return [dict(row, snippet=None, rank=None) for row in self._newest_first(matches)[:limit]]
+
+    def iter_messages(
+        self,
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[Row]:
+        with self._lock:
+            messages = [
+                message for message in self._filter_messages(group_id=group_id, platform=platform)
+                if self._in_range(message, since, until)
+            ]
+        yield from self._newest_first(messages)
+
+    def count_messages(self, user_id: Optional[str] = None, platform: Optional[str] = None) -> int:
+        with self._lock:
+            return len(self._filter_messages(user_id=user_id, platform=platform))
+
+    def delete_messages_before(self, cutoff: int) -> int:
+        with self._lock:
+            expired = [key for key, message in self._messages.items() if message['created_at'] < cutoff]
+            for key in expired:
+                del self._messages[key]
+            return len(expired)
+
+    # ==================== 配額 ====================
+
+    def get_quota(self, user_id: str, quota_type: str, reset_period: str) -> Optional[Row]:
+        with self._lock:
+            for quota in self._quotas.values():
+                if (quota['user_id'], quota['quota_type'], quota['reset_period']) == (user_id, quota_type, reset_period):
+                    return dict(quota)
+        return None
+
+    def insert_quota(self, row: Dict[str, Any]) -> int:
+        with self._lock:
+            quota_id = next(self._quota_ids)
+            self._quotas[quota_id] = dict(row, id=quota_id)
+            return quota_id
+
+    def update_quota(self, quota_id: int, usage_count: int, limit_count: int, last_reset: int, updated_at: int):
+        with self._lock:
+            quota = self._quotas.get(quota_id)
+            if quota is not None:
+                quota.update(
+                    usage_count=usage_count,
+                    limit_count=limit_count,
+                    last_reset=last_reset,
+                    updated_at=updated_at
+                )
+
+    def list_quotas(self, user_id: Optional[str] = None) -> List[Row]:
+        with self._lock:
+            if user_id:
+                return [dict(quota) for quota in self._quotas.values() if quota['user_id'] == user_id]
+            return [dict(quota) for quota in sorted(self._quotas.values(), key=lambda q: -q['updated_at'])]
+
+    # ==================== 系統配額 ====================
+
+    def get_system_quota(self, quota_type: str) -> Optional[Row]:
+        with self._lock:
+            quota = self._system_quotas.get(quota_type)
+            return dict(quota) if quota else None
+
+    def list_system_quotas(self) -> List[Row]:
+        with self._lock:
+            return [dict(quota) for quota in self._system_quotas.values()]
+
+    def reset_system_quota(self, quota_type: str, usage_count: int, now: int):
+        with self._lock:
+            quota = self._system_quotas.get(quota_type)
+            if quota is not None:
+                quota.update(usage_count=usage_count, last_reset=now, updated_at=now)
+
+    def add_system_quota_usage(self, quota_type: str, amount: int, now: int):
+        with self._lock:
+            quota = self._system_quotas.get(quota_type)
+            if quota is not None:
+                quota['usage_count'] += amount
+                quota['updated_at'] = now
+
+    def save_system_quota(self, quota_type: str, usage_count: int, last_reset: int, updated_at: int):
+        with self._lock:
+            quota = self._system_quotas.get(quota_type)
+            if quota is not None:
+                quota.update(usage_count=usage_count, last_reset=last_reset, updated_at=updated_at)
+
+    # ==================== 待處理訊息佇列 ====================
+
+    def insert_queued_message(self, row: Dict[str, Any]) -> int:
+        with self._lock:
+            queued_id = next(self._queued_ids)
+            self._queued[queued_id] = dict(row, id=queued_id)
+            return queued_id
+
+    def list_queued_messages(self, limit: int) -> List[Row]:
+        with self._lock:
+            queued = [row for row in self._queued.values() if row['status'] == 'queued']
+            queued.sort(key=lambda row: (row['created_at'], row['id']))
+            return [dict(row) for row in queued[:limit]]
+
+    def mark_queued_sent(self, ids: List[int]):
+        with self._lock:
+            for queued_id in ids:
+                if queued_id in self._queued:
+                    self._queued[queued_id]['status'] = 'sent'
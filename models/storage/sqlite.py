@@ -0,0 +1,552 @@
+"""
+SQLite 儲存後端
+- 使用 Database 連接池、寫入緩衝、全文索引、統計彙總表與月份封存
+"""
+import functools
+from typing import Optional, List, Dict, Any, Tuple, Iterator, Sequence
+from ..database import Database, get_db
+from ..write_buffer import get_write_buffer
+from ..archive import get_archive
+from ..compression import get_compression
+from ..stats import Stats
+from ..retention import RetentionEngine
+from ..timestamps import now_ms
+from .base import StorageBackend, Row, SNIPPET_OPEN, SNIPPET_CLOSE, DEFAULT_BATCH_SIZE, USER_UPDATE_COLUMNS
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    SQLite 儲存後端 (預設)
+
+    使用者、平台與群組在資料表中以整數鍵儲存 (見 database._migrate_surrogate_keys);
+    查詢讀取 user_rows / message_rows 檢視,返回的欄位與字串 ID 相同。
+    """
+
+    name = 'sqlite'
+
+    # 僅在使用者不存在時建立 (不覆寫既有資料)
+    ENSURE_USER_SQL = """
+        INSERT OR IGNORE INTO users (user_id, platform_key, created_at, updated_at)
+        VALUES (?, ?, ?, ?)
+    """
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _save_user_sql(columns: Tuple[str, ...]) -> str:
+        """
+        組合使用者的 UPSERT 語句
+
+        以 ON CONFLICT DO UPDATE 更新 (INSERT OR REPLACE 會刪除後重建,分配新鍵並改寫所有索引),
+        只 SET 指定的欄位,未列出的欄位所屬索引與觸發器不受影響;值都沒有改變時不寫入。
+        """
+        column_names = {'platform': 'platform_key'}
+        assignments = ', '.join(f"{column_names.get(c, c)} = excluded.{column_names.get(c, c)}" for c in columns)
+        changed = ' OR '.join(
+            f"users.{column_names.get(c, c)} IS NOT excluded.{column_names.get(c, c)}"
+            for c in columns if c != 'updated_at'
+        )
+        return f"""
+            INSERT INTO users (user_id, platform_key, display_name, created_at, updated_at, is_active, metadata)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET {assignments}
+            {f'WHERE {changed}' if changed else ''}
+        """
+
+    # 使用者鍵以 users.user_id 的唯一索引解析 (ENSURE_USER_SQL 須先在同一交易或批次中執行)
+    INSERT_MESSAGE_SQL = """
+        INSERT OR IGNORE INTO messages
+        (message_id, user_key, platform_key, group_key, content, message_type, created_at, metadata)
+        VALUES (?, (SELECT id FROM users WHERE user_id = ?), ?, ?, ?, ?, ?, ?)
+    """
+
+    # 全文搜尋: trigram 分詞器至少需要 3 個字元,較短的詞改用 LIKE
+    FTS_MIN_TERM_LENGTH = 3
+
+    def __init__(self, db: Optional[Database] = None):
+        """
+        初始化 SQLite 儲存後端
+
+        Args:
+            db: 資料庫實例 (預設每次使用目前的全域實例)
+        """
+        self._db = db
+
+    @property
+    def db(self) -> Database:
+        """資料庫實例"""
+        return self._db or get_db()
+
+    @property
+    def state(self) -> Database:
+        """配額與佇列所在的資料庫 (未分離時與 db 相同)"""
+        return self.db.state
+
+    def _fetchone(self, sql: str, params: tuple = (), db: Optional[Database] = None) -> Optional[Row]:
+        """執行查詢並返回第一列"""
+        with (db or self.db).get_cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+
+    def _fetchall(self, sql: str, params: tuple = (), db: Optional[Database] = None) -> List[Row]:
+        """執行查詢並返回所有資料列"""
+        with (db or self.db).get_cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _iterate(self, sql: str, params: tuple, batch_size: int) -> Iterator[Row]:
+        """
+        以唯讀連接執行查詢並以 fetchmany 逐批產生資料列
+
+        SQLite 游標隨 fetchmany 逐步執行語句,不會一次載入整個結果;
+        迭代期間佔用一個唯讀連接 (不限時間),並讀取同一個 WAL 快照。
+        """
+        with self.db.read_only(timeout=0):
+            with self.db.get_cursor() as cursor:
+                cursor.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        return
+                    yield from rows
+
+    @staticmethod
+    def _time_range(conditions: List[str], params: list, since: Optional[int], until: Optional[int]):
+        """加入 created_at 的時間範圍條件"""
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(until)
+
+    # ==================== 使用者 ====================
+
+    def get_user(self, user_id: str, platform: str) -> Optional[Row]:
+        return self._fetchone("""
+            SELECT * FROM user_rows
+            WHERE user_id = ? AND platform = ?
+        """, (user_id, platform))
+
+    def save_user(self, row: Dict[str, Any], columns: Optional[Sequence[str]] = None):
+        platform_key = self.db.keys.platform_key(row['platform'])
+        sql = self._save_user_sql(tuple(columns) if columns else USER_UPDATE_COLUMNS)
+        with self.db.get_cursor() as cursor:
+            cursor.execute(sql, (
+                row['user_id'],
+                platform_key,
+                row['display_name'],
+                row['created_at'],
+                row['updated_at'],
+                row['is_active'],
+                row['metadata']
+            ))
+
+    def ensure_user(self, user_id: str, platform: str, now: int):
+        platform_key = self.db.keys.platform_key(platform)
+        with self.db.get_cursor() as cursor:
+            cursor.execute(self.ENSURE_USER_SQL, (user_id, platform_key, now, now))
+
+    def list_users(self, platform: Optional[str] = None, is_active: bool = True) -> List[Row]:
+        if platform:
+            return self._fetchall("""
+                SELECT * FROM user_rows
+                WHERE platform = ? AND is_active = ?
+                ORDER BY created_at DESC
+            """, (platform, is_active))
+        return self._fetchall("""
+            SELECT * FROM user_rows
+            WHERE is_active = ?
+            ORDER BY created_at DESC
+        """, (is_active,))
+
+    def paginate_users(
+        self,
+        limit: int,
+        after: Optional[Tuple[int, Any]] = None,
+        platform: Optional[str] = None,
+        is_active: bool = True
+    ) -> List[Row]:
+        # 以 (created_at, 使用者鍵) 作為鍵集,只讀取當頁的資料列
+        conditions = ["is_active = ?"]
+        params: list = [is_active]
+        if platform:
+            conditions.insert(0, "platform = ?")
+            params.insert(0, platform)
+        if after:
+            last_created_at, last_rowid = after
+            conditions.append("(created_at < ? OR (created_at = ? AND row_key > ?))")
+            params.extend([last_created_at, last_created_at, last_rowid])
+        return self._fetchall(f"""
+            SELECT * FROM user_rows
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, row_key ASC
+            LIMIT ?
+        """, (*params, limit))
+
+    def iter_users(
+        self,
+        platform: Optional[str] = None,
+        is_active: bool = True,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[Row]:
+        conditions = ["is_active = ?"]
+        params: list = [is_active]
+        if platform:
+            conditions.insert(0, "platform = ?")
+            params.insert(0, platform)
+        self._time_range(conditions, params, since, until)
+        return self._iterate(f"""
+            SELECT * FROM user_rows
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, row_key ASC
+        """, tuple(params), batch_size)
+
+    def count_users(self, platform: Optional[str] = None, is_active: bool = True) -> int:
+        # 讀取統計彙總表
+        active = Stats.count('active_users', platform, self.db)
+        if is_active:
+            return active
+        return Stats.count('users', platform, self.db) - active
+
+    # ==================== 訊息 ====================
+
+    def insert_message(self, row: Dict[str, Any]):
+        # 平台與群組鍵由行程內快取解析,新的平台或群組第一次出現時才寫入字典表
+        platform_key = self.db.keys.platform_key(row['platform'])
+        now = now_ms()
+        ensure_params = (row['user_id'], platform_key, now, now)
+        content, metadata = row['content'], row['metadata']
+        compression = get_compression()
+        if compression is not None:
+            # 超過門檻的內容以 BLOB 儲存 (讀取時由 Message.from_db_row 還原)
+            content, metadata = compression.encode(content), compression.encode(metadata)
+        params = (
+            row['message_id'],
+            row['user_id'],
+            platform_key,
+            self.db.keys.group_key(row['group_id']),
+            content,
+            row['message_type'],
+            row['created_at'],
+            metadata
+        )
+        buffer = get_write_buffer()
+        if buffer is not None:
+            # 啟用寫入緩衝時只加入佇列,並一併確保所屬使用者存在
+            buffer.enqueue(self.ENSURE_USER_SQL, ensure_params)
+            buffer.enqueue(self.INSERT_MESSAGE_SQL, params)
+            return None
+        with self.db.get_cursor() as cursor:
+            # 使用者不存在時鍵為 NULL,INSERT OR IGNORE 會略過訊息,因此先確保使用者存在
+            cursor.execute(self.ENSURE_USER_SQL, ensure_params)
+            cursor.execute(self.INSERT_MESSAGE_SQL, params)
+            return cursor.lastrowid if cursor.rowcount == 1 else None
+
+    def get_message(self, message_id: str) -> Optional[Row]:
+        return self._fetchone("""
+            SELECT * FROM message_rows
+            WHERE message_id = ?
+        """, (message_id,))
+
+    def list_messages(
+        self,
+        limit: int,
+        offset: int = 0,
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None
+    ) -> List[Row]:
+        if user_id:
+            return self._fetchall("""
+                SELECT * FROM message_rows
+                WHERE user_id = ?
+                ORDER BY created_at DESC
+                LIMIT ? OFFSET ?
+            """, (user_id, limit, offset))
+        if group_id:
+            return self._fetchall("""
+                SELECT * FROM message_rows
+                WHERE group_id = ?
+                ORDER BY created_at DESC
+                LIMIT ? OFFSET ?
+            """, (group_id, limit, offset))
+        return self._fetchall("""
+            SELECT * FROM message_rows
+            ORDER BY created_at DESC
+            LIMIT ? OFFSET ?
+        """, (limit, offset))
+
+    def paginate_messages(
+        self,
+        limit: int,
+        after: Optional[Tuple[int, int]] = None,
+        user_id: Optional[str] = None,
+        group_id: Optional[str] = None,
+        platform: Optional[str] = None,
+        include_archive: bool = False
+    ) -> List[Row]:
+        # 以 (created_at, id) 作為鍵集,每一頁的成本都與第一頁相同
+        conditions = []
+        params: list = []
+        if user_id:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if group_id:
+            conditions.append("group_id = ?")
+            params.append(group_id)
+        if platform:
+            conditions.append("platform = ?")
+            params.append(platform)
+        if after:
+            last_created_at, last_id = after
+            # 同一時間的訊息依 id 遞增,與索引中的順序一致
+            conditions.append("(created_at < ? OR (created_at = ? AND id > ?))")
+            params.extend([last_created_at, last_created_at, last_id])
+        where = ' AND '.join(conditions) or '1'
+        sql = f"""
+            SELECT * FROM {{rows}}
+            WHERE {where}
+            ORDER BY created_at DESC, id ASC
+            LIMIT ?
+        """
+
+        rows = self._fetchall(sql.format(schema='main', rows='main.message_rows'), (*params, limit))
+
+        archive = get_archive() if include_archive else None
+        if archive is not None and len(rows) < limit:
+            rows += archive.fetch(sql, tuple(params), limit - len(rows))
+            rows.sort(key=lambda row: (row['created_at'], -row['id']), reverse=True)
+        return rows
+
+    def search_messages(
+        self,
+        terms: List[str],
+        limit: int,
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        order: str = 'rank',
+        include_archive: bool = False
+    ) -> List[Row]:
+        # 有全文索引時以 FTS5 MATCH 搜尋並依 BM25 排序,否則退回 LIKE
+        fts_terms = [t for t in terms if len(t) >= self.FTS_MIN_TERM_LENGTH]
+        like_terms = [t for t in terms if len(t) < self.FTS_MIN_TERM_LENGTH]
+        use_fts = bool(fts_terms) and self.db.has_fts
+
+        conditions = []
+        params: list = []
+        if use_fts:
+            conditions.append("messages_fts MATCH ?")
+            params.append(' AND '.join('"' + t.replace('"', '""') + '"' for t in fts_terms))
+        else:
+            like_terms = terms
+        for term in like_terms:
+            # 壓縮的內容需先還原才能比對
+            conditions.append("inflate(m.content) LIKE ?")
+            params.append(f'%{term}%')
+        if platform:
+            conditions.append("m.platform = ?")
+            params.append(platform)
+        if group_id:
+            conditions.append("m.group_id = ?")
+            params.append(group_id)
+        if since is not None:
+            conditions.append("m.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("m.created_at < ?")
+            params.append(until)
+        where = ' AND '.join(conditions) or '1'
+
+        if use_fts:
+            # messages_fts.rank 即 bm25(),依它排序可由 FTS5 直接產生順序
+            order_by = 'messages_fts.rank' if order == 'rank' else 'm.created_at DESC'
+            sql = f"""
+                SELECT m.*,
+                       snippet(messages_fts, 0, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '…', 24) AS snippet,
+                       messages_fts.rank AS rank
+                FROM {{schema}}.messages_fts
+                JOIN {{rows}} m ON m.id = messages_fts.rowid
+                WHERE {where}
+                ORDER BY {order_by}
+                LIMIT ?
+            """
+        else:
+            sql = f"""
+                SELECT m.*, NULL AS snippet, NULL AS rank
+                FROM {{rows}} m
+                WHERE {where}
+                ORDER BY m.created_at DESC
+                LIMIT ?
+            """
+
+        # FTS5 的 MATCH 只能用未加別名的表名,因此以 {schema} 指定資料庫;
+        # {rows} 在主資料庫為 message_rows 檢視,在封存檔為仍以字串儲存的 messages
+        rows = self._fetchall(sql.format(schema='main', rows='main.message_rows'), (*params, limit))
+
+        # 熱資料庫結果不足 limit 筆時再依序搜尋月份封存檔
+        archive = get_archive() if include_archive else None
+        if archive is not None and len(rows) < limit:
+            rows += archive.fetch(sql, tuple(params), limit - len(rows))
+        return rows
+
+    def iter_messages(
+        self,
+        platform: Optional[str] = None,
+        group_id: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> Iterator[Row]:
+        conditions: List[str] = []
+        params: list = []
+        if group_id:
+            conditions.append("group_id = ?")
+            params.append(group_id)
+        if platform:
+            conditions.append("platform = ?")
+            params.append(platform)
+        self._time_range(conditions, params, since, until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._iterate(f"""
+            SELECT * FROM message_rows
+            {where}
+            ORDER BY created_at DESC, id ASC
+        """, tuple(params), batch_size)
+
+    def count_messages(self, user_id: Optional[str] = None, platform: Optional[str] = None) -> int:
+        if user_id:
+            # 直接以整數鍵計數,只需讀取 (user_key, created_at) 索引
+            row = self._fetchone("""
+                SELECT COUNT(*) FROM messages
+                WHERE user_key = (SELECT id FROM users WHERE user_id = ?)
+            """, (user_id,))
+            return row[0]
+        # 讀取統計彙總表
+        return Stats.count('messages', platform, self.db)
+
+    def estimate_message_total(self) -> int:
+        # 以 id 範圍估算,只需讀取主鍵兩端 (刪除過的訊息會讓結果偏高)
+        max_id, min_id = self._fetchone("SELECT MAX(id), MIN(id) FROM messages")
+        return (max_id - min_id + 1) if max_id is not None else 0
+
+    def delete_messages_before(self, cutoff: int) -> int:
+        # 以 rowid 範圍分批刪除,不長時間佔用寫入鎖
+        result = RetentionEngine(self.db).delete_in_batches(
+            'messages', "created_at < ?", (cutoff,),
+            "created_at < ?", (cutoff,)
+        )
+        return result['deleted']
+
+    # ==================== 配額 ====================
+
+    def get_quota(self, user_id: str, quota_type: str, reset_period: str) -> Optional[Row]:
+        return self._fetchone("""
+            SELECT * FROM quotas
+            WHERE user_id = ? AND quota_type = ? AND reset_period = ?
+        """, (user_id, quota_type, reset_period), db=self.state)
+
+    def insert_quota(self, row: Dict[str, Any]) -> int:
+        with self.state.get_cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO quotas
+                (user_id, quota_type, usage_count, limit_count, reset_period, last_reset, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                row['user_id'],
+                row['quota_type'],
+                row['usage_count'],
+                row['limit_count'],
+                row['reset_period'],
+                row['last_reset'],
+                row['created_at'],
+                row['updated_at']
+            ))
+            return cursor.lastrowid
+
+    def update_quota(self, quota_id: int, usage_count: int, limit_count: int, last_reset: int, updated_at: int):
+        with self.state.get_cursor() as cursor:
+            cursor.execute("""
+                UPDATE quotas
+                SET usage_count = ?, limit_count = ?, last_reset = ?, updated_at = ?
+                WHERE id = ?
+            """, (usage_count, limit_count, last_reset, updated_at, quota_id))
+
+    def list_quotas(self, user_id: Optional[str] = None) -> List[Row]:
+        if user_id:
+            return self._fetchall("""
+                SELECT * FROM quotas
+                WHERE user_id = ?
+            """, (user_id,), db=self.state)
+        return self._fetchall("SELECT * FROM quotas ORDER BY updated_at DESC", db=self.state)
+
+    # ==================== 系統配額 ====================
+
+    def get_system_quota(self, quota_type: str) -> Optional[Row]:
+        return self._fetchone("""
+            SELECT * FROM system_quotas
+            WHERE quota_type = ?
+        """, (quota_type,), db=self.state)
+
+    def list_system_quotas(self) -> List[Row]:
+        return self._fetchall("SELECT * FROM system_quotas", db=self.state)
+
+    def reset_system_quota(self, quota_type: str, usage_count: int, now: int):
+        with self.state.get_cursor() as cursor:
+            cursor.execute("""
+                UPDATE system_quotas
+                SET usage_count = ?, last_reset = ?, updated_at = ?
+                WHERE quota_type = ?
+            """, (usage_count, now, now, quota_type))
+
+    def add_system_quota_usage(self, quota_type: str, amount: int, now: int):
+        with self.state.get_cursor() as cursor:
+            cursor.execute("""
+                UPDATE system_quotas
+                SET usage_count = usage_count + ?, updated_at = ?
+                WHERE quota_type = ?
+            """, (amount, now, quota_type))
+
+    def save_system_quota(self, quota_type: str, usage_count: int, last_reset: int, updated_at: int):
+        with self.state.get_cursor() as cursor:
+            cursor.execute("""
+                UPDATE system_quotas
+                SET usage_count = ?, last_reset = ?, updated_at = ?
+                WHERE quota_type = ?
+            """, (usage_count, last_reset, updated_at, quota_type))
+
+    # ==================== 待處理訊息佇列 ====================
+
+    def insert_queued_message(self, row: Dict[str, Any]) -> int:
+        with self.state.get_cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO queued_messages
+                (source_platform, source_user_name, content, created_at, status)
+                VALUES (?, ?, ?, ?, ?)
+            """, (
+                row['source_platform'],
+                row['source_user_name'],
+                row['content'],
+                row['created_at'],
+                row['status']
+            ))
+            return cursor.lastrowid
+
+    def list_queued_messages(self, limit: int) -> List[Row]:
+        return self._fetchall("""
+            SELECT * FROM queued_messages
+            WHERE status = 'queued'
+            ORDER BY created_at ASC
+            LIMIT ?
+        """, (limit,), db=self.state)
+
+    def mark_queued_sent(self, ids: List[int]):
+        with self.state.get_cursor() as cursor:
+            placeholders = ', '.join('?' for _ in ids)
+            cursor.execute(f"""
+                UPDATE queued_messages
+                SET status = 'sent'
+                WHERE id IN ({placeholders})
+            """, ids)
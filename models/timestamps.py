@@ -0,0 +1,71 @@
+"""
+時間戳記工具
+- 資料庫以整數 epoch 毫秒儲存時間,範圍查詢可直接使用索引
+- 模型與 API 仍以 datetime / ISO 8601 表示
+"""
+from datetime import datetime, timezone
+from typing import Optional, Union
+
+# SQLite 中取得目前 epoch 毫秒的表達式 (不依賴 3.38 之後才有的 unixepoch())
+NOW_MS_SQL = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+
+
+def now_ms() -> int:
+    """目前時間的 epoch 毫秒"""
+    return int(datetime.now().timestamp() * 1000)
+
+
+def to_epoch_ms(value: Optional[datetime]) -> Optional[int]:
+    """
+    將 datetime 轉為 epoch 毫秒
+
+    Args:
+        value: datetime (無時區時視為本地時間)
+
+    Returns:
+        epoch 毫秒,None 時返回 None
+    """
+    if value is None:
+        return None
+    return int(value.timestamp() * 1000)
+
+
+def from_epoch_ms(value: Union[int, float, str, None]) -> Optional[datetime]:
+    """
+    將資料庫中的 epoch 毫秒轉為本地時間 datetime
+
+    Args:
+        value: epoch 毫秒 (尚未遷移的封存檔可能仍為 ISO 字串)
+
+    Returns:
+        datetime,None 時返回 None
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return datetime.fromtimestamp(value / 1000)
+
+
+def iso_to_epoch_ms(value: Union[int, float, str, None]) -> Union[int, str, None]:
+    """
+    將舊格式的時間字串轉為 epoch 毫秒 (供遷移使用的 SQL 函數)
+
+    Python 寫入的 isoformat() 為本地時間 ('T' 分隔);
+    SQLite CURRENT_TIMESTAMP 預設值為 UTC ('YYYY-MM-DD HH:MM:SS')。
+
+    Args:
+        value: 欄位值
+
+    Returns:
+        epoch 毫秒;已是數字時原樣返回,無法解析時返回原字串
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if parsed.tzinfo is None and 'T' not in value:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
@@ -1,15 +1,34 @@
 """使用者資料模型"""
-import json
 from datetime import datetime
-from typing import Optional, List, Dict, Any
-from .database import get_db
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+from .database import run_in_db
+from .known_users import get_known_users
+from .pagination import encode_cursor, decode_cursor
+from .rows import UNSET, decode_metadata, encode_metadata, isoformat_ms
+from .storage import get_storage
+from .timestamps import now_ms, to_epoch_ms, from_epoch_ms
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 
 class User:
-    """使用者類"""
+    """
+    使用者類
+
+    以 __slots__ 儲存欄位;從資料庫載入時保留 metadata 的 JSON 文字與
+    時間欄位的 epoch 毫秒,第一次存取時才解碼。同時記錄已儲存的欄位值,
+    save() 只更新有變動的欄位。
+    """
+
+    __slots__ = (
+        'user_id', 'platform', 'display_name', 'is_active',
+        '_created_at', '_created_at_ms', '_updated_at', '_updated_at_ms', '_metadata', '_metadata_json',
+        '_stored',
+    )
+
+    # save() 比對是否變動的欄位 (updated_at 隨任何變動一併更新)
+    TRACKED_COLUMNS = ('platform', 'display_name', 'is_active', 'metadata')
 
     def __init__(
         self,
@@ -28,38 +47,97 @@ class User:
         self.updated_at = updated_at or datetime.now()
         self.is_active = is_active
         self.metadata = metadata or {}
+        # 尚未確認資料庫中的值 (新物件)
+        self._stored: Optional[Dict[str, Any]] = None
 
     @classmethod
     def from_db_row(cls, row) -> 'User':
-        """從資料庫行建立使用者物件"""
-        metadata = json.loads(row['metadata']) if row['metadata'] else {}
-        return cls(
-            user_id=row['user_id'],
-            platform=row['platform'],
-            display_name=row['display_name'],
-            created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None,
-            updated_at=datetime.fromisoformat(row['updated_at']) if row['updated_at'] else None,
-            is_active=bool(row['is_active']),
-            metadata=metadata
-        )
+        """從資料庫行建立使用者物件 (metadata 與時間欄位延後解碼)"""
+        user = cls.__new__(cls)
+        user.user_id = row['user_id']
+        user.platform = row['platform']
+        user.display_name = row['display_name']
+        user.is_active = bool(row['is_active'])
+        user._created_at = UNSET
+        user._created_at_ms = row['created_at']
+        user._updated_at = UNSET
+        user._updated_at_ms = row['updated_at']
+        user._metadata = UNSET
+        user._metadata_json = row['metadata']
+        user._stored = {
+            'platform': user.platform,
+            'display_name': user.display_name,
+            'is_active': user.is_active,
+            'metadata': row['metadata'] or '{}',
+        }
+        return user
+
+    @property
+    def created_at(self) -> Optional[datetime]:
+        """建立時間 (第一次存取時解碼)"""
+        if self._created_at is UNSET:
+            self._created_at = from_epoch_ms(self._created_at_ms)
+        return self._created_at
+
+    @created_at.setter
+    def created_at(self, value: Optional[datetime]):
+        self._created_at = value
+        self._created_at_ms = to_epoch_ms(value)
+
+    @property
+    def updated_at(self) -> Optional[datetime]:
+        """更新時間 (第一次存取時解碼)"""
+        if self._updated_at is UNSET:
+            self._updated_at = from_epoch_ms(self._updated_at_ms)
+        return self._updated_at
+
+    @updated_at.setter
+    def updated_at(self, value: Optional[datetime]):
+        self._updated_at = value
+        self._updated_at_ms = to_epoch_ms(value)
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """附加資料 (第一次存取時解碼;之後對字典的修改會在 save() 時寫回)"""
+        if self._metadata is UNSET:
+            self._metadata = decode_metadata(self._metadata_json)
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value: Optional[Dict[str, Any]]):
+        self._metadata = value or {}
+        self._metadata_json = UNSET
 
     def save(self):
-        """儲存使用者到資料庫"""
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                INSERT OR REPLACE INTO users
-                (user_id, platform, display_name, created_at, updated_at, is_active, metadata)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                self.user_id,
-                self.platform,
-                self.display_name,
-                self.created_at.isoformat(),
-                datetime.now().isoformat(),
-                self.is_active,
-                json.dumps(self.metadata, ensure_ascii=False)
-            ))
+        """
+        儲存使用者到資料庫 (metadata 未解碼時直接沿用原始 JSON)
+
+        從資料庫載入的使用者只更新有變動的欄位,沒有變動時不寫入;
+        已存在的使用者保留原本的 created_at。
+        """
+        row = {
+            'user_id': self.user_id,
+            'platform': self.platform,
+            'display_name': self.display_name,
+            'created_at': to_epoch_ms(self.created_at) if isinstance(self._created_at_ms, str) else self._created_at_ms,
+            'updated_at': now_ms(),
+            'is_active': bool(self.is_active),
+            'metadata': (self._metadata_json or '{}') if self._metadata is UNSET else encode_metadata(self._metadata)
+        }
+        columns = None
+        if self._stored is not None:
+            changed = [column for column in self.TRACKED_COLUMNS if row[column] != self._stored[column]]
+            if not changed:
+                logger.debug(f"使用者沒有變動,略過儲存: {self.user_id}")
+                return
+            columns = changed + ['updated_at']
+
+        get_storage().save_user(row, columns)
+        self._stored = {column: row[column] for column in self.TRACKED_COLUMNS}
+        self.updated_at = from_epoch_ms(row['updated_at'])
+        known_users = get_known_users()
+        if known_users is not None:
+            known_users.add(self.user_id, self.platform)
         logger.debug(f"儲存使用者: {self.user_id} ({self.platform})")
 
     def update(self, **kwargs):
@@ -88,14 +166,8 @@ class User:
         Returns:
             User 物件或 None
         """
-        db = get_db()
-        with db.get_cursor() as cursor:
-            cursor.execute("""
-                SELECT * FROM users
-                WHERE user_id = ? AND platform = ?
-            """, (user_id, platform))
-            row = cursor.fetchone()
-            return cls.from_db_row(row) if row else None
+        row = get_storage().get_user(user_id, platform)
+        return cls.from_db_row(row) if row else None
 
     @classmethod
     def get_or_create(cls, user_id: str, platform: str, **kwargs) -> 'User':
@@ -115,8 +187,31 @@ class User:
             user = cls(user_id=user_id, platform=platform, **kwargs)
             user.save()
             logger.info(f"建立新使用者: {user_id} ({platform})")
+        else:
+            known_users = get_known_users()
+            if known_users is not None:
+                known_users.add(user_id, platform)
         return user
 
+    @classmethod
+    def ensure(cls, user_id: str, platform: str):
+        """
+        確保使用者存在 (不需要 User 物件時使用,取代 get_or_create)
+
+        已知使用者快取命中時不存取資料庫;否則以 INSERT OR IGNORE 建立,
+        不需先查詢,也不會覆寫既有資料。
+
+        Args:
+            user_id: 使用者 ID
+            platform: 平台名稱
+        """
+        known_users = get_known_users()
+        if known_users is not None and known_users.contains(user_id, platform):
+            return
+        get_storage().ensure_user(user_id, platform, now_ms())
+        if known_users is not None:
+            known_users.add(user_id, platform)
+
     @classmethod
     def get_all(cls, platform: Optional[str] = None, is_active: bool = True) -> List['User']:
         """
@@ -129,22 +224,77 @@ class User:
         Returns:
             使用者列表
         """
-        db = get_db()
-        with db.get_cursor() as cursor:
-            if platform:
-                cursor.execute("""
-                    SELECT * FROM users
-                    WHERE platform = ? AND is_active = ?
-                    ORDER BY created_at DESC
-                """, (platform, is_active))
-            else:
-                cursor.execute("""
-                    SELECT * FROM users
-                    WHERE is_active = ?
-                    ORDER BY created_at DESC
-                """, (is_active,))
-
-            return [cls.from_db_row(row) for row in cursor.fetchall()]
+        return [cls.from_db_row(row) for row in get_storage().list_users(platform, is_active)]
+
+    @classmethod
+    def paginate(
+        cls,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        platform: Optional[str] = None,
+        is_active: bool = True
+    ) -> Tuple[List['User'], Optional[str]]:
+        """
+        以游標分頁獲取使用者 (新到舊)
+
+        以 (created_at, 排序鍵) 作為鍵集,只讀取當頁的資料列。
+
+        Args:
+            limit: 每頁數量
+            cursor: 上一頁返回的游標 (None 表示第一頁)
+            platform: 篩選平台 (None 表示所有平台)
+            is_active: 只獲取活躍使用者
+
+        Returns:
+            (使用者列表, 下一頁游標或 None)
+
+        Raises:
+            ValueError: 游標格式錯誤
+        """
+        after = decode_cursor(cursor, 2) if cursor else None
+        rows = get_storage().paginate_users(limit + 1, after, platform, is_active)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['row_key'])
+        return [cls.from_db_row(row) for row in rows], next_cursor
+
+    @classmethod
+    def iter_dicts(
+        cls,
+        platform: Optional[str] = None,
+        is_active: bool = True,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        逐筆產生使用者字典 (匯出用,順序與 paginate 相同)
+
+        由儲存後端逐批讀取並直接以 row_to_dict 轉換,不建立 User 物件。
+        須在同一執行緒內迭代完畢或關閉。
+
+        Args:
+            platform: 篩選平台
+            is_active: True 匯出活躍使用者, False 匯出停用使用者
+            since: 建立時間起點 (含)
+            until: 建立時間終點 (不含)
+
+        Yields:
+            to_dict() 格式的字典
+        """
+        rows = get_storage().iter_users(
+            platform=platform,
+            is_active=is_active,
+            since=to_epoch_ms(since),
+            until=to_epoch_ms(until)
+        )
+        try:
+            for row in rows:
+                yield cls.row_to_dict(row)
+        finally:
+            # 提前結束 (例如用戶端中斷下載) 時立即歸還連接
+            rows.close()
 
     @classmethod
     def count(cls, platform: Optional[str] = None, is_active: bool = True) -> int:
@@ -153,37 +303,93 @@ class User:
 
         Args:
             platform: 篩選平台
-            is_active: 只統計活躍使用者
+            is_active: True 統計活躍使用者, False 統計停用使用者
 
         Returns:
             使用者數量
         """
-        db = get_db()
-        with db.get_cursor() as cursor:
-            if platform:
-                cursor.execute("""
-                    SELECT COUNT(*) FROM users
-                    WHERE platform = ? AND is_active = ?
-                """, (platform, is_active))
-            else:
-                cursor.execute("""
-                    SELECT COUNT(*) FROM users
-                    WHERE is_active = ?
-                """, (is_active,))
-
-            return cursor.fetchone()[0]
+        return get_storage().count_users(platform, is_active)
+
+    # ==================== 非同步介面 ====================
+    # 於資料庫執行緒池執行,供事件迴圈中的協程使用
+
+    async def asave(self):
+        """非同步儲存使用者"""
+        await run_in_db(self.save)
+
+    async def aupdate(self, **kwargs):
+        """非同步更新使用者資料"""
+        await run_in_db(self.update, **kwargs)
+
+    @classmethod
+    async def aget_by_id(cls, user_id: str, platform: str) -> Optional['User']:
+        """非同步根據 ID 和平台獲取使用者"""
+        return await run_in_db(cls.get_by_id, user_id, platform)
+
+    @classmethod
+    async def aget_or_create(cls, user_id: str, platform: str, **kwargs) -> 'User':
+        """非同步獲取或建立使用者"""
+        return await run_in_db(cls.get_or_create, user_id, platform, **kwargs)
+
+    @classmethod
+    async def aensure(cls, user_id: str, platform: str):
+        """非同步確保使用者存在"""
+        known_users = get_known_users()
+        if known_users is not None and known_users.contains(user_id, platform):
+            # 快取命中時不需切換到資料庫執行緒
+            return
+        await run_in_db(cls.ensure, user_id, platform)
+
+    @classmethod
+    async def aget_all(cls, platform: Optional[str] = None, is_active: bool = True) -> List['User']:
+        """非同步獲取所有使用者"""
+        return await run_in_db(cls.get_all, platform, is_active)
+
+    @classmethod
+    async def apaginate(cls, limit: int = 50, cursor: Optional[str] = None, **filters) -> Tuple[List['User'], Optional[str]]:
+        """非同步以游標分頁獲取使用者"""
+        return await run_in_db(cls.paginate, limit, cursor, **filters)
+
+    @classmethod
+    async def acount(cls, platform: Optional[str] = None, is_active: bool = True) -> int:
+        """非同步統計使用者數量"""
+        return await run_in_db(cls.count, platform, is_active)
 
     def to_dict(self) -> Dict[str, Any]:
-        """轉換為字典"""
+        """轉換為字典 (時間欄位尚未解碼時直接由 epoch 毫秒格式化,不快取 datetime)"""
+        created_at, updated_at = self._created_at, self._updated_at
         return {
             'user_id': self.user_id,
             'platform': self.platform,
             'display_name': self.display_name,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'created_at': isoformat_ms(self._created_at_ms) if created_at is UNSET
+            else created_at.isoformat() if created_at else None,
+            'updated_at': isoformat_ms(self._updated_at_ms) if updated_at is UNSET
+            else updated_at.isoformat() if updated_at else None,
             'is_active': self.is_active,
             'metadata': self.metadata
         }
 
+    @staticmethod
+    def row_to_dict(row) -> Dict[str, Any]:
+        """
+        直接將資料庫行轉為 to_dict() 的格式,不建立 User 物件
+
+        Args:
+            row: 儲存後端返回的資料列
+
+        Returns:
+            與 User.from_db_row(row).to_dict() 相同的字典
+        """
+        return {
+            'user_id': row['user_id'],
+            'platform': row['platform'],
+            'display_name': row['display_name'],
+            'created_at': isoformat_ms(row['created_at']),
+            'updated_at': isoformat_ms(row['updated_at']),
+            'is_active': bool(row['is_active']),
+            'metadata': decode_metadata(row['metadata'])
+        }
+
     def __repr__(self):
         return f"<User {self.user_id}@{self.platform}>"
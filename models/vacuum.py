@@ -0,0 +1,217 @@
+"""
+空間回收排程模組
+- 於離峰時段以 incremental_vacuum 分批回收空閒頁面
+- 每次只回收少量頁面,寫入鎖持有時間短,不影響訊息傳遞
+- 既有資料庫切換為增量 auto-vacuum 需明確執行: python -m models.vacuum --enable-incremental
+"""
+import argparse
+import json
+import sys
+import threading
+from datetime import datetime
+from typing import Optional, Tuple, Dict, Any, List
+from .database import Database, get_db
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def parse_quiet_hours(value: str) -> Optional[Tuple[int, int]]:
+    """
+    解析離峰時段設定
+
+    Args:
+        value: 'start-end' (小時,可跨午夜,例如 '22-6');空字串表示不限時段
+
+    Returns:
+        (start, end) 或 None
+
+    Raises:
+        ValueError: 格式錯誤
+    """
+    value = value.strip()
+    if not value:
+        return None
+    start, end = (int(part) for part in value.split('-'))
+    if not (0 <= start <= 23 and 0 <= end <= 24):
+        raise ValueError(f"無效的離峰時段: {value}")
+    return start, end
+
+
+class VacuumScheduler:
+    """空間回收排程"""
+
+    def __init__(
+        self,
+        db: Database,
+        pages_per_tick: int = 200,
+        interval_seconds: float = 60.0,
+        quiet_hours: Optional[Tuple[int, int]] = (2, 6)
+    ):
+        """
+        初始化空間回收排程
+
+        Args:
+            db: 資料庫實例
+            pages_per_tick: 每次回收的頁面上限
+            interval_seconds: 執行間隔 (秒)
+            quiet_hours: 只在此時段 (本地時間) 回收,None 表示不限
+        """
+        self.db = db
+        self.pages_per_tick = max(1, pages_per_tick)
+        self.interval_seconds = interval_seconds
+        self.quiet_hours = quiet_hours
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats: Dict[str, Any] = {
+            'ticks': 0,
+            'pages_reclaimed': 0,
+            'last_run': None,
+            'incremental': None,
+        }
+
+    def in_quiet_hours(self, now: Optional[datetime] = None) -> bool:
+        """
+        檢查目前是否在離峰時段
+
+        Args:
+            now: 檢查的時間 (預設為目前時間)
+
+        Returns:
+            是否可以執行回收
+        """
+        if self.quiet_hours is None:
+            return True
+        hour = (now or datetime.now()).hour
+        start, end = self.quiet_hours
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def tick(self) -> int:
+        """
+        執行一次回收
+
+        Returns:
+            回收的頁面數
+        """
+        if not self.in_quiet_hours():
+            return 0
+        enabled = self.db.incremental_vacuum_enabled()
+        if not enabled:
+            if self._stats['incremental'] is not False:
+                logger.warning(
+                    "資料庫尚未啟用增量 auto-vacuum,無法回收頁面;"
+                    "請於離峰時段執行 python -m models.vacuum --enable-incremental"
+                )
+            self._stats['incremental'] = False
+            return 0
+        self._stats['incremental'] = True
+        freed = self.db.incremental_vacuum(self.pages_per_tick)
+        self._stats['ticks'] += 1
+        self._stats['pages_reclaimed'] += freed
+        self._stats['last_run'] = datetime.now().isoformat()
+        return freed
+
+    def start(self):
+        """啟動背景回收排程"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop_event.wait(self.interval_seconds):
+                try:
+                    self.tick()
+                except Exception as e:
+                    logger.exception(f"空間回收失敗: {e}")
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=run, daemon=True, name="VacuumScheduler")
+        self._thread.start()
+        hours = f"{self.quiet_hours[0]}-{self.quiet_hours[1]} 時" if self.quiet_hours else "不限時段"
+        logger.info(f"空間回收排程已啟動 (每 {self.interval_seconds} 秒最多 {self.pages_per_tick} 頁, {hours})")
+
+    def stop(self):
+        """停止背景回收排程"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取回收統計資訊
+
+        Returns:
+            統計資訊字典
+        """
+        return dict(self._stats)
+
+
+# 全域回收排程 (未設定時為 None)
+_scheduler: Optional[VacuumScheduler] = None
+
+
+def start_vacuum_scheduler(db: Optional[Database] = None, **kwargs) -> VacuumScheduler:
+    """
+    啟動全域空間回收排程
+
+    Args:
+        db: 資料庫實例 (預設使用全域實例)
+        **kwargs: 傳給 VacuumScheduler 的參數
+
+    Returns:
+        VacuumScheduler 實例
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = VacuumScheduler(db or get_db(), **kwargs)
+        _scheduler.start()
+    return _scheduler
+
+
+def get_vacuum_scheduler() -> Optional[VacuumScheduler]:
+    """獲取全域空間回收排程,未啟動時返回 None"""
+    return _scheduler
+
+
+def stop_vacuum_scheduler():
+    """停止全域空間回收排程"""
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令列入口: 切換增量 auto-vacuum 或回收空閒頁面,並輸出空間統計"""
+    parser = argparse.ArgumentParser(prog='python -m models.vacuum', description='資料庫空間回收')
+    parser.add_argument('--db', help='資料庫路徑 (預設使用 DATABASE_PATH)')
+    parser.add_argument(
+        '--enable-incremental', action='store_true',
+        help='將既有資料庫切換為增量 auto-vacuum (完整 VACUUM,執行期間持有獨佔鎖)'
+    )
+    parser.add_argument('--pages', type=int, help='回收的頁面上限 (0 表示全部)')
+    args = parser.parse_args(argv)
+
+    from config import config
+    from .database import close_db
+
+    db = get_db(args.db or config.DATABASE_PATH)
+    try:
+        result: Dict[str, Any] = {}
+        if args.enable_incremental:
+            result['converted'] = db.enable_incremental_vacuum()
+        if args.pages is not None:
+            if not db.incremental_vacuum_enabled():
+                parser.error('資料庫尚未啟用增量 auto-vacuum,請先執行 --enable-incremental')
+            result['pages_reclaimed'] = db.incremental_vacuum(args.pages)
+        result['space'] = db.get_space_stats()
+    finally:
+        close_db()
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
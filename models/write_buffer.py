@@ -0,0 +1,267 @@
+"""
+寫入緩衝模組 (write-behind)
+- 將訊息寫入暫存於記憶體
+- 依時間或筆數以單一交易批次提交 (group commit)
+- 關閉時確保全部寫入
+"""
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+from .database import Database, get_db
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class WriteBuffer:
+    """寫入緩衝區,以 executemany 批次提交佇列中的寫入"""
+
+    def __init__(
+        self,
+        db: Database,
+        flush_interval_ms: int = 200,
+        max_rows: int = 500,
+        max_queue: int = 20000,
+        max_retries: int = 5
+    ):
+        """
+        初始化寫入緩衝區
+
+        Args:
+            db: 資料庫實例
+            flush_interval_ms: 自動提交間隔 (毫秒)
+            max_rows: 累積多少筆時立即提交
+            max_queue: 佇列上限,超過時由呼叫端同步提交 (背壓);
+                達到兩倍時 (資料庫持續無法寫入) 捨棄新的寫入
+            max_retries: 資料庫鎖定時同一批次的重試次數,超過後捨棄
+        """
+        self.db = db
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_rows = max(1, max_rows)
+        self.max_queue = max(self.max_rows, max_queue)
+        self.max_pending = self.max_queue * 2
+        self.max_retries = max(0, max_retries)
+
+        self._pending: List[Tuple[str, tuple]] = []
+        # 連續重試次數與下次重試前的等待期限 (monotonic)
+        self._retries = 0
+        self._retry_at = 0.0
+        self._overflowing = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._stats: Dict[str, Any] = {
+            'flushes': 0,
+            'rows_flushed': 0,
+            'failed_rows': 0,
+            'retries': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def start(self):
+        """啟動背景提交執行緒"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="DBWriteBuffer")
+        self._thread.start()
+        logger.info(
+            f"寫入緩衝已啟動 (間隔 {int(self.flush_interval * 1000)} ms, 批次 {self.max_rows} 筆)"
+        )
+
+    def stop(self):
+        """停止背景執行緒並提交所有剩餘寫入"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+        logger.info("寫入緩衝已停止")
+
+    def enqueue(self, sql: str, params: tuple):
+        """
+        加入一筆待寫入的語句
+
+        同一批次中的語句依首次出現的順序分組執行,
+        因此相依的寫入 (例如使用者) 需先加入。
+
+        Args:
+            sql: SQL 語句
+            params: 參數
+        """
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                # 資料庫持續無法寫入: 捨棄新的寫入,避免佇列無限增長
+                self._stats['failed_rows'] += 1
+                first_overflow, self._overflowing = not self._overflowing, True
+                depth = None
+            else:
+                self._pending.append((sql, params))
+                depth = len(self._pending)
+
+        if depth is None:
+            if first_overflow:
+                logger.error(f"寫入佇列已達上限 ({self.max_pending} 筆),捨棄新的寫入直到資料庫恢復")
+            return
+        if depth >= self.max_queue and time.monotonic() >= self._retry_at:
+            # 背景執行緒跟不上時由呼叫端同步提交 (等待重試期間不提交,避免呼叫端反覆等待鎖)
+            self.flush()
+        elif depth >= self.max_rows:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        立即提交佇列中的所有寫入
+
+        Returns:
+            提交的筆數
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+
+            # 依 SQL 分組,保留首次出現的順序
+            grouped: Dict[str, List[tuple]] = {}
+            for sql, params in batch:
+                grouped.setdefault(sql, []).append(params)
+
+            start = time.perf_counter()
+            try:
+                with self.db.get_cursor() as cursor:
+                    for sql, rows in grouped.items():
+                        cursor.executemany(sql, rows)
+            except sqlite3.OperationalError as e:
+                if self._is_busy(e) and self._retries < self.max_retries:
+                    self._requeue(batch, e)
+                else:
+                    self._drop(batch, e)
+                return 0
+            except Exception as e:
+                self._drop(batch, e)
+                return 0
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._retries = 0
+            self._retry_at = 0.0
+            with self._lock:
+                self._overflowing = False
+                self._stats['flushes'] += 1
+                self._stats['rows_flushed'] += len(batch)
+                self._stats['last_flush_ms'] = elapsed_ms
+                self._stats['total_flush_ms'] += elapsed_ms
+                self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], elapsed_ms)
+
+            logger.debug(f"批次寫入 {len(batch)} 筆 ({elapsed_ms:.1f} ms)")
+            return len(batch)
+
+    @staticmethod
+    def _is_busy(error: sqlite3.OperationalError) -> bool:
+        """是否為暫時性的鎖定錯誤 (其他 OperationalError 例如磁碟已滿、唯讀資料庫重試也不會成功)"""
+        message = str(error).lower()
+        return 'locked' in message or 'busy' in message
+
+    def _requeue(self, batch: List[Tuple[str, tuple]], error: Exception):
+        """資料庫鎖定: 放回佇列,以指數退避延後下次提交 (須持有 _flush_lock)"""
+        self._retries += 1
+        self._retry_at = time.monotonic() + self.flush_interval * (2 ** self._retries)
+        logger.warning(
+            f"資料庫鎖定,批次寫入稍後重試 ({len(batch)} 筆,第 {self._retries}/{self.max_retries} 次): {error}"
+        )
+        with self._lock:
+            pending = batch + self._pending
+            overflow = len(pending) - self.max_pending
+            if overflow > 0:
+                # 放回後超過上限時捨棄最新的寫入
+                pending = pending[:self.max_pending]
+                self._stats['failed_rows'] += overflow
+            self._pending = pending
+            self._stats['retries'] += 1
+
+    def _drop(self, batch: List[Tuple[str, tuple]], error: Exception):
+        """無法寫入的批次: 捨棄並計入 failed_rows (須持有 _flush_lock)"""
+        logger.error(f"批次寫入失敗,捨棄 {len(batch)} 筆: {error}")
+        self._retries = 0
+        self._retry_at = 0.0
+        with self._lock:
+            self._stats['failed_rows'] += len(batch)
+
+    def _run(self):
+        """背景提交迴圈"""
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if time.monotonic() < self._retry_at:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception(f"寫入緩衝提交時發生錯誤: {e}")
+
+    @property
+    def queue_depth(self) -> int:
+        """佇列中尚未提交的筆數"""
+        with self._lock:
+            return len(self._pending)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取寫入緩衝統計資訊
+
+        Returns:
+            統計資訊字典
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queue_depth'] = len(self._pending)
+        flushes = stats['flushes']
+        stats['avg_flush_ms'] = round(stats.pop('total_flush_ms') / flushes, 2) if flushes else 0.0
+        stats['last_flush_ms'] = round(stats['last_flush_ms'], 2)
+        stats['max_flush_ms'] = round(stats['max_flush_ms'], 2)
+        return stats
+
+
+# 全域寫入緩衝 (預設停用)
+_buffer: Optional[WriteBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def enable_write_buffer(db: Optional[Database] = None, **kwargs) -> WriteBuffer:
+    """
+    啟用訊息寫入緩衝
+
+    Args:
+        db: 資料庫實例 (預設使用全域實例)
+        **kwargs: 傳給 WriteBuffer 的參數
+
+    Returns:
+        WriteBuffer 實例
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = WriteBuffer(db or get_db(), **kwargs)
+            _buffer.start()
+    return _buffer
+
+
+def get_write_buffer() -> Optional[WriteBuffer]:
+    """獲取目前啟用的寫入緩衝,未啟用時返回 None"""
+    return _buffer
+
+
+def disable_write_buffer():
+    """停用寫入緩衝並提交所有剩餘寫入"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            _buffer.stop()
+            _buffer = None
@@ -10,6 +10,7 @@ from linebot.v3.messaging import TextMessage, ImageMessage, VideoMessage, AudioM
 from services.media_handler import MediaHandler
 from models.message import Message
 from models.user import User
+from models.write_buffer import get_write_buffer
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -173,11 +174,12 @@ class MessageProcessor:
             metadata: 元數據
         """
         try:
-            # 確保使用者存在
-            User.get_or_create(user_id=user_id, platform=platform)
+            # 確保使用者存在 (已知使用者不存取資料庫;寫入緩衝模式下由批次提交一併處理)
+            if get_write_buffer() is None:
+                await User.aensure(user_id=user_id, platform=platform)
 
             # 儲存訊息
-            Message(
+            await Message(
                 message_id=message_id,
                 user_id=user_id,
                 platform=platform,
@@ -185,7 +187,7 @@ class MessageProcessor:
                 message_type=message_type,
                 group_id=group_id,
                 metadata=metadata
-            ).save()
+            ).asave()
 
             logger.debug(f"儲存訊息到資料庫: {message_id}")
 
@@ -0,0 +1 @@
+"""測試模組"""
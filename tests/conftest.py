@@ -0,0 +1,36 @@
+"""
+測試共用設定
+- storage: 依序以 memory、dbapi (sqlite3) 與 SQLite 後端執行同一組模型測試
+"""
+import pytest
+from models.database import Database
+from models.known_users import configure_known_users
+from models.recent import get_recent_buffer
+from models.quota_engine import get_quota_engine
+from models.write_buffer import get_write_buffer
+from models.storage import SQLiteStorage, create_storage, configure_storage, reset_storage
+
+
+@pytest.fixture(params=['memory', 'dbapi', 'sqlite'])
+def storage(request, tmp_path):
+    """設定為全域儲存後端的後端實例,測試結束後恢復預設"""
+    # 行程內快取會跨越測試,只測試後端本身
+    configure_known_users(max_entries=0)
+    assert get_recent_buffer() is None
+    assert get_quota_engine() is None
+    assert get_write_buffer() is None
+
+    db = None
+    if request.param == 'memory':
+        backend = create_storage('memory')
+    elif request.param == 'dbapi':
+        backend = create_storage('dbapi', 'sqlite3', str(tmp_path / 'dbapi.db'))
+    else:
+        db = Database(str(tmp_path / 'bot.db'))
+        backend = SQLiteStorage(db)
+
+    configure_storage(backend)
+    yield backend
+    reset_storage()
+    if db is not None:
+        db.close()
@@ -0,0 +1,178 @@
+"""
+儲存後端一致性測試
+- 同一組模型操作在 memory、dbapi (sqlite3) 與 SQLite 後端的結果必須相同
+"""
+from datetime import datetime, timedelta
+from models.user import User
+from models.message import Message
+from models.quota import Quota, SystemQuota
+from models.database import DEFAULT_SYSTEM_QUOTAS
+
+BASE_TIME = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def save_messages(contents, group_id='g1', user_id='u1', platform='line'):
+    """依序儲存訊息 (每則間隔一分鐘),返回 message_id 列表"""
+    User.ensure(user_id, platform)
+    message_ids = []
+    for index, content in enumerate(contents):
+        message_id = f'{group_id}-{index}'
+        Message(
+            message_id=message_id,
+            user_id=user_id,
+            platform=platform,
+            content=content,
+            group_id=group_id,
+            created_at=BASE_TIME + timedelta(minutes=index)
+        ).save()
+        message_ids.append(message_id)
+    return message_ids
+
+
+# ==================== 使用者 ====================
+
+def test_user_get_or_create_and_upsert(storage):
+    user = User.get_or_create('u1', 'line', display_name='Alice')
+    created_at = User.get_by_id('u1', 'line').created_at
+
+    again = User.get_or_create('u1', 'line', display_name='Ignored')
+    assert again.display_name == 'Alice'
+    assert User.count(platform='line') == 1
+
+    user.display_name = 'Alice Chen'
+    user.metadata = {'lang': 'zh-TW'}
+    user.save()
+
+    stored = User.get_by_id('u1', 'line')
+    assert stored.display_name == 'Alice Chen'
+    assert stored.metadata == {'lang': 'zh-TW'}
+    assert stored.created_at == created_at
+    assert User.count(platform='line') == 1
+
+
+def test_user_ensure_does_not_overwrite(storage):
+    User.get_or_create('u1', 'discord', display_name='Bob')
+    User.ensure('u1', 'discord')
+    User.ensure('u2', 'discord')
+
+    assert User.get_by_id('u1', 'discord').display_name == 'Bob'
+    assert User.get_by_id('u2', 'discord') is not None
+    assert User.count(platform='discord') == 2
+
+
+def test_user_soft_delete(storage):
+    User.get_or_create('u1', 'line').delete()
+
+    assert User.count(platform='line') == 0
+    assert User.count(platform='line', is_active=False) == 1
+
+
+# ==================== 訊息 ====================
+
+def test_message_save_and_get(storage):
+    save_messages(['hello world'])
+
+    message = Message.get_by_id('g1-0')
+    assert message.content == 'hello world'
+    assert message.group_id == 'g1'
+    assert message.created_at == BASE_TIME
+    assert Message.count_by_user('u1') == 1
+    assert Message.count_by_platform('line') == 1
+
+
+def test_message_paginate_newest_first(storage):
+    message_ids = save_messages([f'message {index}' for index in range(5)])
+
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        messages, cursor = Message.paginate(limit=2, cursor=cursor, group_id='g1')
+        seen.extend(message.message_id for message in messages)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert seen == message_ids[::-1]
+
+
+def test_message_paginate_filters(storage):
+    save_messages(['line one', 'line two'], group_id='g1')
+    save_messages(['discord one'], group_id='g2', user_id='u2', platform='discord')
+
+    messages, _ = Message.paginate(limit=10, platform='discord')
+    assert [message.message_id for message in messages] == ['g2-0']
+
+    messages, _ = Message.paginate(limit=10, user_id='u1')
+    assert [message.message_id for message in messages] == ['g1-1', 'g1-0']
+
+
+def test_message_search(storage):
+    save_messages([
+        'hello world',
+        'goodbye world',
+        'hello again friend',
+        'nothing here',
+    ])
+
+    found = {message.message_id for message in Message.search('hello')}
+    assert found == {'g1-0', 'g1-2'}
+
+    found = {message.message_id for message in Message.search('hello world')}
+    assert found == {'g1-0'}
+
+    recent = Message.search('world', order='recent')
+    assert [message.message_id for message in recent] == ['g1-1', 'g1-0']
+
+    assert Message.search('missing') == []
+
+
+# ==================== 配額 ====================
+
+def test_quota_increment_respects_limit(storage):
+    User.ensure('u1', 'line')
+    quota = Quota.get_or_create('u1', 'ai_daily', limit_count=3, reset_period='daily')
+
+    assert [quota.increment() for _ in range(4)] == [True, True, True, False]
+    assert not quota.can_use()
+
+    stored = Quota.get_or_create('u1', 'ai_daily', limit_count=3, reset_period='daily')
+    assert stored.usage_count == 3
+    assert stored.get_remaining() == 0
+    assert not stored.increment()
+
+    quotas = Quota.get_user_quotas('u1')
+    assert [(quota.quota_type, quota.usage_count, quota.limit_count) for quota in quotas] == [('ai_daily', 3, 3)]
+
+
+def test_quota_reservation(storage):
+    User.ensure('u1', 'line')
+    quota = Quota.get_or_create('u1', 'ai_daily', limit_count=1, reset_period='daily')
+
+    slot = quota.reserve()
+    assert slot is not None
+    slot.release()
+    assert Quota.get_or_create('u1', 'ai_daily', limit_count=1).usage_count == 0
+
+    slot = quota.reserve()
+    slot.commit()
+    assert Quota.get_or_create('u1', 'ai_daily', limit_count=1).usage_count == 1
+    assert quota.reserve() is None
+
+
+def test_system_quota_rows(storage):
+    quotas = {quota['quota_type']: quota for quota in SystemQuota.get_all()}
+    assert set(quotas) == {quota_type for quota_type, _, _ in DEFAULT_SYSTEM_QUOTAS}
+    for quota_type, limit_count, reset_period in DEFAULT_SYSTEM_QUOTAS:
+        assert quotas[quota_type]['limit_count'] == limit_count
+        assert quotas[quota_type]['reset_period'] == reset_period
+        assert quotas[quota_type]['usage_count'] == 0
+
+    assert SystemQuota.increment_usage('line_monthly')
+    assert SystemQuota.increment_usage('line_monthly', 2)
+    assert SystemQuota.get_quota('line_monthly')['usage_count'] == 3
+    assert SystemQuota.can_use('line_monthly')
+
+    assert SystemQuota.get_quota('missing') is None
+    assert not SystemQuota.increment_usage('missing')
@@ -0,0 +1,154 @@
+"""
+滑動視窗速率限制
+- 任意 window 秒內最多放行 limit 個請求 (不受固定視窗邊界影響)
+- acquire 會等待空出的名額,超過等待上限才放棄
+- 記錄等待時間分佈
+"""
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from collections import deque
+from typing import Optional, Dict, Any
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 等待時間分佈的區間上限 (毫秒)
+WAIT_BUCKETS_MS = (0, 100, 500, 1000, 5000, 10000, 30000)
+
+
+class SlidingWindowLimiter:
+    """
+    滑動日誌速率限制器
+
+    只保留最近 limit 次放行的時間點: 第 limit 新的放行時間加上 window 即為下一個名額空出的時間,
+    因此任意長度為 window 的區間內放行數都不超過 limit。名額在 acquire 時即依序排定,
+    等待中的請求不會被後來的請求插隊。狀態以執行緒鎖保護,可在不同執行緒的事件迴圈中共用
+    (例如 Webhook 每次以 asyncio.run 執行的請求)。
+    """
+
+    def __init__(self, limit: int, window_seconds: float = 60.0, name: str = 'limiter'):
+        """
+        初始化速率限制器
+
+        Args:
+            limit: 每個視窗放行的請求數
+            window_seconds: 視窗長度 (秒)
+            name: 名稱 (用於日誌)
+        """
+        self.limit = max(1, limit)
+        self.window = window_seconds
+        self.name = name
+        self._grants: deque = deque(maxlen=self.limit)
+        self._lock = threading.Lock()
+
+        self._acquired = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    # ==================== 名額 ====================
+
+    def _reserve(self, timeout: Optional[float]) -> Optional[float]:
+        """排定下一個名額,返回需等待的秒數;等待時間超過 timeout 時不排定並返回 None"""
+        with self._lock:
+            now = time.monotonic()
+            grant_at = now
+            if len(self._grants) == self.limit:
+                grant_at = max(now, self._grants[0] + self.window)
+            wait = grant_at - now
+
+            if timeout is not None and wait > timeout:
+                self._timeouts += 1
+                return None
+
+            self._grants.append(grant_at)
+            self._acquired += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+            self._histogram[bisect_left(WAIT_BUCKETS_MS, wait * 1000)] += 1
+            return wait
+
+    def try_acquire(self) -> bool:
+        """
+        不等待地取得名額
+
+        Returns:
+            是否取得名額
+        """
+        return self._reserve(0) is not None
+
+    async def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        取得名額,必要時等待到名額空出
+
+        需等待的時間在呼叫時即可算出: 超過 timeout 時立即返回 False,不佔用名額。
+        等待中被取消時名額不歸還 (保守計算,不會超出限制)。
+
+        Args:
+            timeout: 最長等待秒數 (None 表示不限)
+
+        Returns:
+            是否取得名額
+        """
+        wait = self._reserve(timeout)
+        if wait is None:
+            logger.warning(f"{self.name} 速率限制: 等待時間超過 {timeout} 秒")
+            return False
+        if wait > 0:
+            logger.debug(f"{self.name} 速率限制: 等待 {wait:.2f} 秒")
+            await asyncio.sleep(wait)
+        return True
+
+    # ==================== 統計 ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取速率限制統計
+
+        Returns:
+            放行數、逾時數、目前視窗內的放行數、平均與最長等待時間 (毫秒)、等待時間分佈
+        """
+        with self._lock:
+            now = time.monotonic()
+            in_window = sum(1 for grant_at in self._grants if now - self.window < grant_at <= now)
+            pending = sum(1 for grant_at in self._grants if grant_at > now)
+            labels = [f'<={bound}ms' for bound in WAIT_BUCKETS_MS] + [f'>{WAIT_BUCKETS_MS[-1]}ms']
+            return {
+                'limit': self.limit,
+                'window_seconds': self.window,
+                'in_window': in_window,
+                'waiting': pending,
+                'acquired': self._acquired,
+                'timeouts': self._timeouts,
+                'avg_wait_ms': round(self._total_wait / self._acquired * 1000, 1) if self._acquired else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 1),
+                'wait_histogram': dict(zip(labels, self._histogram)),
+            }
+
+
+# ==================== 全域實例 ====================
+
+_ai_limiter: Optional[SlidingWindowLimiter] = None
+
+
+def configure_ai_limiter(requests_per_minute: int) -> Optional[SlidingWindowLimiter]:
+    """
+    設定全域 AI 請求速率限制器
+
+    Args:
+        requests_per_minute: 每分鐘請求數 (0 表示停用)
+
+    Returns:
+        SlidingWindowLimiter 實例,停用時返回 None
+    """
+    global _ai_limiter
+    _ai_limiter = SlidingWindowLimiter(requests_per_minute, 60.0, 'Gemini') if requests_per_minute > 0 else None
+    return _ai_limiter
+
+
+def get_ai_limiter() -> Optional[SlidingWindowLimiter]:
+    """獲取全域 AI 請求速率限制器,未設定時返回 None"""
+    return _ai_limiter